@@ -0,0 +1,65 @@
+"""
+Measures the BM25 keyword index: build time, size on disk & query latency for rare, mixed & common terms.
+Run from the repository root:  python -m benchmarks.bench_lexical --chunks 20000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from functions.lexical_index import LexicalIndex
+
+
+def zipf_texts(count: int, words_per_chunk: int = 150, vocabulary: int = 30000, seed: int = 0) -> list[str]:
+    # Word frequencies in prose follow Zipf's law, so a handful of terms show up in almost every chunk
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"w{i}" for i in range(vocabulary)])
+    weights = 1 / np.arange(1, vocabulary + 1)
+    words = rng.choice(vocab, size=(count, words_per_chunk), p=weights / weights.sum())
+    return [" ".join(row) + f" TICKET-{i}" for i, row in enumerate(words)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    texts = zipf_texts(args.chunks)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "lexical.sqlite")
+        index = LexicalIndex(path)
+        started = time.perf_counter()
+        for start in range(0, args.chunks, 500):
+            end = min(start + 500, args.chunks)
+            index.upsert([f"chunk-{i}" for i in range(start, end)], texts[start:end], [{}] * (end - start))
+        index.flush()
+        print(f"Indexed {args.chunks} chunks in {time.perf_counter() - started:.1f}s, {os.path.getsize(path) / 1e6:.1f} MB on disk")
+
+        # A single-chunk update, like ingesting one edited note
+        started = time.perf_counter()
+        index.upsert(["chunk-0"], ["an edited chunk about TICKET-0"], [{}])
+        index.flush()
+        print(f"  incremental update: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        reader = LexicalIndex(path)
+        for label, query in [
+            ("exact id", f"status of TICKET-{args.chunks // 2}"),
+            ("rare terms", "w20000 w25000"),
+            ("mixed", "w5 and w15000"),
+            ("common terms", "w1 w2 w3"),
+        ]:
+            reader.search(query) # Warms the postings cache, like a running server
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                reader.search(query)
+                latencies.append(time.perf_counter() - started)
+            latencies = np.array(latencies) * 1000
+            print(f"  {label:>12}: p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measures the embedded local index: build time, open time, query latency & recall@k against a flat scan,
+for every quantization (float32 / int8 / binary codes + rescoring) & the memory a search has to scan.
+Run from the repository root:  python -m benchmarks.bench_local_index --chunks 20000 --dim 768
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from functions.local_index import LocalIndex, normalize_rows, QUANTIZATIONS
+
+
+def clustered_vectors(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    # Real note embeddings cluster by topic, uniform noise would make IVF look worse than it is
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(1, count // 100), dim))
+    return (topics[rng.integers(0, len(topics), count)] + 0.7 * rng.normal(size=(count, dim))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--rescore-factor", type=int, default=None, help="Candidates rescored per result with int8 / binary codes (default: per code type)")
+    args = parser.parse_args()
+
+    vectors = clustered_vectors(args.chunks, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] + 0.5 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    unit = normalize_rows(vectors)
+
+    runs = [(mode, ivf_min_rows, quantization) for mode, ivf_min_rows in [("flat", args.chunks + 1), ("ivf", 0)] for quantization in args.quantization]
+    for mode, ivf_min_rows, quantization in runs:
+        with tempfile.TemporaryDirectory() as path:
+            index = LocalIndex(path, ivf_min_rows=ivf_min_rows, quantization=quantization, rescore_factor=args.rescore_factor)
+            ids = [f"chunk-{i}" for i in range(args.chunks)]
+            for start in range(0, args.chunks, 1000):
+                end = start + 1000
+                index.upsert(ids[start:end], [""] * len(ids[start:end]), [{}] * len(ids[start:end]), vectors[start:end])
+            started = time.perf_counter()
+            index.flush()
+            build = time.perf_counter() - started
+            index.close()
+
+            started = time.perf_counter()
+            reader = LocalIndex(path, ivf_min_rows=ivf_min_rows, rescore_factor=args.rescore_factor)
+            len(reader) # Maps the files, like the server's startup warm-up
+            opened = time.perf_counter() - started
+
+            # What the first pass scans (& has to stay in the page cache to be fast): the codes, or the floats without them
+            with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+                header = json.load(f)
+            float_mb = os.path.getsize(os.path.join(path, header["vectors"])) / 2**20
+            scanned_mb = os.path.getsize(os.path.join(path, header["codes"])) / 2**20 if header.get("codes") else float_mb
+
+            latencies, recall = [], 0.0
+            for query in queries:
+                started = time.perf_counter()
+                hits = reader.search(query, k=args.top_k)
+                latencies.append(time.perf_counter() - started)
+                truth = set(np.argsort(-(unit @ (query / np.linalg.norm(query))))[: args.top_k])
+                recall += len(truth & {int(chunk_id.split("-")[1]) for chunk_id, _, _, _ in hits}) / args.top_k
+            reader.close()
+
+            latencies = np.array(latencies) * 1000
+            print(
+                f"  {mode:>4} {quantization:>6}: build {build:.2f}s  open {opened * 1000:.2f}ms  "
+                f"p50 {np.percentile(latencies, 50):.3f}ms  p99 {np.percentile(latencies, 99):.3f}ms  "
+                f"recall@{args.top_k} {recall / args.queries:.3f}  "
+                f"scanned {scanned_mb:.1f} MB" + (f" ({float_mb / scanned_mb:.0f}x less than float32)" if scanned_mb < float_mb else "")
+            )
+
+
+if __name__ == "__main__":
+    main()
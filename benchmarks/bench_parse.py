@@ -0,0 +1,84 @@
+"""
+Measures how parsing & splitting scales with the no. of worker processes.
+Run from the repository root:  python -m benchmarks.bench_parse --notes 2000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+# Nothing here calls Google, but importing 'functions' builds the (lazy) embeddings client
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+
+from functions.manifest import make_chunk_ids
+from functions.pipeline import ordered_map
+from functions.vault import split_note
+from benchmarks.synthetic_vault import generate_vault
+
+
+def _section_ids(folder: str, text: str) -> dict[str, list[str]]:
+    # Chunk IDs of a note, by the section they come from
+    path = os.path.join(folder, "Sections.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    chunks = split_note(path)
+    # A long section is split below its heading, never into a chunk holding nothing but the heading
+    assert all(len(chunk.page_content.splitlines()) > 1 for chunk in chunks), "A heading became a chunk of its own!"
+    ids = {}
+    for chunk, chunk_id in zip(chunks, make_chunk_ids("Sections.md", chunks)):
+        ids.setdefault(chunk.metadata.get("section", ""), []).append(chunk_id)
+    return ids
+
+
+def check_section_ids():
+    # Editing one section (or adding one above the others) must keep every other chunk ID
+    sections = [f"## Part {i}\n\n" + f"Paragraph {i} about the vault, its notes & how they link together. " * (40 if i == 2 else 6) + "\n\n" for i in range(5)]
+    with tempfile.TemporaryDirectory() as folder:
+        before = _section_ids(folder, "# Sections\n\nIntro line.\n\n" + "".join(sections))
+        edited = list(sections)
+        edited[3] = edited[3].replace("Paragraph 3", "Paragraph three", 1)
+        after_edit = _section_ids(folder, "# Sections\n\nIntro line.\n\n" + "".join(edited))
+        after_insert = _section_ids(folder, "# Sections\n\nIntro line.\n\n## New part\n\n" + "A new section on top. " * 12 + "\n\n" + "".join(sections))
+
+    assert len(before["Sections > Part 2"]) > 1, "The long section should be split in several chunks"
+    changed = [heading for heading in before if before[heading] != after_edit.get(heading)]
+    assert changed == ["Sections > Part 3"], f"Editing one section changed the IDs of {changed}"
+    assert all(after_insert.get(heading) == ids for heading, ids in before.items()), "Adding a section changed the IDs of the others"
+    print("Chunk IDs: stable across edits to other sections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="*", default=None, help="Worker counts to try (default: 1, 2, 4 ... cpu count)")
+    args = parser.parse_args()
+
+    worker_counts = args.workers or sorted({1, *[2 ** i for i in range(1, 8) if 2 ** i <= (os.cpu_count() or 1)], os.cpu_count() or 1})
+
+    check_section_ids()
+
+    with tempfile.TemporaryDirectory() as vault:
+        paths = generate_vault(vault, notes=args.notes)
+        print(f"Synthetic vault: {len(paths)} notes")
+
+        baseline = None
+        reference_chunks = None
+        for workers in worker_counts:
+            started = time.perf_counter()
+            chunk_texts = []
+            for _, chunks in ordered_map(split_note, paths, workers):
+                chunk_texts.extend(chunk.page_content for chunk in chunks)
+            elapsed = time.perf_counter() - started
+
+            # Every worker count must produce the exact same chunks in the exact same order
+            if reference_chunks is None:
+                reference_chunks = chunk_texts
+            assert chunk_texts == reference_chunks, "Chunk order changed with the no. of workers!"
+
+            files_per_sec = len(paths) / elapsed
+            baseline = baseline or files_per_sec
+            print(f"  workers={workers:>3}  {files_per_sec:8.1f} files/sec  {len(chunk_texts)} chunks  x{files_per_sec / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Cold start of the entry points, the time a restarted container takes before it's useful:
+- 'import server' / 'import main' in a fresh interpreter (& the heaviest imports behind them),
+- a real 'uvicorn server:app' process: time until '/' answers & until '/ready' (warm-up done),
+  serving a local index snapshot vs. the live index folder.
+The index is built offline with the fakes, the server process runs the real libraries (no API calls at boot).
+Pass '--max-import-ms' to fail (exit 1) when importing 'server' gets slower, e.g. in CI.
+Run from the repository root:  python -m benchmarks.bench_startup --output startup.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+from benchmarks.bench_suite import run_script, git_commit
+
+
+def base_environment(folder: str) -> dict:
+    # Only what the entry points need to import & boot, everything points into the temp folder
+    return {
+        **os.environ,
+        "GOOGLE_API_KEY": "offline-benchmark",
+        "PINECONE_API_KEY": "offline-benchmark",
+        "PINECONE_INDEX_NAME": "benchmark",
+        "SERVER_PASSWORD": "benchmark",
+        "VAULT_PATH": os.path.join(folder, "vault"),
+        "LOCAL_INDEX_PATH": os.path.join(folder, "local_index"),
+        "PINECONE_LEXICAL_PATH": os.path.join(folder, "pinecone_lexical", "lexical.sqlite"),
+        "EMBEDDING_CACHE_PATH": os.path.join(folder, "embedding_cache", "embeddings.sqlite"),
+        "ANSWER_CACHE_PATH": "",
+        "SEARCH_MODE": "hybrid",
+    }
+
+
+def time_import(module: str, env: dict, runs: int) -> float:
+    # Median ms of a fresh interpreter importing 'module', the interpreter's own startup isn't counted
+    code = f"import time; started = time.perf_counter(); import {module}; print((time.perf_counter() - started) * 1000)"
+    timings = [float(subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout.split()[-1]) for _ in range(runs)]
+    return statistics.median(timings)
+
+
+def heaviest_imports(module: str, env: dict, top: int = 5) -> list[tuple[str, float]]:
+    # The packages 'module' pulls in directly, by cumulative time ('python -X importtime')
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True, check=True)
+    found = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        # Depth 2 = imported by 'module' itself, its own line (depth 1) is the total
+        if match and len(match.group(2)) == 3:
+            found[match.group(3)] = int(match.group(1)) / 1000
+    return sorted(found.items(), key=lambda item: -item[1])[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def status_of(url: str) -> int | None:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None # Not listening yet
+
+
+def time_boot(env: dict, timeout: float = 60.0) -> dict:
+    """
+    Starts 'uvicorn server:app' & polls it, ms from the process start until '/' answers & until '/ready' is 200.
+    """
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    online = ready = None
+    try:
+        while time.perf_counter() - started < timeout and process.poll() is None:
+            if online is None and status_of(f"http://127.0.0.1:{port}/") == 200:
+                online = (time.perf_counter() - started) * 1000
+            if online is not None and status_of(f"http://127.0.0.1:{port}/ready") == 200:
+                ready = (time.perf_counter() - started) * 1000
+                break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+    if ready is None:
+        raise RuntimeError(f"The server didn't get ready within {timeout}s (exit code {process.returncode})")
+    return {"online_ms": online, "ready_ms": ready}
+
+
+def build_index(folder: str, env: dict, notes: int) -> str:
+    # Ingest with the fakes, in this process, then a snapshot of it for the server to map
+    os.environ.update(env)
+    from benchmarks.fakes import install_fakes
+    from benchmarks.synthetic_vault import generate_vault
+
+    install_fakes()
+    generate_vault(env["VAULT_PATH"], notes=notes)
+    import ingest
+
+    snapshot = os.path.join(folder, "snapshot")
+    run_script(ingest, ["ingest.py", "--backend", "local", "--workers", "1", "--snapshot", snapshot])
+    return snapshot
+
+
+def print_report(results: dict):
+    for module, timings in results["imports"].items():
+        print(f"📦 import {module:<7} " + "  ".join(f"{backend} {ms:6.1f}ms" for backend, ms in timings.items()))
+    print("   heaviest imports of 'server': " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in results["server_imports"]))
+    for index, boot in results["boot"].items():
+        print(f"🚀 boot ({index:<8})  '/' answers after {boot['online_ms']:7.1f}ms, '/ready' after {boot['ready_ms']:7.1f}ms")
+
+
+def print_comparison(old: dict, new: dict):
+    # Lower is better for everything here
+    def line(label, before, after):
+        change = (after - before) / before if before else 0.0
+        print(f"  {label:<32} {before:10.1f} -> {after:10.1f}  {change:+.1%} {'✅' if change < 0 else '⚠️' if change else ''}")
+
+    print(f"Compared with {old.get('commit') or 'the previous run'}:")
+    for module, timings in new["imports"].items():
+        for backend, ms in timings.items():
+            before = old["imports"].get(module, {}).get(backend)
+            if before is not None:
+                line(f"import {module} ({backend}) ms", before, ms)
+    for index, boot in new["boot"].items():
+        before = old["boot"].get(index)
+        if before:
+            line(f"boot {index} '/' ms", before["online_ms"], boot["online_ms"])
+            line(f"boot {index} '/ready' ms", before["ready_ms"], boot["ready_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500, help="Size of the synthetic vault the server maps")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per import timing (the median is reported)")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Exit with 1 if importing 'server' takes longer")
+    parser.add_argument("--output", default="bench_startup.json", help="Where to write the results (JSON)")
+    parser.add_argument("--compare", default=None, help="A previous results file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        env = base_environment(folder)
+        results = {"commit": git_commit(), "notes": args.notes, "imports": {"server": {}, "main": {}}}
+        for backend in ("local", "pinecone", "chroma"):
+            backend_env = {**env, "VECTOR_BACKEND": backend}
+            results["imports"]["server"][backend] = time_import("server", backend_env, args.runs)
+            results["imports"]["main"][backend] = time_import("main", backend_env, args.runs)
+        results["server_imports"] = heaviest_imports("server", {**env, "VECTOR_BACKEND": "local"})
+
+        snapshot = build_index(folder, env, args.notes)
+        local_env = {**env, "VECTOR_BACKEND": "local"}
+        results["boot"] = {
+            "snapshot": time_boot({**local_env, "LOCAL_INDEX_PATH": snapshot}),
+            "live": time_boot(local_env),
+        }
+
+    print_report(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+    slowest = max(results["imports"]["server"].values())
+    if args.max_import_ms is not None and slowest > args.max_import_ms:
+        print(f"❌ Importing 'server' took {slowest:.1f}ms, over the {args.max_import_ms:.0f}ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
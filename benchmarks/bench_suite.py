@@ -0,0 +1,237 @@
+"""
+Offline end-to-end benchmark, no API keys needed: Google & Pinecone are swapped for the deterministic
+fakes in 'benchmarks/fakes.py' (with configurable latency & injected 429s). It builds a synthetic vault,
+measures ingest chunks/sec & peak memory, then '/chat' p50/p95/p99 latency & throughput under load.
+Everything is written as JSON, pass an older file to '--compare' to see what changed.
+Run from the repository root:  python -m benchmarks.bench_suite --notes 500 --output bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+
+import numpy as np
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # 'ru_maxrss' is in KB on Linux but in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def configure_environment(folder: str, args):
+    # Everything the scripts read from '.env' points into the temp folder, so a run never touches real data.
+    # Must happen before the repo's modules are imported, they read their settings at import time.
+    os.environ.update({
+        "GOOGLE_API_KEY": "offline-benchmark",
+        "PINECONE_API_KEY": "offline-benchmark",
+        "PINECONE_INDEX_NAME": "benchmark",
+        "SERVER_PASSWORD": "benchmark",
+        "VECTOR_BACKEND": args.backend,
+        "VAULT_PATH": os.path.join(folder, "vault"),
+        "LOCAL_INDEX_PATH": os.path.join(folder, "local_index"),
+        "PINECONE_LEXICAL_PATH": os.path.join(folder, "pinecone_lexical", "lexical.sqlite"),
+        "EMBEDDING_CACHE_PATH": os.path.join(folder, "embedding_cache", "embeddings.sqlite"),
+        "ANSWER_CACHE_PATH": "",
+        "EMBED_RPM": str(args.embed_rpm),
+        "EMBED_TPM": str(args.embed_tpm),
+    })
+
+
+def run_script(module, argv: list[str]) -> float:
+    # Runs a script's 'main()' as if called from the command line, its per-batch prints are swallowed
+    saved_argv, sys.argv = sys.argv, argv
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.main()
+    finally:
+        sys.argv = saved_argv
+    return time.perf_counter() - started
+
+
+def bench_ingest(args, faults) -> dict:
+    import ingest
+    from functions.local_index import LocalIndex, LOCAL_INDEX_PATH
+
+    rss_before = peak_rss_mb()
+    elapsed = run_script(ingest, ["ingest.py", "--backend", "local", "--rebuild", "--workers", str(args.workers)])
+    chunks = LocalIndex(LOCAL_INDEX_PATH).count()
+    result = {
+        "chunks": chunks,
+        "seconds": elapsed,
+        "chunks_per_sec": chunks / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - rss_before,
+        "workers_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "injected_429s": faults["embeddings"].injected,
+    }
+
+    if args.backend == "pinecone":
+        # The server searches Pinecone, so the (fake) index is seeded like production would be
+        import seed_pinecone
+        from benchmarks.fakes import FakePinecone
+        injected = faults["embeddings"].injected + faults["pinecone"].injected
+        elapsed = run_script(seed_pinecone, ["seed_pinecone.py", "--workers", str(args.workers)])
+        index = FakePinecone().Index(os.environ["PINECONE_INDEX_NAME"])
+        vectors, requests = len(index.records), index.upsert_requests
+        # Seeding again must overwrite the same IDs, not add a second copy of every chunk
+        reseed = run_script(seed_pinecone, ["seed_pinecone.py", "--workers", str(args.workers)])
+        result["pinecone_seed"] = {
+            "seconds": elapsed,
+            "chunks_per_sec": vectors / elapsed if elapsed else 0.0,
+            "upsert_requests": requests,
+            "vectors": vectors,
+            "reseed_seconds": reseed,
+            "vectors_after_reseed": len(index.records),
+            "injected_429s": faults["embeddings"].injected + faults["pinecone"].injected - injected,
+        }
+    return result
+
+
+def make_questions(count: int, offset: int) -> list[str]:
+    from benchmarks.synthetic_vault import WORDS
+
+    # Unique questions, so the answer cache never short-circuits the work, built from the vault's own words
+    return [f"What do my notes say about {WORDS[i % len(WORDS)]} and {WORDS[(i * 7 + 3) % len(WORDS)]}? (#{offset + i})" for i in range(count)]
+
+
+async def bench_chat(args, faults) -> tuple[list[dict], dict]:
+    import httpx
+    import server
+
+    levels = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        headers = {"X-API-Key": "benchmark"}
+        # One warm-up question, opening the store & caches shouldn't count against the first level
+        (await client.post("/chat", json={"question": "warm up"}, headers=headers)).raise_for_status()
+
+        for level, users in enumerate(args.users):
+            gate = asyncio.Semaphore(users)
+            latencies, errors = [], 0
+            injected = faults["llm"].injected + faults["embeddings"].injected + faults["pinecone"].injected
+
+            async def one(question: str):
+                nonlocal errors
+                async with gate:
+                    started = time.perf_counter()
+                    response = await client.post("/chat", json={"question": question}, headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    errors += response.status_code != 200
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(question) for question in make_questions(args.requests, level * args.requests)))
+            elapsed = time.perf_counter() - started
+
+            latencies = np.array(latencies) * 1000
+            levels.append({
+                "users": users,
+                "requests": args.requests,
+                "errors": errors,
+                "throughput_rps": args.requests / elapsed,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "max_ms": float(latencies.max()),
+                "injected_429s": faults["llm"].injected + faults["embeddings"].injected + faults["pinecone"].injected - injected,
+            })
+        # Cache hit rates & query batching counters, useful to explain a change in latency
+        server_stats = (await client.get("/stats", headers=headers)).json()
+    return levels, server_stats
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: dict):
+    ingest = results["ingest"]
+    print(f"📥 Ingest: {ingest['chunks']} chunks in {ingest['seconds']:.1f}s -> {ingest['chunks_per_sec']:.1f} chunks/sec, peak RSS {ingest['peak_rss_mb']:.0f} MB")
+    if "pinecone_seed" in ingest:
+        seeded = ingest["pinecone_seed"]
+        print(f"🌲 Pinecone seed: {seeded['chunks_per_sec']:.1f} chunks/sec in {seeded['upsert_requests']} upsert requests, {seeded['vectors']} -> {seeded['vectors_after_reseed']} vectors after re-seeding")
+    for level in results["chat"]:
+        print(
+            f"💬 users={level['users']:>3}  {level['throughput_rps']:7.1f} req/sec  "
+            f"p50 {level['p50_ms']:7.1f}ms  p95 {level['p95_ms']:7.1f}ms  p99 {level['p99_ms']:7.1f}ms  errors {level['errors']}"
+        )
+
+
+def print_comparison(old: dict, new: dict):
+    # Higher is better for throughput, lower is better for everything else we track
+    def line(label, before, after, higher_is_better=False):
+        change = (after - before) / before if before else 0.0
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:<28} {before:10.1f} -> {after:10.1f}  {change:+.1%} {'✅' if better else '⚠️' if change else ''}")
+
+    print(f"Compared with {old.get('commit') or 'the previous run'}:")
+    line("ingest chunks/sec", old["ingest"]["chunks_per_sec"], new["ingest"]["chunks_per_sec"], higher_is_better=True)
+    line("ingest peak RSS (MB)", old["ingest"]["peak_rss_mb"], new["ingest"]["peak_rss_mb"])
+    old_levels = {level["users"]: level for level in old["chat"]}
+    for level in new["chat"]:
+        before = old_levels.get(level["users"])
+        if before:
+            line(f"users={level['users']} req/sec", before["throughput_rps"], level["throughput_rps"], higher_is_better=True)
+            line(f"users={level['users']} p99 (ms)", before["p99_ms"], level["p99_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500, help="Size of the synthetic vault")
+    parser.add_argument("--backend", choices=["local", "pinecone"], default="local", help="Vector store the server searches")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parsing processes used by ingest")
+    parser.add_argument("--requests", type=int, default=64, help="'/chat' requests per concurrency level")
+    parser.add_argument("--users", type=int, nargs="*", default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Latency of the fake Pinecone")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake API calls failing with a 429")
+    parser.add_argument("--embed-rpm", type=int, default=1_000_000, help="Quota given to the ingest rate limiter (100 = free tier)")
+    parser.add_argument("--embed-tpm", type=int, default=100_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", default=None, help="A previous results file to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        configure_environment(folder, args)
+        from benchmarks.fakes import install_fakes
+        from benchmarks.synthetic_vault import generate_vault
+
+        faults = install_fakes(args.embed_latency, args.llm_latency, args.search_latency, args.error_rate, args.seed)
+        generate_vault(os.environ["VAULT_PATH"], notes=args.notes, seed=args.seed)
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": vars(args),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        }
+        results["ingest"] = bench_ingest(args, faults)
+        with contextlib.redirect_stdout(io.StringIO()): # The server logs every question
+            results["chat"], results["server_stats"] = asyncio.run(bench_chat(args, faults))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_report(results)
+    print(f"Results written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Deterministic, offline stand-ins for the Google models & Pinecone, so benchmarks run without API keys.
+Each one has a configurable latency, to mimic the network round-trip, & can inject 429s like a busy quota.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import random
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import VectorStore
+from pydantic import Field
+
+
+class FakeRateLimitError(Exception):
+    # Worded like Google's error, so 'is_rate_limit_error' & 'retry_delay_from_error' treat it the same way
+    def __init__(self, retry_after: float = 0.5):
+        super().__init__(f"429 RESOURCE_EXHAUSTED (injected by the benchmark). Please retry in {retry_after}s.")
+
+
+class FaultInjector:
+    """Fails a seeded, reproducible fraction of the calls with a 429."""
+
+    def __init__(self, error_rate: float = 0.0, seed: int = 0, retry_after: float = 0.5):
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.injected = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def maybe_fail(self):
+        if not self.error_rate:
+            return
+        with self._lock:
+            fail = self._rng.random() < self.error_rate
+            self.injected += fail
+        if fail:
+            raise FakeRateLimitError(self.retry_after)
+
+
+def fake_vector(text: str, size: int = 64) -> list[float]:
+    # Same text -> same vector, different texts -> (practically) unrelated vectors
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.uniform(-1, 1) for _ in range(size)]
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, size: int = 64, latency: float = 0.0, faults: FaultInjector | None = None):
+        self.size = size
+        self.latency = latency
+        self.faults = faults or FaultInjector()
+        self.calls = 0
+
+    def embed_documents(self, texts: list[str], **kwargs) -> list[list[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        self.faults.maybe_fail()
+        return [fake_vector(text, self.size) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str], **kwargs) -> list[list[float]]:
+        # '**kwargs' takes Google's 'task_type' & friends, the vectors only depend on the text
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        self.faults.maybe_fail()
+        return [fake_vector(text, self.size) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers every prompt with a short fixed text after 'latency' seconds."""
+
+    latency: float = 0.0
+    answer: str = "Based on your notes, here is a deterministic benchmark answer."
+    faults: FaultInjector = Field(default_factory=FaultInjector)
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        self.faults.maybe_fail()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        self.faults.maybe_fail()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # The whole latency goes before the first token, like a real model's time-to-first-token
+        await asyncio.sleep(self.latency)
+        self.faults.maybe_fail()
+        for word in self.answer.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+
+class _FakeNamespace:
+    def __init__(self):
+        self.records = {} # id -> (vector, metadata)
+        self.matrix = None
+        self.ids = []
+
+
+class FakePineconeIndex:
+    """
+    In-memory stand-in for a Pinecone index: exact cosine search over a NumPy matrix per namespace,
+    with the same 'upsert' / 'query' / 'delete' calls the store & the sinks make.
+    """
+
+    def __init__(self, latency: float = 0.0, faults: FaultInjector | None = None):
+        self.latency = latency
+        self.faults = faults or FaultInjector()
+        self.namespaces = {"": _FakeNamespace()}
+        self.upsert_requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def records(self) -> dict:
+        # The default namespace, what a single-vault setup uses
+        return self.namespaces[""].records
+
+    def _namespace(self, namespace: str | None) -> _FakeNamespace:
+        return self.namespaces.setdefault(namespace or "", _FakeNamespace())
+
+    def upsert(self, vectors, namespace: str | None = None, **kwargs):
+        # Rejecting what the real API would, so a sink that mis-sizes its requests fails the benchmark
+        if len(vectors) > 1000:
+            raise ValueError(f"400 Bad Request: {len(vectors)} vectors in one upsert, the max. is 1000")
+        size = len(json.dumps([{"id": record_id, "values": vector, "metadata": metadata} for record_id, vector, metadata in vectors]))
+        if size > 2 * 1024 * 1024:
+            raise ValueError(f"400 Bad Request: upsert of {size} bytes, the max. is 2MB")
+        time.sleep(self.latency)
+        self.faults.maybe_fail()
+        with self._lock:
+            self.upsert_requests += 1
+            space = self._namespace(namespace)
+            for record_id, vector, metadata in vectors:
+                space.records[record_id] = (vector, metadata)
+            space.matrix = None
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: list[str] | None = None, delete_all: bool = False, namespace: str | None = None, **kwargs):
+        with self._lock:
+            space = self._namespace(namespace)
+            if delete_all:
+                space.records.clear()
+            for record_id in ids or []:
+                space.records.pop(record_id, None)
+            space.matrix = None
+
+    def _search(self, vector: list[float], top_k: int, namespace: str | None = None) -> list[dict]:
+        with self._lock:
+            space = self._namespace(namespace)
+            if space.matrix is None:
+                # Rebuilt lazily after writes, the searches in a benchmark all come after the seeding
+                space.ids = list(space.records)
+                matrix = np.array([space.records[record_id][0] for record_id in space.ids], dtype=np.float32).reshape(len(space.ids), -1)
+                space.matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            matrix, ids, records = space.matrix, space.ids, space.records
+        if not ids:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        top = np.argsort(-scores)[:top_k]
+        return [{"id": ids[i], "score": float(scores[i]), "metadata": records[ids[i]][1]} for i in top if ids[i] in records]
+
+    def query(self, vector: list[float], top_k: int = 4, namespace: str | None = None, **kwargs) -> dict:
+        time.sleep(self.latency)
+        self.faults.maybe_fail()
+        return {"matches": self._search(vector, top_k, namespace)}
+
+    async def aquery(self, vector: list[float], top_k: int = 4, namespace: str | None = None, **kwargs) -> dict:
+        await asyncio.sleep(self.latency)
+        self.faults.maybe_fail()
+        return {"matches": self._search(vector, top_k, namespace)}
+
+    def describe_index_stats(self) -> dict:
+        counts = {name: {"vector_count": len(space.records)} for name, space in self.namespaces.items()}
+        return {"total_vector_count": sum(count["vector_count"] for count in counts.values()), "namespaces": counts}
+
+
+class FakePinecone:
+    """Stand-in for the 'pinecone.Pinecone' client, every index name maps to one shared in-memory index."""
+
+    indexes: dict[str, FakePineconeIndex] = {}
+    latency: float = 0.0
+    faults: FaultInjector | None = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def Index(self, name: str = "benchmark", *args, **kwargs) -> FakePineconeIndex:
+        if name not in FakePinecone.indexes:
+            FakePinecone.indexes[name] = FakePineconeIndex(FakePinecone.latency, FakePinecone.faults)
+        return FakePinecone.indexes[name]
+
+
+class FakePineconeVectorStore(VectorStore):
+    """
+    Stand-in for 'langchain_pinecone.PineconeVectorStore', built the same two ways
+    ('index=' by the searcher, 'index_name=' by the seeding script) on top of 'FakePineconeIndex'.
+    """
+
+    def __init__(self, index: FakePineconeIndex | None = None, embedding: Embeddings | None = None, index_name: str | None = None, text_key: str = "text", **kwargs):
+        self.index = index or FakePinecone().Index(index_name or "benchmark")
+        self._embedding = embedding
+        self._text_key = text_key
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self._embedding
+
+    def _to_documents(self, matches: list[dict]) -> list[tuple[Document, float]]:
+        documents = []
+        for match in matches:
+            metadata = dict(match["metadata"])
+            text = metadata.pop(self._text_key, "")
+            documents.append((Document(id=match["id"], page_content=text, metadata=metadata), match["score"]))
+        return documents
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> list[str]:
+        texts = list(texts)
+        ids = ids or [hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+        vectors = self._embedding.embed_documents(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        self.index.upsert([(i, v, {**m, self._text_key: t}) for i, v, m, t in zip(ids, vectors, metadatas, texts)])
+        return ids
+
+    def delete(self, ids: list[str] | None = None, delete_all: bool = False, namespace: str | None = None, **kwargs):
+        self.index.delete(ids=ids, delete_all=delete_all, namespace=namespace)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k)
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, namespace: str | None = None, **kwargs) -> list[tuple[Document, float]]:
+        return self._to_documents(self.index.query(vector=embedding, top_k=k, namespace=namespace)["matches"])
+
+    async def asimilarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, namespace: str | None = None, **kwargs) -> list[tuple[Document, float]]:
+        return self._to_documents((await self.index.aquery(vector=embedding, top_k=k, namespace=namespace))["matches"])
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    async def asimilarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    async def __aenter__(self):
+        return self
+
+    async def aclose(self):
+        pass
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+def install_fakes(embed_latency: float = 0.0, llm_latency: float = 0.0, search_latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> dict[str, FaultInjector]:
+    """
+    Swaps 'GoogleGenerativeAIEmbeddings', 'ChatGoogleGenerativeAI', 'Pinecone' & 'PineconeVectorStore'
+    for the fakes above, inside their own libraries. Call it before importing 'server', 'ingest' or
+    'seed_pinecone', they then pick up the fakes through their normal imports & run unchanged.
+    Returns the fault injectors, to report how many 429s were actually injected.
+    """
+    import pinecone
+    import langchain_pinecone
+    import langchain_google_genai
+
+    faults = {
+        "embeddings": FaultInjector(error_rate, seed),
+        "llm": FaultInjector(error_rate, seed + 1),
+        "pinecone": FaultInjector(error_rate, seed + 2),
+    }
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = lambda model=None, **kwargs: FakeEmbeddings(latency=embed_latency, faults=faults["embeddings"])
+    langchain_google_genai.ChatGoogleGenerativeAI = lambda **kwargs: FakeChatModel(latency=llm_latency, faults=faults["llm"])
+    FakePinecone.latency, FakePinecone.faults = search_latency, faults["pinecone"]
+    pinecone.Pinecone = FakePinecone
+    langchain_pinecone.PineconeVectorStore = FakePineconeVectorStore
+    return faults
@@ -0,0 +1,86 @@
+"""
+Fires concurrent requests at the '/chat' endpoint (in-process, with fake Google & Pinecone
+stand-ins that only add latency) & reports how throughput scales with the no. of concurrent users.
+'--batch' also sends the same no. of questions in one '/chat/batch' call, to compare with one-at-a-time.
+Run from the repository root:  python -m benchmarks.load_test_chat
+"""
+import os
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SERVER_PASSWORD", "benchmark")
+
+import httpx
+from langchain_core.documents import Document
+
+import server
+from benchmarks.fakes import FakeEmbeddings, FakeChatModel
+
+
+def install_fakes(embed_latency: float, search_latency: float, llm_latency: float):
+    embeddings = FakeEmbeddings(latency=embed_latency)
+
+    async def fake_retrieve(query, top_k=4, query_vector=None, shards=None):
+        await asyncio.sleep(search_latency)
+        return [Document(id=f"chunk-{i}", page_content=f"Benchmark chunk {i}.", metadata={"source": f"note-{i}.md"}) for i in range(top_k)]
+
+    server.aembed_query = embeddings.aembed_query
+    server.aretrieve = fake_retrieve
+    server.llm = FakeChatModel(latency=llm_latency)
+
+
+async def run_level(client: httpx.AsyncClient, users: int, requests: int, offset: int) -> float:
+    gate = asyncio.Semaphore(users)
+
+    async def one(i: int):
+        async with gate:
+            # Unique questions, so the answer cache never short-circuits the work
+            response = await client.post("/chat", json={"question": f"benchmark question {offset + i}"}, headers={"X-API-Key": "benchmark"})
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def run_batch(client: httpx.AsyncClient, requests: int, offset: int) -> float:
+    questions = [{"question": f"benchmark question {offset + i}"} for i in range(requests)]
+    started = time.perf_counter()
+    answered = 0
+    async with client.stream("POST", "/chat/batch", json={"questions": questions}, headers={"X-API-Key": "benchmark"}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line:
+                answered += 1
+    assert answered == requests, f"{answered} of {requests} answered"
+    return requests / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--users", type=int, nargs="*", default=[1, 4, 16, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--batch", action="store_true", help="Also send all the questions as one '/chat/batch'")
+    args = parser.parse_args()
+
+    install_fakes(args.embed_latency, args.search_latency, args.llm_latency)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"Upstream concurrency limit: {server.UPSTREAM_CONCURRENCY}")
+        baseline = None
+        for level, users in enumerate(args.users):
+            throughput = await run_level(client, users, args.requests, offset=level * args.requests)
+            baseline = baseline or throughput
+            print(f"  users={users:>3}  {throughput:7.1f} req/sec  x{throughput / baseline:.1f}")
+        if args.batch:
+            throughput = await run_batch(client, args.requests, offset=len(args.users) * args.requests)
+            print(f"  batch      {throughput:7.1f} req/sec  x{throughput / baseline:.1f}  (batch concurrency {server.BATCH_CONCURRENCY})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
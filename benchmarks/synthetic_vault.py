@@ -0,0 +1,52 @@
+import os
+import random
+
+WORDS = (
+    "system design latency cache index vector embedding query note idea project meeting "
+    "python docker server deploy quota token batch throughput memory disk network retry "
+    "obsidian vault link graph search answer context prompt model chunk split parse"
+).split()
+
+
+def make_note(rng: random.Random, index: int, total: int, paragraphs: int = 8) -> str:
+    # Front matter, #tags, [[wikilinks]] & dataview fields, so the Obsidian parsing does real work
+    tags = rng.sample(WORDS, 3)
+    lines = [
+        "---",
+        f"title: Note {index}",
+        f"tags: {', '.join(tags)}",
+        f"created: 2024-01-{index % 28 + 1:02d}",
+        "---",
+        f"# Note {index}",
+        "",
+        f"status:: {rng.choice(['draft', 'done', 'idea'])}",
+        "",
+    ]
+    for _ in range(paragraphs):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(40, 120))]
+        links = [f"[[Note {rng.randrange(total)}]]" for _ in range(rng.randint(0, 3))]
+        lines.append(" ".join(words + links) + f" #{rng.choice(WORDS)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_vault(path: str, notes: int = 500, seed: int = 42, folders: int = 10) -> list[str]:
+    """
+    Writes a synthetic Obsidian vault of 'notes' markdown files (plus a few attachments) under 'path'.
+    The same seed always produces the exact same vault, so benchmark runs can be compared.
+    """
+    rng = random.Random(seed)
+    paths = []
+    for index in range(notes):
+        folder = os.path.join(path, f"folder-{index % folders}")
+        os.makedirs(folder, exist_ok=True)
+        note_path = os.path.join(folder, f"Note {index}.md")
+        with open(note_path, "w", encoding="utf-8") as f:
+            f.write(make_note(rng, index, notes))
+        paths.append(note_path)
+
+    # Attachments, which the gatekeeper should skip without reading
+    for index in range(max(1, notes // 50)):
+        with open(os.path.join(path, f"folder-{index % folders}", f"image-{index}.png"), "wb") as f:
+            f.write(rng.randbytes(1024))
+    return paths
@@ -1,2 +1 @@
-rm -rf chroma_db
-uv run ingest.py
\ No newline at end of file
+uv run ingest.py "$@"
\ No newline at end of file
@@ -1 +1,9 @@
-from .obsidian_searcher import search_notes
\ No newline at end of file
+# The searchers are only imported when asked for, importing 'functions.<anything>' used to load
+# Chroma & the Google client through here even when another backend was configured
+
+
+def __getattr__(name):
+    if name == "search_notes":
+        from .obsidian_searcher import search_notes
+        return search_notes
+    raise AttributeError(f"module 'functions' has no attribute '{name}'")
@@ -0,0 +1,180 @@
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+# How close (cosine similarity) a new question must be to a cached one to reuse its answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Optional second tier that survives restarts, left empty to keep the cache in memory only
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+ANSWER_CACHE_DISK_MAX = int(os.getenv("ANSWER_CACHE_DISK_MAX", "20000"))
+
+
+def fingerprint_chunks(chunk_ids: list[str], namespace: str = "") -> str:
+    """
+    Fingerprint of the retrieved chunks. Chunk IDs contain a hash of the chunk text,
+    so re-ingesting edited notes changes the fingerprint & old answers simply stop matching.
+    'namespace' should capture anything else the answer depends on (model, prompt...).
+    """
+    payload = namespace + "\x00" + "\x00".join(sorted(chunk_ids))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    # Both are already unit length, so the dot product is the cosine similarity
+    return sum(x * y for x, y in zip(a, b))
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed on (question embedding, fingerprint of the retrieved chunks).
+    A lookup hits when a cached question with the same fingerprint is at least
+    'threshold' similar, so rephrasings like "what is X?" / "what's X" share an answer.
+    Memory is bounded with LRU eviction, & an optional SQLite tier keeps answers across restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        disk_path: str = ANSWER_CACHE_PATH,
+        disk_max_entries: int = ANSWER_CACHE_DISK_MAX,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.disk_max_entries = disk_max_entries
+        self._entries = OrderedDict() # entry key -> (fingerprint, unit vector, answer)
+        self._by_fingerprint = {} # fingerprint -> set of entry keys, so a lookup only scans its own chunk set
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT, vector BLOB, answer TEXT, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_fp ON answers(fingerprint)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_used ON answers(last_used)")
+            self._conn.commit()
+
+    @staticmethod
+    def _entry_key(fingerprint: str, question: str) -> str:
+        normalized = " ".join(question.lower().split())
+        return hashlib.sha256(f"{fingerprint}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, query_vector: list[float], fingerprint: str) -> str | None:
+        unit = _normalize(query_vector)
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key in self._by_fingerprint.get(fingerprint, ()):
+                score = _cosine(unit, self._entries[key][1])
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                return self._entries[best_key][2]
+
+            answer = self._lookup_disk(unit, fingerprint)
+            if answer is not None:
+                self.hits += 1
+                return answer
+            self.misses += 1
+            return None
+
+    def store(self, query_vector: list[float], fingerprint: str, question: str, answer: str):
+        unit = _normalize(query_vector)
+        key = self._entry_key(fingerprint, question)
+        with self._lock:
+            self._remember(key, fingerprint, unit, answer)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, fingerprint, vector, answer, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, fingerprint, array("f", unit).tobytes(), answer, time.time()),
+                )
+                self._evict_disk()
+                self._conn.commit()
+
+    def _remember(self, key: str, fingerprint: str, unit: list[float], answer: str):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = (fingerprint, unit, answer)
+        self._by_fingerprint.setdefault(fingerprint, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, (old_fingerprint, _, _) = self._entries.popitem(last=False)
+            keys = self._by_fingerprint[old_fingerprint]
+            keys.discard(old_key)
+            if not keys:
+                del self._by_fingerprint[old_fingerprint]
+
+    def _lookup_disk(self, unit: list[float], fingerprint: str) -> str | None:
+        if self._conn is None:
+            return None
+        rows = self._conn.execute(
+            "SELECT key, vector, answer FROM answers WHERE fingerprint = ?", (fingerprint,)
+        ).fetchall()
+        best, best_score = None, self.threshold
+        for key, blob, answer in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            score = _cosine(unit, vector)
+            if score >= best_score:
+                best, best_score = (key, vector.tolist(), answer), score
+        if best is None:
+            return None
+
+        # Promoting it back into memory, so the next hit doesn't touch the disk
+        key, vector, answer = best
+        self._remember(key, fingerprint, vector, answer)
+        self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return answer
+
+    def _evict_disk(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.disk_max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                (count - int(self.disk_max_entries * 0.9),),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+            self.hits = self.misses = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM answers")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "disk": self._conn is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,127 @@
+import os
+import re
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from .rate_limiter import estimate_tokens
+
+load_dotenv()
+
+# Max. prompt tokens spent on retrieved notes, roughly 4 characters per token
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Share of a passage's word trigrams already in the prompt above which it's dropped as a near-duplicate
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# Shorter shared text is a coincidence ("the ", a heading...), not the splitter's chunk_overlap
+MIN_OVERLAP_CHARS = 32
+# '<path hash>-<section hash>-<index in section>-<content hash>', see 'make_chunk_id'
+CHUNK_ID_REGEX = re.compile(r"^[0-9a-f]{16}-([0-9a-f]{8})-(\d{3,})-[0-9a-f]{16}$")
+WORD_REGEX = re.compile(r"\w+")
+
+
+def chunk_ordinal(doc: Document) -> tuple[str, int] | None:
+    # (section, position of the chunk inside it), only known for the IDs ingest generates
+    match = CHUNK_ID_REGEX.match(doc.id or "")
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def _follows(previous: tuple[str, int] | None, ordinal: tuple[str, int] | None) -> bool:
+    # The next chunk of the same section, sections are never split with an overlap between them
+    return previous is not None and ordinal is not None and ordinal == (previous[0], previous[1] + 1)
+
+
+def overlap_length(a: str, b: str) -> int:
+    """Length of the longest end of 'a' that 'b' starts with, i.e. the text the splitter repeated."""
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    # Every candidate start has to contain the probe, the earliest full match is the longest overlap
+    position = a.find(probe)
+    while position != -1:
+        if b.startswith(a[position:]):
+            return len(a) - position
+        position = a.find(probe, position + 1)
+    return 0
+
+
+def _shingles(text: str) -> set:
+    words = WORD_REGEX.findall(text.lower())
+    return {hash(tuple(words[i : i + 3])) for i in range(max(1, len(words) - 2))}
+
+
+class _Passage:
+    # One or more consecutive chunks of the same note, merged into a single piece of text
+    __slots__ = ("last", "text", "chunks")
+
+    def __init__(self, rank: int, ordinal: tuple[str, int] | None, doc: Document):
+        self.last = ordinal
+        self.text = doc.page_content
+        self.chunks = [(rank, doc)]
+
+    @property
+    def rank(self) -> int:
+        return min(rank for rank, _ in self.chunks)
+
+    def try_merge(self, rank: int, ordinal: tuple[str, int] | None, doc: Document) -> bool:
+        overlap = overlap_length(self.text, doc.page_content)
+        if overlap or _follows(self.last, ordinal):
+            # Neighbouring chunks without a detectable overlap (e.g. split on a blank line) are simply joined
+            self.text += doc.page_content[overlap:] if overlap else "\n\n" + doc.page_content
+            self.last = ordinal
+        elif ordinal is None and (overlap := overlap_length(doc.page_content, self.text)):
+            # Without ordinals (e.g. random Pinecone IDs) the earlier chunk may well come second
+            self.text = doc.page_content + self.text[overlap:]
+        else:
+            return False
+        self.chunks.append((rank, doc))
+        return True
+
+
+def build_context(docs: list[Document], token_budget: int = CONTEXT_TOKEN_BUDGET, duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD) -> list[Document]:
+    """
+    Turns retrieved chunks (best first) into the passages that go into the prompt:
+    1. Consecutive / overlapping chunks of the same note are merged, so the ~200 characters
+       of 'chunk_overlap' they share are sent once instead of twice.
+    2. Passages keep the rank of their best chunk & are ordered by it.
+    3. Near-duplicates of a passage already taken (copied templates, the same text in two notes) are dropped.
+    4. Passages are packed greedily into 'token_budget', the best one is truncated if it alone doesn't fit.
+    Each passage is a Document with the metadata of its best chunk & every merged ID under 'chunk_ids'.
+    """
+    by_source = {}
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("path") or doc.metadata.get("source") or ""
+        by_source.setdefault(source, []).append((chunk_ordinal(doc), rank, doc))
+
+    passages = []
+    for chunks in by_source.values():
+        # In reading order where it's known, chunks without an ordinal are matched on their overlap only
+        chunks.sort(key=lambda chunk: (chunk[0] is None, chunk[0] or ("", 0), chunk[1]))
+        note_passages = []
+        for ordinal, rank, doc in chunks:
+            if not any(passage.try_merge(rank, ordinal, doc) for passage in note_passages):
+                note_passages.append(_Passage(rank, ordinal, doc))
+        passages.extend(note_passages)
+    passages.sort(key=lambda passage: passage.rank)
+
+    packed, seen_shingles, used = [], set(), 0
+    for passage in passages:
+        shingles = _shingles(passage.text)
+        if seen_shingles and len(shingles & seen_shingles) >= duplicate_threshold * len(shingles):
+            continue
+        tokens = estimate_tokens(passage.text)
+        text = passage.text
+        if used + tokens > token_budget:
+            if packed:
+                continue # A smaller passage further down may still fit
+            text = text[: token_budget * 4]
+            tokens = token_budget
+        _, best = min(passage.chunks, key=lambda chunk: chunk[0])
+        packed.append(Document(
+            id=best.id,
+            page_content=text,
+            metadata={**best.metadata, "chunk_ids": [doc.id for _, doc in passage.chunks]},
+        ))
+        seen_shingles |= shingles
+        used += tokens
+    return packed
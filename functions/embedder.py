@@ -0,0 +1,83 @@
+import time
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from langchain_core.embeddings import Embeddings
+
+from .rate_limiter import AdaptiveRateLimiter, is_rate_limit_error, retry_delay_from_error, estimate_tokens
+from .metrics import span, RATE_LIMITED, RETRIES
+
+
+def _embed_batch(embeddings: Embeddings, texts: list[str], limiter: AdaptiveRateLimiter) -> tuple[list[list[float]], dict]:
+    # Cached texts are free, so only the ones that will really hit the API are charged to the quota
+    # (the cached vectors found on the way are reused below, the cache is read once per batch)
+    lookup_documents = getattr(embeddings, "lookup_documents", None)
+    billable, lookup = lookup_documents(texts) if lookup_documents else (texts, None)
+    # Waiting for quota & the API call itself are timed apart, they call for different fixes
+    with span("rate_limit_wait") as waited:
+        if billable:
+            limiter.acquire(sum(estimate_tokens(text) for text in billable))
+    with span("embed") as embedded:
+        vectors = embeddings.embed_looked_up(lookup) if lookup is not None else embeddings.embed_documents(texts)
+    return vectors, {"rate_limit_wait": waited.elapsed, "embed": embedded.elapsed}
+
+
+def embed_concurrently(embeddings: Embeddings, items, limiter: AdaptiveRateLimiter, text_of=lambda item: item, max_attempts: int = 5):
+    """
+    Embeds 'items' in several batches at once, sized & paced by the adaptive limiter.
+    Yields (batch, vectors, error, timings) as each batch finishes (not necessarily in input order):
+        error is None on success, otherwise vectors is None & the batch gave up after 'max_attempts'.
+        timings holds the seconds the batch spent waiting for quota & being embedded.
+    """
+    items = iter(items)
+    retries = deque() # (batch, attempt) waiting for another go
+    in_flight = {} # future -> (batch, attempt)
+    exhausted = False
+
+    with ThreadPoolExecutor(max_workers=limiter.max_concurrency) as pool:
+        while True:
+            # Keeping as many batches in flight as the limiter currently allows
+            while len(in_flight) < limiter.concurrency:
+                if retries:
+                    batch, attempt = retries.popleft()
+                elif not exhausted:
+                    batch, attempt = list(islice(items, limiter.batch_size)), 1
+                    if not batch:
+                        exhausted = True
+                        continue
+                else:
+                    break
+                future = pool.submit(_embed_batch, embeddings, [text_of(item) for item in batch], limiter)
+                in_flight[future] = (batch, attempt)
+
+            if not in_flight:
+                return
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, attempt = in_flight.pop(future)
+                try:
+                    vectors, timings = future.result()
+                except Exception as e:
+                    if attempt >= max_attempts:
+                        yield batch, None, e, {}
+                        continue
+                    RETRIES.labels("embed").inc()
+                    if is_rate_limit_error(e):
+                        RATE_LIMITED.labels("embed").inc()
+                        cooldown = limiter.on_rate_limited(retry_delay_from_error(e))
+                        print(f"    ⚠️ Rate Limit hit! Pausing {cooldown:.1f}s, batch size now {limiter.batch_size}, parallelism {limiter.concurrency}")
+                        # Re-splitting to the new (smaller) batch size, so the retry is more likely to fit
+                        size = limiter.batch_size
+                        for i in range(0, len(batch), size):
+                            retries.append((batch[i : i + size], attempt + 1))
+                    else:
+                        print(f"    Error embedding a batch of {len(batch)} (attempt {attempt}/{max_attempts}): {e}")
+                        # Other errors are usually transient network issues, a short pause is enough
+                        time.sleep(min(30, 2 ** attempt))
+                        retries.append((batch, attempt + 1))
+                    continue
+
+                limiter.on_success()
+                yield batch, vectors, None, timings
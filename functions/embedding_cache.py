@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+# Shared by every script, so the same chunk is only ever paid for once per model
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./.embedding_cache/embeddings.sqlite")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace & unicode-form differences shouldn't cost us another API call
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(model: str, kind: str, text: str) -> str:
+    # 'kind' matters, Google embeds documents & queries with different task types
+    payload = f"{model}\x00{kind}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk (SQLite) store of embedding vectors, keyed by (model, kind, normalized text hash).
+    When it grows past 'max_entries' the least recently used vectors are evicted.
+    Lookups only read: the 'last used' time of a hit is kept in memory & written with the next 'put_many',
+    which is the only thing that can evict (so eviction still sees every hit).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared across threads, guarded by the lock above
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL") # Lets ingest & the server share the file
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._touched = {} # key -> last used, of the hits since the last write
+        # Rows in the table, counted once & then kept up to date (other processes' inserts are picked up by '_evict')
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # SQLite caps the number of '?' per statement, so looking up in slices
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            # No write (& no fsync) on the read path, the touches go to disk with the next insert
+            now = time.time()
+            self._touched.update((key, now) for key in found)
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._write_touches()
+            # A key that's already there holds the same vector (another process embedded the same text meanwhile)
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, model, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            ).rowcount
+            self._count += max(inserted, 0)
+            self._evict()
+            self._conn.commit()
+
+    def flush(self):
+        # Writes the pending 'last used' times, e.g. before a script exits
+        with self._lock:
+            if self._touched:
+                self._write_touches()
+                self._conn.commit()
+
+    def _write_touches(self):
+        # The caller holds the lock & commits
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(when, key) for key, when in touched.items()])
+
+    def _evict(self):
+        if self._count <= self.max_entries:
+            return
+        # Only counted for real once the running count says we're over, other processes may have added rows too
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        # Trimming down to 90% so we aren't evicting on every single insert
+        excess = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN"
+            " (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._count -= excess
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain 'Embeddings' object with the on-disk cache.
+    It is a drop-in replacement, so Chroma, Pinecone & the searchers use it transparently.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: str | None = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def _lookup(self, texts: list[str], kind: str):
+        keys = [make_cache_key(self.model_name, kind, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Identical texts inside the same batch are only sent once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return keys, found, missing
+
+    def _finish(self, keys: list[str], found: dict, missing: dict, vectors) -> list[list[float]]:
+        if missing:
+            # Rounding to float32 like the stored copies, so a hit & a miss return identical vectors
+            fresh = {key: array("f", vector).tolist() for key, vector in zip(missing.keys(), vectors)}
+            self.cache.put_many(self.model_name, fresh)
+            found.update(fresh)
+
+        with self._counter_lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return [found[key] for key in keys]
+
+    def _embed(self, texts: list[str], kind: str, embed_fn) -> list[list[float]]:
+        keys, found, missing = self._lookup(texts, kind)
+        vectors = embed_fn(list(missing.values())) if missing else []
+        return self._finish(keys, found, missing, vectors)
+
+    async def _aembed(self, texts: list[str], kind: str, aembed_fn) -> list[list[float]]:
+        # The SQLite reads & writes run on a thread, the cache's lock may be held by ingest or a batch writing to it
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts, kind)
+        vectors = await aembed_fn(list(missing.values())) if missing else []
+        if not missing:
+            return self._finish(keys, found, missing, vectors) # Nothing to store, no disk access
+        return await asyncio.to_thread(self._finish, keys, found, missing, vectors)
+
+    def lookup_documents(self, texts: list[str]) -> tuple[list[str], tuple]:
+        """
+        Which documents would actually cost an API call (used by the rate limiter to budget quota),
+        & the lookup itself, for 'embed_looked_up' to embed them without reading the cache a second time.
+        """
+        lookup = self._lookup(texts, "document")
+        return list(lookup[2].values()), lookup
+
+    def embed_looked_up(self, lookup: tuple) -> list[list[float]]:
+        keys, found, missing = lookup
+        vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+        return self._finish(keys, found, missing, vectors)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self._aembed(texts, "document", self.embeddings.aembed_documents)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        async def aembed_one(texts):
+            return [await self.embeddings.aembed_query(texts[0])]
+        return (await self._aembed([text], "query", aembed_one))[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+        }
+
+    def print_stats(self):
+        self.cache.flush()
+        stats = self.stats()
+        print(
+            f"💾 Embedding Cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} of embeddings served without an API call, {stats['entries']} cached)"
+        )
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> EmbeddingCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
+
+
+def get_embeddings(model: str, batch_queries: bool = False, **kwargs) -> CachedEmbeddings:
+    # Imported here so that the cache itself can be used (and tested) without the Google SDK
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    embeddings = GoogleGenerativeAIEmbeddings(model=model, **kwargs)
+    if batch_queries:
+        # Below the disk cache, so only the questions that really need an API call wait for a batch
+        from .query_batcher import QueryBatcher
+        embeddings = QueryBatcher(embeddings)
+    return CachedEmbeddings(embeddings, get_shared_cache(), model_name=model)
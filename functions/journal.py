@@ -0,0 +1,97 @@
+import os
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Batches that still fail after the embedder's own retries get this many more rounds at the end of a run...
+INGEST_RETRY_ROUNDS = int(os.getenv("INGEST_RETRY_ROUNDS", "3"))
+# ...waiting this long before the first one, doubling every round
+INGEST_RETRY_DELAY = float(os.getenv("INGEST_RETRY_DELAY", "10"))
+INGEST_RETRY_MAX_DELAY = 300.0
+
+
+def retry_delay(attempt: int, base: float = INGEST_RETRY_DELAY) -> float:
+    # Exponential backoff: 10s, 20s, 40s... capped, long enough for a per-minute quota to refill
+    return min(INGEST_RETRY_MAX_DELAY, base * 2 ** (attempt - 1))
+
+
+class IngestJournal:
+    """
+    Append-only log of the chunk IDs written during the current run, one JSON line per batch.
+    The manifest only records a note once all of its chunks are in, so after a crash (or Ctrl+C)
+    the journal is what tells the next run which chunks of half-finished notes it can skip.
+    It is deleted when a run completes, a leftover journal means the last run was interrupted.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.done.update(json.loads(line))
+                    except ValueError:
+                        break # The line being written when the process died, everything before it is fine
+        self._file = None
+
+    @property
+    def resuming(self) -> bool:
+        return bool(self.done)
+
+    def record(self, chunk_ids: list[str]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(chunk_ids) + "\n")
+        # A batch costs an API call, an fsync is cheap next to it & makes the checkpoint survive a power cut
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(chunk_ids)
+
+    def clear(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.done = set()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_dead_letters(path: str) -> list[dict]:
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def write_dead_letters(path: str, entries: list[dict], settled=None):
+    """
+    Updates the dead-letter file (one JSON line per chunk) with the chunks that failed every retry of this pass.
+    Entries of earlier passes are kept, except for the notes in 'settled' (the ones this pass went through,
+    their failures, if any, are in 'entries' now); 'settled=None' means every note, e.g. after a full run.
+    The file is removed once nothing is left. Those notes stay out of the manifest, so later runs try them again.
+    """
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    kept = [] if settled is None else [entry for entry in read_dead_letters(path) if entry.get("path") not in settled]
+    entries = kept + [{"time": now, **entry} for entry in entries]
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp_path, path)
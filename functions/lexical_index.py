@@ -0,0 +1,342 @@
+import os
+import re
+import json
+import threading
+import unicodedata
+from collections import Counter
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from .lru_cache import LRUCache
+from .snapshot import is_snapshot, connect_sqlite
+
+load_dotenv()
+
+# "vector" = embeddings only (as before), "hybrid" = embeddings + keyword (BM25) results, fused
+SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+# Each side brings 'top_k * HYBRID_POOL' candidates to the fusion
+HYBRID_POOL = int(os.getenv("HYBRID_POOL", "4"))
+# Where the keyword index of the Pinecone chunks lives, the local stores keep theirs inside their own folder
+PINECONE_LEXICAL_PATH = os.getenv("PINECONE_LEXICAL_PATH", "./pinecone_lexical/lexical.sqlite")
+# Staged writes are applied in groups of this many chunks, a full rebuild rewrites each term only a few times
+LEXICAL_FLUSH_EVERY = int(os.getenv("LEXICAL_FLUSH_EVERY", "5000"))
+# Terms in more than this share of the chunks only re-score chunks matched by rarer terms
+# (small vaults are scored exactly, scanning a few thousand postings is already fast)
+COMMON_TERM_RATIO = 0.1
+COMMON_TERM_MIN_CHUNKS = 2048
+RRF_K = 60 # The usual constant of reciprocal rank fusion, dampens the weight of the very first ranks
+
+# Keeps ticket IDs (ABC-123), hostnames (db01.prod.lan), paths & versions together as one token
+TOKEN_REGEX = re.compile(r"\w+(?:[-./:#@]\w+)*")
+SPLIT_REGEX = re.compile(r"[-./:#@]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or that the this to was what when "
+    "where which who why will with you your do does did can my me".split()
+)
+
+# Decoded postings of the most frequently queried terms, refreshed whenever the index is flushed
+LEXICAL_CACHE_TERMS = int(os.getenv("LEXICAL_CACHE_TERMS", "256"))
+
+EMPTY_POSTINGS = (np.empty(0, dtype="<u4"), np.empty(0, dtype="<u2"), np.empty(0, dtype="<u2"))
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercased terms of 'text'. Compound tokens are kept whole *and* split into their parts,
+    so "db01.prod.lan" is found by searching either the full hostname or just "db01".
+    """
+    terms = []
+    for match in TOKEN_REGEX.finditer(unicodedata.normalize("NFC", text).lower()):
+        token = match.group()
+        if token not in STOPWORDS:
+            terms.append(token)
+        if not token.isalnum() and SPLIT_REGEX.search(token): # 'isalnum' skips the regex for plain words
+            terms.extend(part for part in SPLIT_REGEX.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+def pack_postings(docs: np.ndarray, tfs: np.ndarray, lengths: np.ndarray) -> bytes:
+    """
+    One term's postings = (chunk numbers, term frequencies, chunk lengths), 8 bytes per chunk.
+    Stored column after column, so decoding is three zero-copy views instead of a strided record array.
+    """
+    return docs.astype("<u4").tobytes() + tfs.astype("<u2").tobytes() + lengths.astype("<u2").tobytes()
+
+
+def unpack_postings(blob: bytes):
+    count = len(blob) // 8
+    return (
+        np.frombuffer(blob, dtype="<u4", count=count),
+        np.frombuffer(blob, dtype="<u2", count=count, offset=4 * count),
+        np.frombuffer(blob, dtype="<u2", count=count, offset=6 * count),
+    )
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], top_k: int, k: int = RRF_K) -> list[Document]:
+    """
+    Merges several ranked lists of Documents (by chunk ID), scoring each one with sum(1 / (k + rank)).
+    Scores of different retrievers aren't comparable, ranks are, which is why RRF needs no tuning.
+    """
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    # The fused score goes into the metadata, that's what results of several shards are merged by
+    return [Document(id=docs[key].id, page_content=docs[key].page_content, metadata={**docs[key].metadata, "score": scores[key]}) for key in best]
+
+
+class LexicalIndex:
+    """
+    On-disk BM25 inverted index (SQLite), kept in step with the vector stores by the ingest sinks:
+        terms -> one row per term, its postings packed as a NumPy blob (see 'pack_postings')
+        docs  -> chunk id, text & metadata, plus its terms so it can be removed again
+    Writes are staged & applied by 'flush()'. A query reads one row per query term
+    & scores every posting in a single vectorized pass.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, flush_every: int = LEXICAL_FLUSH_EVERY):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = {} # chunk id -> (text, metadata), or None for a delete
+        self._cache = LRUCache(max_entries=LEXICAL_CACHE_TERMS)
+        self._cache_generation = None
+
+        self.read_only = is_snapshot(os.path.dirname(path) or ".")
+        if self.read_only:
+            # Part of a snapshot baked into the image, opened as is
+            self._conn = connect_sqlite(path, read_only=True)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = connect_sqlite(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER, terms TEXT, text TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, postings BLOB) WITHOUT ROWID")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+
+    def _info(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_info(self, key: str, delta: int):
+        self._conn.execute(
+            "INSERT INTO info (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, delta),
+        )
+
+    def _load_postings(self, terms) -> dict[str, tuple]:
+        terms = list(terms)
+        found = {}
+        # SQLite caps the number of '?' per statement, so reading in slices
+        for i in range(0, len(terms), 500):
+            part = terms[i : i + 500]
+            rows = self._conn.execute(
+                f"SELECT term, postings FROM terms WHERE term IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for term, blob in rows:
+                found[term] = unpack_postings(blob)
+        return found
+
+    def _save_postings(self, postings: dict[str, tuple]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO terms (term, postings) VALUES (?, ?)",
+            [(term, pack_postings(*columns)) for term, columns in postings.items() if len(columns[0])],
+        )
+        self._conn.executemany("DELETE FROM terms WHERE term = ?", [(term,) for term, columns in postings.items() if not len(columns[0])])
+
+    def upsert(self, ids: list[str], texts: list[str], metadatas: list[dict]):
+        # Only staged here, rewriting the postings once per 'flush()' instead of once per batch
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                self._pending[chunk_id] = (text, metadata) # The last write of an ID wins
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            for chunk_id in ids:
+                self._pending[chunk_id] = None
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Applies the staged writes in one transaction, each touched term's postings are rewritten once.
+        Searches only see the chunks after this, same as the local vector index.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            ids = list(pending)
+
+            # 1. Dropping every staged ID (an upsert is a delete + insert, since the metadata may have moved)
+            removed, removals = 0, {}
+            removed_length = 0
+            for i in range(0, len(ids), 500):
+                part = ids[i : i + 500]
+                placeholders = ",".join("?" * len(part))
+                for doc, length, terms in self._conn.execute(f"SELECT doc, length, terms FROM docs WHERE id IN ({placeholders})", part):
+                    removed += 1
+                    removed_length += length
+                    for term in terms.split(" ") if terms else ():
+                        removals.setdefault(term, []).append(doc)
+                self._conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", part)
+
+            # 2. Inserting the new versions
+            added, additions = 0, {}
+            added_length = 0
+            for chunk_id, value in pending.items():
+                if value is None:
+                    continue
+                text, metadata = value
+                counts = Counter(tokenize(text))
+                length = min(sum(counts.values()), 65535)
+                doc = self._conn.execute(
+                    "INSERT INTO docs (id, length, terms, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (chunk_id, length, " ".join(counts), text, json.dumps(metadata or {})),
+                ).lastrowid
+                added += 1
+                added_length += length
+                for term, tf in counts.items():
+                    additions.setdefault(term, []).append((doc, min(tf, 65535), length))
+
+            # 3. Rewriting the postings of every touched term exactly once
+            touched = set(removals) | set(additions)
+            postings = self._load_postings(touched)
+            updated = {}
+            for term in touched:
+                docs, tfs, lengths = postings.get(term, EMPTY_POSTINGS)
+                if term in removals:
+                    keep = ~np.isin(docs, removals[term])
+                    docs, tfs, lengths = docs[keep], tfs[keep], lengths[keep]
+                if term in additions:
+                    new = np.array(additions[term], dtype=np.uint32)
+                    docs = np.concatenate([docs, new[:, 0]])
+                    tfs = np.concatenate([tfs, new[:, 1]])
+                    lengths = np.concatenate([lengths, new[:, 2]])
+                updated[term] = (docs, tfs, lengths)
+            self._save_postings(updated)
+
+            self._add_info("doc_count", added - removed)
+            self._add_info("total_length", added_length - removed_length)
+            self._add_info("generation", 1) # Tells every reader (any process) to drop its cached postings
+            self._conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._conn.execute("DELETE FROM docs")
+            self._conn.execute("DELETE FROM terms")
+            self._conn.execute("DELETE FROM info WHERE key != 'generation'")
+            self._add_info("generation", 1)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._info("doc_count")
+
+    def search(self, query: str, k: int = 4) -> list[Document]:
+        # Top 'k' chunks by BM25 score, best first
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            doc_count = self._info("doc_count")
+            if not doc_count:
+                return []
+            average_length = self._info("total_length") / doc_count
+            postings = self._cached_postings(terms)
+            if not postings:
+                return []
+
+            # Terms found in most chunks (low idf) can't lift a chunk on their own, so they only re-score
+            # the chunks matched by the rarer terms, which keeps queries like "notes about X" fast
+            columns = sorted(postings.values(), key=lambda column: len(column[0]))
+            cutoff = max(COMMON_TERM_MIN_CHUNKS, int(doc_count * COMMON_TERM_RATIO))
+            rare = [column for column in columns if len(column[0]) <= cutoff] or columns[:1]
+            common = columns[len(rare):]
+
+            def bm25(df, tfs, lengths):
+                idf = np.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths.astype(np.float32) / average_length)
+                return idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            # Summing the per-term scores of each chunk, chunk numbers are small ints so a dense 'bincount' does it
+            size = int(max(docs.max() for docs, _, _ in columns)) + 1
+            totals = np.bincount(
+                np.concatenate([docs for docs, _, _ in rare]),
+                weights=np.concatenate([bm25(len(docs), tfs, lengths) for docs, tfs, lengths in rare]),
+                minlength=size,
+            )
+            for docs, tfs, lengths in common:
+                keep = totals[docs] > 0
+                # A chunk appears once per term, so there are no duplicate indices in the '+='
+                totals[docs[keep]] += bm25(len(docs), tfs[keep], lengths[keep])
+            k = min(k, int(np.count_nonzero(totals)))
+            if not k:
+                return []
+            top = np.argpartition(-totals, k - 1)[:k] if len(totals) > k else np.arange(len(totals))
+            top = top[np.argsort(-totals[top])]
+
+            best = [int(doc) for doc in top if totals[doc] > 0]
+            rows = {
+                doc: (chunk_id, text, metadata)
+                for doc, chunk_id, text, metadata in self._conn.execute(
+                    f"SELECT doc, id, text, metadata FROM docs WHERE doc IN ({','.join('?' * len(best))})", best
+                )
+            }
+            return [
+                Document(id=rows[doc][0], page_content=rows[doc][1], metadata=json.loads(rows[doc][2]))
+                for doc in best
+                if doc in rows
+            ]
+
+    def get(self, ids: list[str]) -> list[Document]:
+        # Chunks by ID (e.g. the linked notes of 'link_graph.py'), in the order asked, unknown IDs are skipped
+        if not ids:
+            return []
+        with self._lock:
+            rows = {
+                chunk_id: (text, metadata)
+                for chunk_id, text, metadata in self._conn.execute(
+                    f"SELECT id, text, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+            }
+        return [Document(id=chunk_id, page_content=rows[chunk_id][0], metadata=json.loads(rows[chunk_id][1])) for chunk_id in ids if chunk_id in rows]
+
+    def _cached_postings(self, terms: list[str]) -> dict[str, tuple]:
+        # The caller holds the lock. Common terms are read on almost every query & their postings are the biggest
+        generation = self._info("generation")
+        if generation != self._cache_generation:
+            self._cache.clear()
+            self._cache_generation = generation
+
+        postings, missing = {}, []
+        for term in terms:
+            columns = self._cache.get(term)
+            if columns is None:
+                missing.append(term)
+            else:
+                postings[term] = columns
+        for term, columns in self._load_postings(missing).items():
+            self._cache.put(term, columns)
+            postings[term] = columns
+        return postings
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
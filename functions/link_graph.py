@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import threading
+from collections import Counter
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# No. of linked notes added to the retrieved chunks (their first chunk each), 0 turns the expansion off
+LINK_EXPANSION = int(os.getenv("LINK_EXPANSION", "0"))
+# A backlink ("who points at this hit") counts this much compared to a link the hit itself makes
+LINK_BACKLINK_WEIGHT = float(os.getenv("LINK_BACKLINK_WEIGHT", "0.5"))
+
+# Next to each store's keyword index: the links of every note (the writer's state) & the compiled arrays (what searches load)
+LINK_GRAPH_NAME = "links"
+
+# [[Note]], [[Note|alias]], [[Note#Heading]], [[folder/Note.md^block]] & ![[embeds]] all link to 'Note'
+WIKILINK_REGEX = re.compile(r"\[\[([^\]\|#\^]+)[^\]]*\]\]")
+
+
+def note_name(path: str) -> str:
+    # What a wikilink resolves by: the file name without '.md', case-insensitive (like Obsidian)
+    name = os.path.basename(path.replace("\\", "/").strip())
+    if name.lower().endswith(".md"):
+        name = name[:-3]
+    return name.strip().lower()
+
+
+def extract_links(texts: list[str]) -> Counter:
+    # Link target -> no. of times it's linked (the overlapping part of two size-split chunks counts twice, that's fine)
+    links = Counter()
+    for text in texts:
+        links.update(note_name(target) for target in WIKILINK_REGEX.findall(text))
+    return links
+
+
+def _csr(edges: list[tuple[int, int, int]], size: int):
+    # (from, to, weight) -> row pointers, targets & weights, rows sorted by 'from'
+    if not edges:
+        return np.zeros(size + 1, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    edges = np.array(edges, dtype=np.int64)
+    edges = edges[np.argsort(edges[:, 0], kind="stable")]
+    pointers = np.zeros(size + 1, dtype=np.int32)
+    np.cumsum(np.bincount(edges[:, 0], minlength=size), out=pointers[1:])
+    return pointers, edges[:, 1].astype(np.int32), edges[:, 2].astype(np.float32)
+
+
+class LinkGraph:
+    """
+    The wikilink graph of one store, for expanding retrieved chunks with the notes they link to (& from):
+        links.json -> every note's outgoing links & first chunk ID, updated note by note by ingest
+        links.npz  -> the same as CSR arrays (note -> linked notes, note -> backlinks), rebuilt by 'flush()'
+    Searches only load the arrays, a neighbour lookup is a couple of array slices (microseconds).
+    Like the local index, readers pick up a new 'flush()' on their next lookup.
+    """
+
+    def __init__(self, path: str):
+        self.path = path # Without extension, '.json' & '.npz' are added
+        self._lock = threading.Lock()
+        self._notes = None # rel_path -> {"name", "chunk", "links"}, only loaded by writers
+        self._mtime = None
+        self._names = {} # note name -> row
+        self._arrays = None
+
+    # Writer side (ingest)
+
+    def _load_notes(self) -> dict:
+        if self._notes is None:
+            try:
+                with open(self.path + ".json", encoding="utf-8") as f:
+                    self._notes = json.load(f)
+            except (OSError, ValueError):
+                self._notes = {}
+        return self._notes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load_notes())
+
+    def set_note(self, rel_path: str, chunk_id: str | None, links: Counter):
+        with self._lock:
+            self._load_notes()[rel_path] = {"name": note_name(rel_path), "chunk": chunk_id, "links": dict(links)}
+
+    def remove_note(self, rel_path: str):
+        with self._lock:
+            self._load_notes().pop(rel_path, None)
+
+    def reset(self):
+        with self._lock:
+            self._notes = {}
+
+    def flush(self):
+        """Saves the notes' links & compiles them into the arrays the searches read, both swapped in atomically."""
+        with self._lock:
+            notes = self._load_notes()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+                json.dump(notes, f)
+            os.replace(self.path + ".json.tmp", self.path + ".json")
+
+            # Two notes with the same name: links go to the first one (by path), like a stable tie-break
+            rows = {}
+            for rel_path in sorted(notes):
+                rows.setdefault(notes[rel_path]["name"], rel_path)
+            names = list(rows)
+            row_of = {name: row for row, name in enumerate(names)}
+            edges = [
+                (row_of[notes[rel_path]["name"]], row_of[target], count)
+                for rel_path in rows.values()
+                for target, count in notes[rel_path]["links"].items()
+                if target in row_of and target != notes[rel_path]["name"]
+            ]
+            out_pointers, out_targets, out_weights = _csr(edges, len(names))
+            in_pointers, in_targets, in_weights = _csr([(to, frm, count) for frm, to, count in edges], len(names))
+            with open(self.path + ".npz.tmp", "wb") as f:
+                np.savez(
+                    f,
+                    names=np.array(names, dtype=str),
+                    chunks=np.array([notes[rows[name]]["chunk"] or "" for name in names], dtype=str),
+                    out_pointers=out_pointers, out_targets=out_targets, out_weights=out_weights,
+                    in_pointers=in_pointers, in_targets=in_targets, in_weights=in_weights,
+                )
+            os.replace(self.path + ".npz.tmp", self.path + ".npz")
+
+    # Reader side (searchers)
+
+    def _maybe_reload(self):
+        # The caller holds the lock
+        try:
+            mtime = os.stat(self.path + ".npz").st_mtime_ns
+        except OSError:
+            self._arrays, self._names, self._mtime = None, {}, None
+            return
+        if mtime != self._mtime:
+            with np.load(self.path + ".npz") as data:
+                self._arrays = {key: data[key] for key in data.files}
+            self._names = {str(name): row for row, name in enumerate(self._arrays["names"])}
+            self._mtime = mtime
+
+    def neighbors(self, names: list[str], k: int, backlink_weight: float = LINK_BACKLINK_WEIGHT) -> list[tuple[str, float]]:
+        """
+        The 'k' notes most strongly connected to 'names' (not themselves), as (first chunk ID, strength):
+        the no. of links from the hits to a note, plus 'backlink_weight' per link from it to the hits.
+        """
+        with self._lock:
+            self._maybe_reload()
+            arrays = self._arrays
+            rows = {self._names[name] for name in names if name in self._names}
+        if arrays is None or not rows or k <= 0:
+            return []
+        targets, weights = [], []
+        for row in rows:
+            start, end = arrays["out_pointers"][row], arrays["out_pointers"][row + 1]
+            targets.append(arrays["out_targets"][start:end])
+            weights.append(arrays["out_weights"][start:end])
+            start, end = arrays["in_pointers"][row], arrays["in_pointers"][row + 1]
+            targets.append(arrays["in_targets"][start:end])
+            weights.append(arrays["in_weights"][start:end] * backlink_weight)
+        targets, weights = np.concatenate(targets), np.concatenate(weights)
+        keep = ~np.isin(targets, list(rows))
+        if not keep.any():
+            return []
+        found, inverse = np.unique(targets[keep], return_inverse=True)
+        strength = np.bincount(inverse, weights=weights[keep])
+        best = np.argsort(-strength, kind="stable")[:k]
+        return [(str(arrays["chunks"][found[i]]), float(strength[i])) for i in best if arrays["chunks"][found[i]]]
+
+
+def expand_links(docs: list, shards: list[str], graph_of, lexical_of, limit: int = LINK_EXPANSION) -> list:
+    """
+    Adds the first chunk of the 'limit' notes most strongly linked with the retrieved ones, after them.
+    'graph_of' / 'lexical_of' give a shard's LinkGraph & LexicalIndex, the chunk texts come from the latter,
+    so the expansion costs no embedding & no extra vector query.
+    """
+    if limit <= 0 or not docs:
+        return docs
+    present = {doc.id for doc in docs}
+    candidates = []
+    for shard in shards:
+        # Keyword-only hits don't say which shard they came from, a single shard is the obvious one
+        names = [
+            note_name(doc.metadata.get("source", ""))
+            for doc in docs
+            if doc.metadata.get("shard", shards[0] if len(shards) == 1 else None) == shard
+        ]
+        if names:
+            candidates.extend((strength, shard, chunk_id) for chunk_id, strength in graph_of(shard).neighbors(names, limit) if chunk_id not in present)
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    by_shard, order = {}, {}
+    for strength, shard, chunk_id in candidates[:limit]:
+        by_shard.setdefault(shard, []).append(chunk_id)
+        order.setdefault(chunk_id, len(order))
+    linked = []
+    for shard, chunk_ids in by_shard.items():
+        for doc in lexical_of(shard).get(chunk_ids):
+            doc.metadata.update({"shard": shard, "linked": True})
+            linked.append(doc)
+    # Strongest link first, whichever shard it came from
+    return docs + sorted(linked, key=lambda doc: order[doc.id])
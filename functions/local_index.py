@@ -0,0 +1,429 @@
+import os
+import json
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .snapshot import is_snapshot, connect_sqlite
+
+load_dotenv()
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "./local_index")
+# Above this many chunks an IVF index is built, so a query only scans the closest clusters
+# (a flat scan of 5k x 768 floats already takes ~1ms, it only grows from there)
+LOCAL_IVF_MIN_ROWS = int(os.getenv("LOCAL_IVF_MIN_ROWS", "5000"))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+# "int8" (4x smaller) or "binary" (32x smaller) codes for the first pass of a search, "none" scans the float32 matrix
+LOCAL_QUANTIZATION = os.getenv("LOCAL_QUANTIZATION", "none")
+# With codes, the best k * this many candidates are rescored against the exact float32 vectors
+# (1 bit per dimension ties a lot, binary needs a much longer shortlist than int8 for the same recall)
+RESCORE_FACTORS = {"int8": 4, "binary": 40}
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", "0")) or None
+QUANTIZATIONS = ("none", "int8", "binary")
+# Codes are decoded ~1MB at a time while scanning, small enough to stay in the CPU cache
+# (bigger blocks made the int8 scan slower than just scanning the float32 matrix)
+SCAN_BLOCK_BYTES = 1 << 20
+BUILD_BLOCK_ROWS = 8192
+
+# Set bits of every byte, for NumPy versions without 'np.bitwise_count' (added in 2.0)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    # Unit length rows, so a plain dot product is the cosine similarity
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def train_ivf(matrix: np.ndarray, lists: int, iterations: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means on (a sample of) the unit vectors, returns (centroids, list of every row).
+    Good enough for a vault, the exact centroids matter much less than scanning a few % of the rows.
+    """
+    rng = np.random.default_rng(seed)
+    sample = matrix[np.sort(rng.choice(len(matrix), size=min(len(matrix), lists * 40), replace=False))]
+    centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(lists):
+            members = sample[assignment == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+
+    # Assigning the full matrix in blocks, so memory stays flat for big vaults
+    assignment = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), 8192):
+        assignment[start : start + 8192] = np.argmax(matrix[start : start + 8192] @ centroids.T, axis=1)
+    return centroids, assignment
+
+
+def popcount_rows(bits: np.ndarray) -> np.ndarray:
+    # No. of set bits in each row of a packed uint8 matrix
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+
+def quantize_int8(block: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    # Symmetric scalar quantization, every dimension gets its own step so none of the 255 levels go to waste
+    return np.clip(np.rint(block / scales), -127, 127).astype(np.int8)
+
+
+def quantize_binary(block: np.ndarray) -> np.ndarray:
+    # 1 bit per dimension (its sign), Hamming distance between two codes tracks the angle between the vectors
+    return np.packbits(block > 0, axis=-1)
+
+
+class LocalIndex:
+    """
+    Embedded vector index living in one folder, no server & no network hop:
+        chunks.sqlite          -> source of truth, chunk id / text / metadata / raw vector
+        vectors-<gen>.npy      -> unit float32 matrix, memory-mapped by readers (so opening is ~free)
+        rows-<gen>.npy         -> matrix row -> SQLite rowid, for fetching the text of the top hits
+        ivf-<gen>.npz          -> optional cluster offsets, only for vaults over LOCAL_IVF_MIN_ROWS chunks
+        codes-<gen>.npy        -> optional int8 / binary codes of the matrix (LOCAL_QUANTIZATION), scanned instead
+                                  of the floats, the few best candidates are then rescored from the float32 file
+        scales-<gen>.npy       -> per-dimension steps of the int8 codes
+        index.json             -> points at the current generation, swapped atomically by 'flush()'
+    Writers ('upsert' / 'delete') only touch SQLite, 'flush()' then rebuilds the matrix in one go.
+    Readers pick up a new generation on their next search, without being restarted.
+    A snapshot folder (see 'functions/snapshot.py') is opened read-only.
+    """
+
+    def __init__(
+        self,
+        path: str = LOCAL_INDEX_PATH,
+        nprobe: int = LOCAL_IVF_NPROBE,
+        ivf_min_rows: int = LOCAL_IVF_MIN_ROWS,
+        quantization: str = LOCAL_QUANTIZATION,
+        rescore_factor: int | None = LOCAL_RESCORE_FACTOR,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.path = path
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.quantization = quantization # Only used when building, readers follow whatever the header says
+        self.rescore_factor = rescore_factor # None -> RESCORE_FACTORS of the codes the index was built with
+        self._lock = threading.Lock()
+
+        self.read_only = is_snapshot(path)
+        if self.read_only:
+            # Nothing to create or recover, the tables are there & nobody else writes them
+            self._conn = connect_sqlite(os.path.join(path, "chunks.sqlite"), read_only=True)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._conn = connect_sqlite(os.path.join(path, "chunks.sqlite"))
+            self._conn.execute("PRAGMA journal_mode=WAL") # Lets ingest write while the server keeps searching
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT, metadata TEXT, vector BLOB)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+
+        self._header_mtime = None
+        self._matrix = None
+        self._rows = None
+        self._centroids = None
+        self._offsets = None
+        self._codes = None
+        self._scales = None
+        self._code_kind = "none"
+
+    # ---------- Writing ----------
+
+    def _bump_generation(self):
+        self._conn.execute(
+            "INSERT INTO info (key, value) VALUES ('generation', '1')"
+            " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def upsert(self, ids: list[str], texts: list[str], metadatas: list[dict], vectors: list[list[float]]):
+        if not ids:
+            return
+        with self._lock:
+            # 'ON CONFLICT ... UPDATE' keeps the rowid, so a built matrix still points at the right chunk
+            self._conn.executemany(
+                "INSERT INTO chunks (id, text, metadata, vector) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET text = excluded.text, metadata = excluded.metadata, vector = excluded.vector",
+                [
+                    (chunk_id, text, json.dumps(metadata or {}), np.asarray(vector, dtype=np.float32).tobytes())
+                    for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, vectors)
+                ],
+            )
+            self._bump_generation()
+            self._conn.commit()
+
+    def delete(self, ids: list[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self._bump_generation()
+            self._conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._bump_generation()
+            self._conn.commit()
+
+    def count(self) -> int:
+        # Chunks written so far, including the ones not flushed into the matrix yet
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def iter_chunks(self, batch_size: int = 1000):
+        # Every stored chunk as (ids, texts, metadatas) batches, e.g. to backfill the keyword index
+        cursor = self._conn.cursor()
+        cursor.execute("SELECT id, text, metadata FROM chunks ORDER BY row")
+        while batch := cursor.fetchmany(batch_size):
+            yield [row[0] for row in batch], [row[1] for row in batch], [json.loads(row[2]) for row in batch]
+
+    def _generation(self) -> int:
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _read_header(self) -> dict | None:
+        try:
+            with open(os.path.join(self.path, "index.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self) -> bool:
+        # New writes since the last build, or the codes were built with another LOCAL_QUANTIZATION
+        header = self._read_header()
+        return header is None or header["generation"] != self._generation() or header.get("quantization", "none") != self.quantization
+
+    def flush(self) -> bool:
+        """
+        Rebuilds the memory-mapped matrix from SQLite if anything changed since the last build.
+        Returns whether a new generation was written.
+        """
+        with self._lock:
+            generation = self._generation()
+            if not self.is_stale():
+                return False
+
+            count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            first = self._conn.execute("SELECT vector FROM chunks LIMIT 1").fetchone()
+            dim = len(first[0]) // 4 if first else 0
+
+            files = {"vectors": None, "rows": None, "ivf": None, "codes": None, "scales": None}
+            if count:
+                files = self._build(generation, count, dim)
+
+            # Swapping the header last, a reader sees either the old generation or the complete new one
+            header_path = os.path.join(self.path, "index.json")
+            with open(header_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"generation": generation, "count": count, "dim": dim, "quantization": self.quantization, **files}, f)
+            os.replace(header_path + ".tmp", header_path)
+
+            # Old generations can go, readers still using them keep their mapping until they reload
+            keep = set(files.values())
+            for name in os.listdir(self.path):
+                if name.startswith(("vectors-", "rows-", "ivf-", "codes-", "scales-", "staging-")) and name not in keep:
+                    try:
+                        os.remove(os.path.join(self.path, name))
+                    except OSError:
+                        pass
+            return True
+
+    def _build(self, generation: int, count: int, dim: int):
+        # Streaming the vectors straight into the new file, the whole vault never sits in RAM twice
+        vectors_name = f"vectors-{generation}.npy"
+        rows_name = f"rows-{generation}.npy"
+        ivf = count >= self.ivf_min_rows
+        # With IVF the rows are reordered afterwards, into the final file, so they are first written to a staging one
+        staging_path = os.path.join(self.path, f"staging-{generation}.npy" if ivf else vectors_name)
+        matrix = np.lib.format.open_memmap(staging_path, mode="w+", dtype=np.float32, shape=(count, dim))
+        rows = np.empty(count, dtype=np.int64)
+        cursor = self._conn.execute("SELECT row, vector FROM chunks ORDER BY row")
+        i = 0
+        while batch := cursor.fetchmany(4096):
+            block = np.frombuffer(b"".join(blob for _, blob in batch), dtype=np.float32).reshape(len(batch), dim)
+            matrix[i : i + len(batch)] = normalize_rows(block)
+            rows[i : i + len(batch)] = [row for row, _ in batch]
+            i += len(batch)
+
+        ivf_name = None
+        if ivf:
+            # Reordering the matrix cluster by cluster, so each probed cluster is one contiguous slice
+            centroids, assignment = train_ivf(matrix, lists=int(2 * np.sqrt(count)))
+            order = np.argsort(assignment, kind="stable")
+            # Copied block by block, peak memory stays at one block whatever the size of the vault
+            ordered = np.lib.format.open_memmap(os.path.join(self.path, vectors_name), mode="w+", dtype=np.float32, shape=(count, dim))
+            for start in range(0, count, BUILD_BLOCK_ROWS):
+                ordered[start : start + BUILD_BLOCK_ROWS] = matrix[order[start : start + BUILD_BLOCK_ROWS]]
+            del matrix
+            os.remove(staging_path)
+            matrix = ordered
+            rows = rows[order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+            ivf_name = f"ivf-{generation}.npz"
+            np.savez(os.path.join(self.path, ivf_name), centroids=centroids, offsets=offsets)
+
+        codes_name, scales_name = None, None
+        if self.quantization != "none":
+            codes_name, scales_name = self._build_codes(generation, matrix)
+
+        matrix.flush()
+        del matrix
+        np.save(os.path.join(self.path, rows_name), rows)
+        return {"vectors": vectors_name, "rows": rows_name, "ivf": ivf_name, "codes": codes_name, "scales": scales_name}
+
+    def _build_codes(self, generation: int, matrix: np.ndarray):
+        # Written from the final (possibly IVF reordered) matrix, so codes & floats share row positions
+        count, dim = matrix.shape
+        codes_name, scales_name = f"codes-{generation}.npy", None
+        if self.quantization == "int8":
+            scales = np.zeros(dim, dtype=np.float32)
+            for start in range(0, count, BUILD_BLOCK_ROWS):
+                np.maximum(scales, np.abs(matrix[start : start + BUILD_BLOCK_ROWS]).max(axis=0), out=scales)
+            scales = np.maximum(scales, 1e-12) / 127
+            scales_name = f"scales-{generation}.npy"
+            np.save(os.path.join(self.path, scales_name), scales)
+            shape, dtype, encode = (count, dim), np.int8, lambda block: quantize_int8(block, scales)
+        else:
+            shape, dtype, encode = (count, (dim + 7) // 8), np.uint8, quantize_binary
+        codes = np.lib.format.open_memmap(os.path.join(self.path, codes_name), mode="w+", dtype=dtype, shape=shape)
+        for start in range(0, count, BUILD_BLOCK_ROWS):
+            codes[start : start + BUILD_BLOCK_ROWS] = encode(matrix[start : start + BUILD_BLOCK_ROWS])
+        codes.flush()
+        return codes_name, scales_name
+
+    # ---------- Searching ----------
+
+    def _maybe_reload(self):
+        # One 'stat' per search, a finished ingest is picked up without restarting the server
+        header_path = os.path.join(self.path, "index.json")
+        try:
+            stat = os.stat(header_path)
+        except FileNotFoundError:
+            return
+        # 'os.replace' gives the header a new inode, even when two flushes share a timestamp
+        mtime = (stat.st_ino, stat.st_mtime_ns)
+        if mtime == self._header_mtime:
+            return
+
+        header = self._read_header()
+        if header is None:
+            return
+        if header["count"]:
+            self._matrix = np.load(os.path.join(self.path, header["vectors"]), mmap_mode="r")
+            self._rows = np.load(os.path.join(self.path, header["rows"]), mmap_mode="r")
+        else:
+            self._matrix, self._rows = None, None
+        self._centroids, self._offsets = None, None
+        self._codes, self._scales, self._code_kind = None, None, "none"
+        if header.get("codes"):
+            # Only the codes get scanned, the float32 file is touched for the rescored candidates alone
+            self._codes = np.load(os.path.join(self.path, header["codes"]), mmap_mode="r")
+            self._code_kind = header["quantization"]
+            if header.get("scales"):
+                self._scales = np.load(os.path.join(self.path, header["scales"]))
+        if header["ivf"]:
+            with np.load(os.path.join(self.path, header["ivf"])) as ivf:
+                self._centroids, self._offsets = ivf["centroids"], ivf["offsets"]
+        self._header_mtime = mtime
+
+    def __len__(self):
+        with self._lock:
+            self._maybe_reload()
+            return 0 if self._matrix is None else len(self._matrix)
+
+    def warm(self):
+        # Maps the index & reads what a search scans once, so the first question after a
+        # (container) start doesn't wait on the disk for every page of it
+        with self._lock:
+            self._maybe_reload()
+            scanned = self._codes if self._codes is not None else self._matrix
+            if scanned is None:
+                return
+            for start in range(0, len(scanned), BUILD_BLOCK_ROWS):
+                np.asarray(scanned[start : start + BUILD_BLOCK_ROWS]).max()
+
+    def _scan(self, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        # First-pass scores of rows [start, end), higher is better, from the codes when there are any
+        if self._code_kind == "none":
+            return self._matrix[start:end] @ query
+        scores = np.empty(end - start, dtype=np.float32)
+        if self._code_kind == "int8":
+            # Folding the steps into the query, each block is then one int8 -> float32 cast & a matrix-vector product
+            scaled = query * self._scales
+            rows = max(64, SCAN_BLOCK_BYTES // (4 * self._codes.shape[1]))
+            for block in range(start, end, rows):
+                stop = min(end, block + rows)
+                scores[block - start : stop - start] = self._codes[block:stop].astype(np.float32) @ scaled
+        else:
+            bits = quantize_binary(query)
+            rows = max(64, SCAN_BLOCK_BYTES // self._codes.shape[1])
+            for block in range(start, end, rows):
+                stop = min(end, block + rows)
+                scores[block - start : stop - start] = -popcount_rows(self._codes[block:stop] ^ bits)
+        return scores
+
+    def _candidates(self, query: np.ndarray):
+        # Yields (first row, scores) per scanned slice of the matrix
+        if self._centroids is None:
+            yield 0, self._scan(0, len(self._matrix), query)
+            return
+        probes = np.argsort(self._centroids @ query)[::-1][: self.nprobe]
+        for cluster in probes:
+            start, end = self._offsets[cluster], self._offsets[cluster + 1]
+            if end > start:
+                yield start, self._scan(start, end, query)
+
+    def search(self, query_vector: list[float], k: int = 4) -> list[tuple[str, str, dict, float]]:
+        """
+        Top 'k' chunks by cosine similarity, as (chunk id, text, metadata, score), best first.
+        """
+        with self._lock:
+            self._maybe_reload()
+            if self._matrix is None or k <= 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+
+            # Approximate codes keep a wider shortlist, which is then rescored exactly
+            shortlist = k if self._code_kind == "none" else k * (self.rescore_factor or RESCORE_FACTORS[self._code_kind])
+            positions, scores = [], []
+            for start, part in self._candidates(query):
+                # 'argpartition' finds the top k without sorting the whole slice
+                top = np.argpartition(-part, shortlist - 1)[:shortlist] if len(part) > shortlist else np.arange(len(part))
+                positions.append(top + start)
+                scores.append(part[top])
+            if not positions:
+                return []
+            positions, scores = np.concatenate(positions), np.concatenate(scores)
+            if self._code_kind != "none":
+                positions = positions[np.argsort(-scores)[:shortlist]]
+                # Sorted reads, the rows come out of the memory-mapped float32 file in disk order
+                positions.sort()
+                scores = self._matrix[positions] @ query
+            best = np.argsort(-scores)[:k]
+
+            rows = [int(row) for row in self._rows[positions[best]]]
+            found = {
+                row: (chunk_id, text, metadata)
+                for row, chunk_id, text, metadata in self._conn.execute(
+                    f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows
+                )
+            }
+            # Rows missing from SQLite were deleted by an ingest that hasn't flushed yet
+            return [
+                (found[row][0], found[row][1], json.loads(found[row][2]), float(score))
+                for row, score in zip(rows, scores[best])
+                if row in found
+            ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
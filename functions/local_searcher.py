@@ -0,0 +1,171 @@
+# Embedded Local Index, no server & no network hop for the search itself
+# Written by 'ingest.py --backend local', selected with 'VECTOR_BACKEND=local'.
+
+import os
+import asyncio
+import threading
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from .embedding_cache import get_embeddings
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion, SEARCH_MODE, HYBRID_POOL
+from .link_graph import LinkGraph, LINK_GRAPH_NAME, LINK_EXPANSION, expand_links
+from .local_index import LocalIndex, LOCAL_INDEX_PATH
+from .lru_cache import LRUCache, QueryEmbeddingCache
+from .metrics import span, ERRORS
+from .context_builder import build_context
+from .shards import DEFAULT_SHARD, shard_names, select_shards, shard_dir, fan_out, afan_out
+
+load_dotenv()
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+query_cache = LRUCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+
+# Same model as 'ingest.py', the query has to land in the same vector space as the chunks
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+
+# One index per shard (see 'shards.py'), opened on its first search, all sharing the same query embeddings
+_indexes = {}
+_lexical_indexes = {}
+_link_graphs = {}
+_embeddings = None
+_query_batcher = None
+_lock = threading.Lock()
+
+def _get_embeddings():
+    global _embeddings, _query_batcher
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                embeddings = get_embeddings(EMBEDDING_MODEL, batch_queries=True)
+                _query_batcher = embeddings.embeddings # Concurrent questions share one embedding call
+                _embeddings = QueryEmbeddingCache(embeddings, query_cache)
+    return _embeddings
+
+def get_index(shard: str = DEFAULT_SHARD) -> LocalIndex:
+    index = _indexes.get(shard)
+    if index is None:
+        with _lock:
+            index = _indexes.get(shard)
+            if index is None:
+                # Opening only maps the files, the OS pages in what the searches actually touch
+                index = _indexes[shard] = LocalIndex(shard_dir(LOCAL_INDEX_PATH, shard))
+    return index
+
+def get_lexical_index(shard: str = DEFAULT_SHARD) -> LexicalIndex:
+    # Keyword index written by 'ingest.py --backend local', only opened in hybrid mode
+    index = _lexical_indexes.get(shard)
+    if index is None:
+        with _lock:
+            index = _lexical_indexes.get(shard)
+            if index is None:
+                index = _lexical_indexes[shard] = LexicalIndex(os.path.join(shard_dir(LOCAL_INDEX_PATH, shard), "lexical.sqlite"))
+    return index
+
+def get_link_graph(shard: str = DEFAULT_SHARD) -> LinkGraph:
+    # Wikilink graph written by 'ingest.py' next to the index, only opened when 'LINK_EXPANSION' is on
+    graph = _link_graphs.get(shard)
+    if graph is None:
+        with _lock:
+            graph = _link_graphs.setdefault(shard, LinkGraph(os.path.join(shard_dir(LOCAL_INDEX_PATH, shard), LINK_GRAPH_NAME)))
+    return graph
+
+def reset_index():
+    global _embeddings, _query_batcher
+    with _lock:
+        for index in [*_indexes.values(), *_lexical_indexes.values()]:
+            index.close()
+        _indexes.clear()
+        _lexical_indexes.clear()
+        _link_graphs.clear()
+        _embeddings, _query_batcher = None, None
+    query_cache.clear()
+
+def cache_stats() -> dict:
+    stats = {"query_embeddings": query_cache.stats()}
+    if _query_batcher is not None:
+        stats["query_batcher"] = _query_batcher.stats()
+    return stats
+
+def _to_documents(hits, shard: str) -> list[Document]:
+    # The score (& shard) ride along in the metadata, so results of several shards can be merged
+    return [
+        Document(id=chunk_id, page_content=text, metadata={**metadata, "score": score, "shard": shard})
+        for chunk_id, text, metadata, score in hits
+    ]
+
+def _search(shard: str, query: str, query_vector: list[float], top_k: int) -> list[Document]:
+    index = get_index(shard)
+    if SEARCH_MODE != "hybrid":
+        return _to_documents(index.search(query_vector, k=top_k), shard)
+    # Hybrid: exact terms (ticket IDs, hostnames...) come from the keyword index, meaning from the vectors
+    pool = top_k * HYBRID_POOL
+    return reciprocal_rank_fusion(
+        [_to_documents(index.search(query_vector, k=pool), shard), get_lexical_index(shard).search(query, k=pool)], top_k
+    )
+
+def embed_query(query: str) -> list[float]:
+    return _get_embeddings().embed_query(query)
+
+def retrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    if query_vector is None:
+        query_vector = embed_query(query)
+    shards = select_shards(shards)
+    docs = fan_out(lambda shard: _search(shard, query, query_vector, top_k), shards, top_k)
+    # The notes linked with the hits come from the in-memory graph, no extra search
+    return expand_links(docs, shards, get_link_graph, get_lexical_index) if LINK_EXPANSION else docs
+
+async def aembed_query(query: str) -> list[float]:
+    return await _get_embeddings().aembed_query(query)
+
+async def aretrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    if query_vector is None:
+        query_vector = await aembed_query(query)
+    shards = select_shards(shards)
+    # Always on a thread: hybrid mode also queries SQLite, & so does the link expansion below
+    if len(shards) == 1:
+        docs = await asyncio.to_thread(_search, shards[0], query, query_vector, top_k)
+    else:
+        # Several shards: each one scans its own matrix on a thread (NumPy releases the GIL), all at once
+        docs = await afan_out(lambda shard: asyncio.to_thread(_search, shard, query, query_vector, top_k), shards, top_k)
+    if LINK_EXPANSION:
+        docs = await asyncio.to_thread(expand_links, docs, shards, get_link_graph, get_lexical_index)
+    return docs
+
+def warm():
+    _get_embeddings()
+    for shard in shard_names():
+        get_index(shard).warm()
+        if SEARCH_MODE == "hybrid" or LINK_EXPANSION:
+            len(get_lexical_index(shard))
+        if LINK_EXPANSION:
+            get_link_graph(shard).neighbors([], 0) # Loads the arrays
+
+async def aopen():
+    # Mapping & reading every shard's index at startup (on a thread, the server already answers meanwhile),
+    # so the first question doesn't pay for it
+    await asyncio.to_thread(warm)
+
+async def aclose():
+    pass
+
+def format_context(results: list[Document]) -> str:
+    if not results:
+        return "No relevant notes found in the Vault"
+    return "\n\n".join([f"[Source: {doc.metadata.get('source','Unknown')}]\n{doc.page_content}" for doc in results])
+
+def search_notes(query: str, top_k: int = 4, shards: list[str] | None = None) -> str:
+    try:
+        # Timed stage by stage, like the server, to see where a slow answer comes from
+        with span("embed_query"):
+            query_vector = embed_query(query)
+        with span("vector_search"):
+            docs = retrieve(query, top_k=top_k, query_vector=query_vector, shards=shards)
+        with span("format_context"):
+            return format_context(build_context(docs))
+    except Exception as e:
+        ERRORS.labels("search_notes").inc()
+        return f"Error Searching Vault: {str(e)}"
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+from collections import Counter
+
+# Bumping this forces every note to be re-embedded on the next run
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: str) -> str:
+    # Reading in blocks so that huge notes (or pasted logs) don't spike memory
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(rel_path: str, section: str, index: int, text: str) -> str:
+    """
+    Stable ID for a chunk: '<path hash>-<section hash>-<index in its section>-<content hash>'.
+    Same note + same section + same position in it + same text always gives the same ID, so upserts are idempotent,
+    & adding or removing a section elsewhere in the note doesn't change it.
+    It's pure ASCII, which keeps it valid for both Chroma & Pinecone.
+    """
+    path_hash = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:16]
+    section_hash = hashlib.sha1(section.encode("utf-8")).hexdigest()[:8]
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return f"{path_hash}-{section_hash}-{index:03d}-{text_hash}"
+
+
+def make_chunk_ids(rel_path: str, chunks) -> list[str]:
+    """
+    IDs of a note's chunks, as split by 'MarkdownSectionSplitter' ('section' & 'section_chunk' metadata).
+    A section is its heading path & which occurrence of that path it is, two '## Notes' in one note stay apart.
+    """
+    occurrences = Counter()
+    chunk_ids = []
+    for chunk in chunks:
+        heading = chunk.metadata.get("section", "")
+        index = chunk.metadata.get("section_chunk", 0)
+        if index == 0:
+            occurrences[heading] += 1
+        chunk_ids.append(make_chunk_id(rel_path, f"{heading}\x00{occurrences[heading]}", index, chunk.page_content))
+    return chunk_ids
+
+
+class Manifest:
+    """
+    Persistent record of what has been embedded from the vault.
+    Maps each note (relative to the vault) to its mtime, size, content hash & chunk IDs,
+    & the 'chunking' it was split with: a note split another way is re-split even if it didn't change.
+    """
+
+    def __init__(self, path: str, files: dict | None = None, chunking: str | None = None):
+        self.path = path
+        self.files = files if files is not None else {}
+        self.chunking = chunking
+
+    @classmethod
+    def load(cls, path: str, chunking: str | None = None) -> "Manifest":
+        if not os.path.exists(path):
+            return cls(path, chunking=chunking)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"    ⚠️ Manifest at '{path}' is unreadable ({e}), starting fresh.")
+            return cls(path, chunking=chunking)
+
+        if data.get("version") != MANIFEST_VERSION:
+            print("    ⚠️ Manifest version changed, every note will be re-embedded.")
+            return cls(path, chunking=chunking)
+        return cls(path, data.get("files", {}), chunking)
+
+    def save(self):
+        # Writing to a temp file first & swapping it in, so a crash never leaves half a manifest
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def chunk_ids(self, rel_path: str) -> list[str]:
+        entry = self.files.get(rel_path)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, rel_path: str, mtime: float, size: int, content_hash: str, chunk_ids: list[str]):
+        self.files[rel_path] = {
+            "mtime": mtime,
+            "size": size,
+            "hash": content_hash,
+            "chunk_ids": list(chunk_ids),
+            "chunking": self.chunking,
+        }
+
+    def forget(self, rel_path: str):
+        self.files.pop(rel_path, None)
+
+    def check(self, rel_path: str, abs_path: str):
+        """
+        Compares one note on disk against the manifest, returns (status, mtime, size, content_hash):
+            "unchanged" -> mtime & size match, trusted without reading the note (what makes a no-op run fast)
+            "touched"   -> only the stat info moved (e.g. a 'touch'), the content hash is identical
+            "changed"   -> new or edited note (or one split with another chunking), needs to be (re-)embedded
+        It never modifies the manifest, so it is safe to call from a pipeline thread.
+        """
+        stat = os.stat(abs_path)
+        entry = self.files.get(rel_path)
+        if entry and self.chunking is not None and entry.get("chunking") != self.chunking:
+            # Its old chunk IDs stay in the entry, so they still get deleted once it's re-split
+            return "changed", stat.st_mtime, stat.st_size, hash_file(abs_path)
+
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return "unchanged", stat.st_mtime, stat.st_size, entry["hash"]
+
+        content_hash = hash_file(abs_path)
+        if entry and entry["hash"] == content_hash:
+            return "touched", stat.st_mtime, stat.st_size, content_hash
+        return "changed", stat.st_mtime, stat.st_size, content_hash
+
+    def touch(self, rel_path: str, mtime: float, size: int):
+        entry = self.files[rel_path]
+        entry["mtime"] = mtime
+        entry["size"] = size
+
+    def removed(self, seen: set[str]) -> list[str]:
+        # Notes in the manifest that weren't seen on disk during this run
+        return [rel_path for rel_path in self.files if rel_path not in seen]
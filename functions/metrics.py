@@ -0,0 +1,197 @@
+import re
+import time
+import threading
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency buckets, from sub-millisecond searches up to slow, retried answers
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_NAME_REGEX = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: dict | None = None) -> str:
+    pairs = [(name, value) for name, value in zip(names, values)] + list((extra or {}).items())
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last one is '+Inf'
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> "Span":
+        return Span(self)
+
+
+class Span:
+    """
+    Times a 'with' block into a histogram, the whole cost is two 'perf_counter' calls & a bisect.
+    'elapsed' is kept, so the caller can also log it (like ingest does per batch).
+    """
+
+    __slots__ = ("child", "started", "elapsed")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started
+        self.child.observe(self.elapsed)
+        return False
+
+
+class _Metric:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        # Resolve it once at import time & keep the child, then the hot path never touches this dict
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}" for values, child in sorted(self._children.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = []
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, {'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    A minimal Prometheus registry: recording costs about a microsecond, all the formatting
+    happens in 'render()', i.e. only when something actually scrapes '/metrics'.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = [] # Callables returning {name: value}, read at scrape time (e.g. cache stats)
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            for name, value in collect().items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def flatten_stats(prefix: str, stats: dict) -> dict:
+    # The '/stats' dictionaries as Prometheus gauges, e.g. {"answers": {"hits": 3}} -> obsrag_answers_hits 3
+    flat = {}
+    for key, value in stats.items():
+        # Only [a-zA-Z0-9_] is allowed in a name, e.g. the batch size bucket "<=8" becomes "le_8"
+        name = METRIC_NAME_REGEX.sub("_", f"{prefix}_{str(key).replace('<=', 'le_').replace('>', 'gt_')}")
+        if isinstance(value, dict):
+            flat.update(flatten_stats(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "obsrag_stage_seconds", "Time spent in each stage of answering a question or ingesting a batch", ["stage"]
+)
+REQUEST_SECONDS = REGISTRY.histogram("obsrag_request_seconds", "End-to-end time of a request", ["endpoint"])
+RETRIES = REGISTRY.counter("obsrag_retries_total", "Upstream calls retried, by stage", ["stage"])
+RATE_LIMITED = REGISTRY.counter("obsrag_rate_limited_total", "429 / ResourceExhausted errors, by stage", ["stage"])
+ERRORS = REGISTRY.counter("obsrag_errors_total", "Failed stages (e.g. a vector store error)", ["stage"])
+CACHE_LOOKUPS = REGISTRY.counter("obsrag_cache_lookups_total", "Cache lookups, by cache & result", ["cache", "result"])
+
+
+def span(stage: str) -> Span:
+    """with span("vector_search"): ...  times the block into 'obsrag_stage_seconds{stage=...}'."""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def stage_summary() -> dict[str, tuple[int, float]]:
+    # stage -> (no. of spans, total seconds), for scripts that print their timings instead of being scraped
+    return {values[0]: (child.count, child.sum) for values, child in STAGE_SECONDS._children.items() if child.count}
@@ -2,40 +2,171 @@
 # This file uses local ChromaDB. 
 # For Production (Pinecone), see 'pinecone_searcher.py'.
 
+import os
+import asyncio
+import threading
+
 # Importing the Environment Variables
 from dotenv import load_dotenv
 
 # Importing the Langchain Modules
+from langchain_core.documents import Document
 from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from .embedding_cache import get_embeddings
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion, SEARCH_MODE, HYBRID_POOL
+from .link_graph import LinkGraph, LINK_GRAPH_NAME, LINK_EXPANSION, expand_links
+from .lru_cache import LRUCache, QueryEmbeddingCache
+from .metrics import span, ERRORS
+from .context_builder import build_context
+from .shards import DEFAULT_SHARD, shard_names, select_shards, shard_dir, fan_out, afan_out
 
 load_dotenv() # Added to load the relevant variables in .env
 
-# Hardcoding models so that no errors arise in the fututre
-embeddings = GoogleGenerativeAIEmbeddings(
-    model="models/gemini-embedding-001",
-    transport="rest" # Added for Network Stability with WSL
-)
+# Recent questions -> their embeddings, so popular questions skip the embedding call
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+query_cache = LRUCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+
+# One Chroma client per shard (see 'shards.py'), opened on its first search & shared by every request
+_vector_dbs = {}
+_lexical_indexes = {}
+_link_graphs = {}
+_embeddings = None
+_query_batcher = None
+_vector_db_lock = threading.Lock()
+
+def _get_embeddings():
+    global _embeddings, _query_batcher
+    if _embeddings is None:
+        with _vector_db_lock:
+            if _embeddings is None:
+                # Hardcoding models so that no errors arise in the fututre
+                # On-disk cache for every embedding, plus the in-memory LRU for recent questions
+                embeddings = get_embeddings(
+                    "models/gemini-embedding-001",
+                    batch_queries=True, # Concurrent questions share one embedding call
+                    transport="rest" # Added for Network Stability with WSL
+                )
+                _query_batcher = embeddings.embeddings
+                _embeddings = QueryEmbeddingCache(embeddings, query_cache)
+    return _embeddings
+
+def get_vector_db(shard: str = DEFAULT_SHARD):
+    vector_db = _vector_dbs.get(shard)
+    if vector_db is None:
+        embeddings = _get_embeddings()
+        with _vector_db_lock:
+            # Checking again inside the lock, another request may have opened it meanwhile
+            vector_db = _vector_dbs.get(shard)
+            if vector_db is None:
+                vector_db = _vector_dbs[shard] = Chroma(
+                    persist_directory=shard_dir("./chroma_db", shard),
+                    embedding_function=embeddings
+                )
+    return vector_db
+
+def get_lexical_index(shard: str = DEFAULT_SHARD) -> LexicalIndex:
+    # Keyword index written by 'ingest.py' next to the Chroma files, only opened in hybrid mode
+    index = _lexical_indexes.get(shard)
+    if index is None:
+        with _vector_db_lock:
+            index = _lexical_indexes.get(shard)
+            if index is None:
+                index = _lexical_indexes[shard] = LexicalIndex(os.path.join(shard_dir("./chroma_db", shard), "lexical.sqlite"))
+    return index
+
+def get_link_graph(shard: str = DEFAULT_SHARD) -> LinkGraph:
+    # Wikilink graph written by 'ingest.py' next to the Chroma files, only opened when 'LINK_EXPANSION' is on
+    graph = _link_graphs.get(shard)
+    if graph is None:
+        with _vector_db_lock:
+            graph = _link_graphs.setdefault(shard, LinkGraph(os.path.join(shard_dir("./chroma_db", shard), LINK_GRAPH_NAME)))
+    return graph
+
+def reset_vector_db():
+    # Drops the shared clients & the query cache, mainly for tests (or after a '--rebuild')
+    global _embeddings, _query_batcher
+    with _vector_db_lock:
+        _vector_dbs.clear()
+        _lexical_indexes.clear()
+        _link_graphs.clear()
+        _embeddings = None
+        _query_batcher = None
+    query_cache.clear()
+
+def cache_stats() -> dict:
+    stats = {"query_embeddings": query_cache.stats()}
+    if _query_batcher is not None:
+        stats["query_batcher"] = _query_batcher.stats()
+    return stats
+
+def embed_query(query: str) -> list[float]:
+    # Goes through the query LRU, so asking it again (e.g. inside 'retrieve') is free
+    return _get_embeddings().embed_query(query)
+
+def _search(shard: str, query: str, query_vector: list[float], top_k: int) -> list[Document]:
+    # Chroma gives a distance (lower is closer), negated so that like the other searchers a higher score is better
+    def vector_search(k):
+        found = get_vector_db(shard).similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+        return [Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "score": -distance, "shard": shard}) for doc, distance in found]
+    if SEARCH_MODE != "hybrid":
+        return vector_search(top_k)
+    pool = top_k * HYBRID_POOL
+    return reciprocal_rank_fusion([vector_search(pool), get_lexical_index(shard).search(query, k=pool)], top_k)
+
+def retrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    # Same as the Pinecone searcher, the top 'top_k' chunks as Documents (with their chunk IDs)
+    if query_vector is None:
+        query_vector = embed_query(query)
+    shards = select_shards(shards)
+    docs = fan_out(lambda shard: _search(shard, query, query_vector, top_k), shards, top_k)
+    # The notes linked with the hits come from the in-memory graph, no extra search
+    return expand_links(docs, shards, get_link_graph, get_lexical_index) if LINK_EXPANSION else docs
+
+async def aembed_query(query: str) -> list[float]:
+    return await _get_embeddings().aembed_query(query)
+
+async def aretrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    # Non-blocking twin of 'retrieve' (Chroma runs the local query on a worker thread, one per shard)
+    if query_vector is None:
+        query_vector = await aembed_query(query)
+    shards = select_shards(shards)
+    docs = await afan_out(lambda shard: asyncio.to_thread(_search, shard, query, query_vector, top_k), shards, top_k)
+    if LINK_EXPANSION:
+        # Reads the keyword index (SQLite) for the linked chunks' texts, kept off the event loop
+        docs = await asyncio.to_thread(expand_links, docs, shards, get_link_graph, get_lexical_index)
+    return docs
+
+async def aopen():
+    # Same startup hook as the other searchers, opening the local DBs before the first question
+    for shard in shard_names():
+        get_vector_db(shard)
+
+async def aclose():
+    pass
+
+def format_context(results: list[Document]) -> str:
+    if not results: # Empty Vault Case handled
+        return "No relevant notes found in the Vault"
+    
+    # Formatting the results into proper Citations 
+    return "\n\n".join([f"[Source: {doc.metadata.get('source','Unknown')}]\n{doc.page_content}" for doc in results])
 
 # '(query: str) -> str' Its only for the ease of understanding
-def search_notes(query: str) -> str:
+def search_notes(query: str, top_k: int = 4, shards: list[str] | None = None) -> str:
     # Give 'str' input & generate 'str' output
     try:
-        # Loading the existing DB        
-        vector_db = Chroma(
-            persist_directory="./chroma_db",
-            embedding_function=embeddings
-        )
-        
-        # Seaching the top 4 most relevant results
-        results = vector_db.similarity_search(query, k=4)
-        
-        if not results: # Empty Vault Case handled
-            return "No relevant notes found in the Vault"
-        
-        # Formatting the results into proper Citations 
-        knowledge = "\n\n".join([f"[Source: {doc.metadata.get('source','Unknown')}]\n{doc.page_content}" for doc in results])
-        return knowledge
+        # Seaching the top 'top_k' most relevant results, reusing the already opened DB
+        # Each stage is timed, so a slow answer can be pinned on the embedding or on the search
+        with span("embed_query"):
+            query_vector = embed_query(query)
+        with span("vector_search"):
+            results = retrieve(query, top_k=top_k, query_vector=query_vector, shards=shards)
+        with span("format_context"):
+            return format_context(build_context(results))
 
     except Exception as e:
-        return f"Error Searching Vault: {str(e)}"
\ No newline at end of file
+        ERRORS.labels("search_notes").inc()
+        return f"Error Searching Vault: {str(e)}"
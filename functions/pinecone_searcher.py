@@ -1,40 +1,198 @@
 import os
+import asyncio
+import threading
 
 # Importing the Langchain Modules
+from langchain_core.documents import Document
 from langchain_pinecone import PineconeVectorStore
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from pinecone import Pinecone
 
-def get_vector_store(): # Connects to the Pinecone Cloud Index
+from .embedding_cache import get_embeddings
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion, SEARCH_MODE, HYBRID_POOL, PINECONE_LEXICAL_PATH
+from .link_graph import LinkGraph, LINK_GRAPH_NAME, LINK_EXPANSION, expand_links
+from .lru_cache import LRUCache, QueryEmbeddingCache
+from .metrics import span, ERRORS
+from .context_builder import build_context
+from .shards import DEFAULT_SHARD, shard_names, select_shards, shard_file, shard_namespace, fan_out, afan_out
+
+# Recent questions -> their embeddings, so popular questions skip the embedding call
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+# Connections kept open to the Pinecone index, roughly the no. of concurrent searches we expect
+PINECONE_POOL_SIZE = int(os.getenv("PINECONE_POOL_SIZE", "8"))
+
+query_cache = LRUCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL)
+
+# One store for the whole process, created on the first search & shared by every request (& every shard)
+_vector_store = None
+_lexical_indexes = {} # shard -> its keyword index
+_link_graphs = {} # shard -> its wikilink graph
+_query_batcher = None
+_vector_store_lock = threading.Lock()
+
+def _build_vector_store(): # Connects to the Pinecone Cloud Index
+    global _query_batcher
     # Must use the same model as the Uploader Script
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+    # On-disk cache for every embedding, plus the in-memory LRU for recent questions
+    cached = get_embeddings("models/text-embedding-004", batch_queries=True)
+    _query_batcher = cached.embeddings # Concurrent questions share one embedding call
+    embeddings = QueryEmbeddingCache(cached, query_cache)
     
     PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
     if not PINECONE_INDEX_NAME:
         raise ValueError("Error: 'PINECONE_INDEX_NAME' is missing from the '.env' file.")
     
+    # A single client with a pooled HTTP connection, instead of a new handshake per question
+    client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=PINECONE_POOL_SIZE)
+    index = client.Index(PINECONE_INDEX_NAME, connection_pool_maxsize=PINECONE_POOL_SIZE)
+    
     vector_store = PineconeVectorStore(
-        index_name=PINECONE_INDEX_NAME,
+        index=index,
         embedding=embeddings,
     )
     return vector_store
 
-def search_notes(query: str, top_k: int = 4):
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            # Checking again inside the lock, another request may have built it meanwhile
+            if _vector_store is None:
+                _vector_store = _build_vector_store()
+    return _vector_store
+
+def get_lexical_index(shard: str = DEFAULT_SHARD) -> LexicalIndex:
+    # Keyword index of the chunks 'seed_pinecone.py' uploaded, only opened in hybrid mode
+    index = _lexical_indexes.get(shard)
+    if index is None:
+        with _vector_store_lock:
+            index = _lexical_indexes.get(shard)
+            if index is None:
+                index = _lexical_indexes[shard] = LexicalIndex(shard_file(PINECONE_LEXICAL_PATH, shard))
+    return index
+
+def reset_vector_store():
+    # Drops the shared store & the query cache, mainly for tests (or after changing the '.env')
+    global _vector_store, _query_batcher
+    with _vector_store_lock:
+        _vector_store = None
+        _lexical_indexes.clear()
+        _link_graphs.clear()
+        _query_batcher = None
+    query_cache.clear()
+
+def cache_stats() -> dict:
+    stats = {"query_embeddings": query_cache.stats()}
+    if _query_batcher is not None:
+        stats["query_batcher"] = _query_batcher.stats()
+    return stats
+
+def get_link_graph(shard: str = DEFAULT_SHARD) -> LinkGraph:
+    # Wikilink graph 'seed_pinecone.py' keeps next to the keyword index, only opened when 'LINK_EXPANSION' is on
+    graph = _link_graphs.get(shard)
+    if graph is None:
+        with _vector_store_lock:
+            path = os.path.join(os.path.dirname(shard_file(PINECONE_LEXICAL_PATH, shard)) or ".", LINK_GRAPH_NAME)
+            graph = _link_graphs.setdefault(shard, LinkGraph(path))
+    return graph
+
+def embed_query(query: str) -> list[float]:
+    # Goes through the query LRU, so asking it again (e.g. inside 'retrieve') is free
+    return get_vector_store().embeddings.embed_query(query)
+
+def _with_scores(found, shard: str) -> list[Document]:
+    # The score (& shard) ride along in the metadata, so results of several namespaces can be merged
+    return [Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "score": score, "shard": shard}) for doc, score in found]
+
+def _search(shard: str, query: str, query_vector: list[float], top_k: int) -> list[Document]:
+    vector_store = get_vector_store()
+    namespace = shard_namespace(shard)
+    if SEARCH_MODE != "hybrid":
+        return _with_scores(vector_store.similarity_search_by_vector_with_score(query_vector, k=top_k, namespace=namespace), shard)
+    # Hybrid: exact terms (ticket IDs, hostnames...) come from the keyword index, meaning from the vectors
+    pool = top_k * HYBRID_POOL
+    return reciprocal_rank_fusion(
+        [
+            _with_scores(vector_store.similarity_search_by_vector_with_score(query_vector, k=pool, namespace=namespace), shard),
+            get_lexical_index(shard).search(query, k=pool),
+        ],
+        top_k,
+    )
+
+async def _asearch(shard: str, query: str, query_vector: list[float], top_k: int) -> list[Document]:
+    vector_store = get_vector_store()
+    namespace = shard_namespace(shard)
+    if SEARCH_MODE != "hybrid":
+        return _with_scores(await vector_store.asimilarity_search_by_vector_with_score(query_vector, k=top_k, namespace=namespace), shard)
+    # The keyword search reads SQLite, so it runs on a thread while Pinecone is queried
+    pool = top_k * HYBRID_POOL
+    vector_hits, keyword_hits = await asyncio.gather(
+        vector_store.asimilarity_search_by_vector_with_score(query_vector, k=pool, namespace=namespace),
+        asyncio.to_thread(lambda: get_lexical_index(shard).search(query, k=pool)),
+    )
+    return reciprocal_rank_fusion([_with_scores(vector_hits, shard), keyword_hits], top_k)
+
+def retrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    """
+    Returns the 'top_k' most relevant chunks as Documents (with their chunk IDs).
+    Pass 'query_vector' if the question was already embedded, to skip embedding it again.
+    'shards' limits the search to some of the vaults (namespaces), all of them by default.
+    """
+    if query_vector is None:
+        query_vector = embed_query(query)
+    shards = select_shards(shards)
+    docs = fan_out(lambda shard: _search(shard, query, query_vector, top_k), shards, top_k)
+    # The notes linked with the hits come from the in-memory graph, not from another Pinecone query
+    return expand_links(docs, shards, get_link_graph, get_lexical_index) if LINK_EXPANSION else docs
+
+async def aembed_query(query: str) -> list[float]:
+    return await get_vector_store().embeddings.aembed_query(query)
+
+async def aretrieve(query: str, top_k: int = 4, query_vector: list[float] | None = None, shards: list[str] | None = None) -> list[Document]:
+    # Non-blocking twin of 'retrieve', for the async server, it never stalls the event loop
+    # The namespaces are queried concurrently over the pooled connection, so more vaults don't add up
+    if query_vector is None:
+        query_vector = await aembed_query(query)
+    shards = select_shards(shards)
+    docs = await afan_out(lambda shard: _asearch(shard, query, query_vector, top_k), shards, top_k)
+    if LINK_EXPANSION:
+        # Reads the keyword index (SQLite) for the linked chunks' texts, kept off the event loop
+        docs = await asyncio.to_thread(expand_links, docs, shards, get_link_graph, get_lexical_index)
+    return docs
+
+async def aopen():
+    # Keeps one async HTTP session to the index open, instead of opening one per query
+    await get_vector_store().__aenter__()
+    for shard in shard_names():
+        if SEARCH_MODE == "hybrid" or LINK_EXPANSION:
+            len(get_lexical_index(shard))
+        if LINK_EXPANSION:
+            get_link_graph(shard).neighbors([], 0) # Loads the arrays
+
+async def aclose():
+    if _vector_store is not None:
+        await _vector_store.aclose()
+
+def format_context(docs: list[Document]) -> str:
+    return "\n\n---\n\n".join([d.page_content for d in docs])
+
+def search_notes(query: str, top_k: int = 4, shards: list[str] | None = None) -> str:
     """
     Searches Pinecone for most relevant chunks.
     """
     try:
-        vecotr_store = get_vector_store()
-        retriever = vecotr_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": top_k}
-        )
-        
-        docs = retriever.invoke(query)
+        # Timed stage by stage, to tell a slow embedding from a slow Pinecone query
+        with span("embed_query"):
+            query_vector = embed_query(query)
+        with span("vector_search"):
+            docs = retrieve(query, top_k, query_vector=query_vector, shards=shards)
         
         # Format the results
-        context_text = "\n\n---\n\n".join([d.page_content for d in docs])
+        with span("format_context"):
+            context_text = format_context(build_context(docs))
         return context_text
     
     except Exception as e:
+        ERRORS.labels("search_notes").inc()
         print(f"Pinecone Error: {e}")
-        return ""
\ No newline at end of file
+        return ""
@@ -0,0 +1,106 @@
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def bounded(iterable, maxsize: int = 64):
+    """
+    Runs 'iterable' in a background thread & hands its items over through a bounded queue.
+    Chaining stages with this keeps every stage busy at once, while memory stays capped at
+    'maxsize' items per stage no matter how big the vault is.
+    Errors in the producer are re-raised in the consumer, & stopping early stops the producer.
+    """
+    handoff = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # Waiting in small steps, so a consumer that went away doesn't leave us stuck forever
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def _apply_many(fn, args):
+    # Runs inside a worker process, a few items per round-trip to keep the pickling overhead low
+    return [fn(arg) for arg in args]
+
+
+def ordered_map(fn, items, workers: int = 1, arg=lambda item: item, chunksize: int = 8):
+    """
+    Maps 'fn' over 'items' across 'workers' processes & yields (item, result) in the input order,
+    so whatever is derived from the order (like chunk IDs) stays the same for any no. of workers.
+    Only 'arg(item)' is sent to the workers, items whose arg is None are passed through with a None result.
+    At most a few chunks per worker are in flight, so a huge vault never piles up in memory.
+    'fn' must be a module-level function, so that the worker processes can import it.
+    """
+    if workers <= 1:
+        for item in items:
+            value = arg(item)
+            yield item, (fn(value) if value is not None else None)
+        return
+
+    # 'forkserver' workers start from a clean process, forking our threaded parent could deadlock them
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    window = workers * 4
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = deque() # (items, their args, future) in submission order
+
+        def submit(chunk):
+            values = [arg(item) for item in chunk]
+            work = [value for value in values if value is not None]
+            in_flight.append((chunk, values, pool.submit(_apply_many, fn, work) if work else None))
+
+        def drain_one():
+            chunk, values, future = in_flight.popleft()
+            results = iter(future.result() if future else ())
+            for item, value in zip(chunk, values):
+                yield item, (next(results) if value is not None else None)
+
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == chunksize:
+                submit(chunk)
+                chunk = []
+                if len(in_flight) >= window:
+                    yield from drain_one()
+        if chunk:
+            submit(chunk)
+        while in_flight:
+            yield from drain_one()
@@ -0,0 +1,134 @@
+import os
+import time
+import asyncio
+import inspect
+import threading
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+# A query waits at most this long for others to share its embedding call, it's ~1-5% of the call itself
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+
+# Upper bounds of the batch size histogram buckets, anything bigger lands in the last one
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class QueryBatcher(Embeddings):
+    """
+    Micro-batches the async query embeddings of concurrent requests:
+    queries arriving within 'max_wait_ms' of each other (up to 'max_batch') share one
+    'embed_documents' call, & every request gets its own vector back.
+    N users at once cost one round-trip & one request of quota instead of N.
+    Sync calls & documents go straight through, they don't come from concurrent requests.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_wait_ms: float = QUERY_BATCH_WAIT_MS, max_batch: int = QUERY_BATCH_MAX):
+        self.embeddings = embeddings
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._pending = [] # (text, future, enqueued at)
+        self._timer = None
+        self._loop = None
+        self._tasks = set()
+
+        # Google embeds documents & queries differently, the batch has to be sent as queries
+        parameters = inspect.signature(embeddings.aembed_documents).parameters
+        self._batch_kwargs = {"task_type": "RETRIEVAL_QUERY"} if "task_type" in parameters else {}
+
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.unique_texts = 0
+        self.max_batch_seen = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.size_histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        if self.max_batch <= 1:
+            return await self.embeddings.aembed_query(text)
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A new event loop (e.g. a script calling 'asyncio.run' twice), whatever waited on the old one is gone
+            self._loop, self._pending, self._timer = loop, [], None
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._dispatch()
+        elif self._timer is None:
+            # The first query of a batch starts the clock, the ones joining it later wait less
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Holding on to the task, otherwise it could be garbage collected halfway
+            task = asyncio.ensure_future(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch):
+        started = time.perf_counter()
+        # The same question asked by several users at once is only embedded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        self._record(batch, len(texts), started)
+        try:
+            vectors = await self.embeddings.aembed_documents(texts, **self._batch_kwargs)
+        except Exception as e:
+            # Every waiting request sees the error, exactly like its own call would have failed
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future, _ in batch:
+            if not future.done(): # The request may have been cancelled (client went away) meanwhile
+                future.set_result(by_text[text])
+
+    def _record(self, batch, unique: int, started: float):
+        delays = [started - enqueued for _, _, enqueued in batch]
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if len(batch) <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.unique_texts += unique
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.queue_seconds += sum(delays)
+            self.max_queue_seconds = max(self.max_queue_seconds, max(delays))
+            self.size_histogram[bucket] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            labels = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+            return {
+                "max_wait_ms": self.max_wait * 1000,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "queries": self.queries,
+                "api_calls_saved": self.queries - self.batches,
+                "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "deduplicated": self.queries - self.unique_texts,
+                "avg_queue_ms": self.queue_seconds / self.queries * 1000 if self.queries else 0.0,
+                "max_queue_ms": self.max_queue_seconds * 1000,
+                "batch_size_histogram": dict(zip(labels, self.size_histogram)),
+            }
@@ -0,0 +1,141 @@
+import os
+import re
+import time
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Defaults match the free-tier quota of the Gemini embedding models, raise them for paid tiers
+EMBED_RPM = int(os.getenv("EMBED_RPM", "100"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "30000"))
+
+RETRY_DELAY_REGEX = re.compile(r"retry (?:in|after) ([\d.]+)\s*s|seconds:\s*(\d+)", re.IGNORECASE)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    # The LangChain wrapper doesn't always re-raise Google's own exception, so checking the text too
+    # (by name, importing 'google.api_core' just for this check added ~0.2s to every startup)
+    if type(error).__name__ == "ResourceExhausted":
+        return True
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "ResourceExhausted" in message
+
+
+def retry_delay_from_error(error: Exception) -> float | None:
+    # Google tells us how long to wait ("Please retry in 23.5s" / "retry_delay { seconds: 23 }")
+    match = RETRY_DELAY_REGEX.search(str(error))
+    if not match:
+        return None
+    return float(match.group(1) or match.group(2))
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English prose, good enough for budgeting
+    return len(text) // 4 + 1
+
+
+class AdaptiveRateLimiter:
+    """
+    Token-bucket limiter (requests/min & tokens/min) with AIMD tuning:
+    - Every 'increase_after' healthy responses, batch size & parallelism grow additively.
+    - On 'ResourceExhausted' both are halved & every worker pauses for the delay Google asked for.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = EMBED_RPM,
+        tokens_per_minute: int = EMBED_TPM,
+        initial_batch_size: int = 8,
+        min_batch_size: int = 1,
+        max_batch_size: int = 100,
+        initial_concurrency: int = 2,
+        max_concurrency: int = 8,
+        increase_after: int = 5,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.increase_after = increase_after
+
+        self.batch_size = initial_batch_size
+        self.concurrency = initial_concurrency
+
+        self._lock = threading.Lock()
+        # Buckets start full, so the first requests go out immediately
+        self._request_tokens = float(requests_per_minute)
+        self._token_tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._healthy_streak = 0
+        self._consecutive_limits = 0
+
+        self.rate_limited = 0
+
+    def _refill(self, now: float):
+        if now <= self._last_refill:
+            return
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_tokens = min(self.requests_per_minute, self._request_tokens + elapsed * self.requests_per_minute / 60)
+        self._token_tokens = min(self.tokens_per_minute, self._token_tokens + elapsed * self.tokens_per_minute / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Takes one request & 'tokens' tokens out of the buckets if they are available.
+        Returns 0 on success, otherwise how many seconds to wait before asking again.
+        """
+        # A single oversized batch must still be able to go through eventually
+        tokens = min(tokens, self.tokens_per_minute)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            request_wait = max(0.0, (1 - self._request_tokens) * 60 / self.requests_per_minute)
+            token_wait = max(0.0, (tokens - self._token_tokens) * 60 / self.tokens_per_minute)
+            wait = max(request_wait, token_wait)
+            if wait > 0:
+                return wait
+
+            self._request_tokens -= 1
+            self._token_tokens -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int):
+        # Blocks the calling thread until the request fits inside the quota
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_limits = 0
+            self._healthy_streak += 1
+            if self._healthy_streak >= self.increase_after:
+                self._healthy_streak = 0
+                self.batch_size = min(self.max_batch_size, self.batch_size + 4)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def on_rate_limited(self, retry_after: float | None = None) -> float:
+        with self._lock:
+            self.rate_limited += 1
+            self._healthy_streak = 0
+            self._consecutive_limits += 1
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.concurrency = max(1, self.concurrency // 2)
+
+            # Trusting Google's own retry hint, otherwise backing off exponentially (capped at a minute)
+            cooldown = retry_after if retry_after is not None else min(60.0, 2.0 ** self._consecutive_limits)
+            self._paused_until = max(self._paused_until, time.monotonic() + cooldown)
+            # The quota is spent, so the buckets start refilling from empty after the pause
+            self._request_tokens = 0.0
+            self._token_tokens = 0.0
+            self._last_refill = self._paused_until
+            return cooldown
@@ -0,0 +1,133 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Conversations kept at once (least recently used goes first) & how long an idle one is kept
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1024"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# What a session remembers: its last turns (answers shortened) & the chunks retrieved so far
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", "6"))
+SESSION_ANSWER_CHARS = int(os.getenv("SESSION_ANSWER_CHARS", "600"))
+SESSION_MAX_CHUNKS = int(os.getenv("SESSION_MAX_CHUNKS", "24"))
+# How close (cosine similarity) a follow-up must be to the last searched question to skip the search
+SESSION_REUSE_THRESHOLD = float(os.getenv("SESSION_REUSE_THRESHOLD", "0.85"))
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class Session:
+    """
+    One conversation: its last 'max_turns' turns & the chunks retrieved for it so far, newest first.
+    A follow-up close to the question that was last searched reuses those chunks instead of searching again,
+    any other one searches & its new chunks are put in front of the ones the conversation already had.
+    """
+
+    def __init__(self, max_turns: int = SESSION_HISTORY_TURNS, max_chunks: int = SESSION_MAX_CHUNKS):
+        self.turns = deque(maxlen=max_turns) # (question, shortened answer)
+        self.chunks = OrderedDict() # chunk id -> Document, the most recently retrieved first
+        self.max_chunks = max_chunks
+        self._searched_vector = None
+        self._scope = None # (top_k, shards) of the last search, chunks of other vaults can't be reused
+        self._lock = threading.Lock()
+
+    def can_reuse(self, query_vector: list[float] | None, scope: tuple, threshold: float = SESSION_REUSE_THRESHOLD) -> bool:
+        with self._lock:
+            if not self.chunks or query_vector is None or scope != self._scope:
+                return False
+            return _cosine(query_vector, self._searched_vector) >= threshold
+
+    def remember(self, docs: list, query_vector: list[float] | None, scope: tuple):
+        # The chunks of a new search go in front, the oldest ones fall off the end
+        with self._lock:
+            if scope != self._scope:
+                self.chunks.clear()
+            for doc in reversed(docs):
+                key = doc.id or doc.page_content
+                self.chunks.pop(key, None)
+                self.chunks[key] = doc
+                self.chunks.move_to_end(key, last=False)
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=True)
+            if query_vector is not None:
+                self._searched_vector = query_vector
+            self._scope = scope
+
+    def recall(self) -> list:
+        with self._lock:
+            return list(self.chunks.values())
+
+    def add_turn(self, question: str, answer: str, max_chars: int = SESSION_ANSWER_CHARS):
+        if len(answer) > max_chars:
+            answer = answer[:max_chars].rstrip() + "..."
+        with self._lock:
+            self.turns.append((question, answer))
+
+    def history_text(self) -> str:
+        with self._lock:
+            return "\n".join(f"User: {question}\nAssistant: {answer}" for question, answer in self.turns)
+
+
+class SessionStore:
+    """
+    Sessions by ID, bounded by 'max_entries' (LRU) & expired after 'ttl_seconds' without a turn.
+    An unknown or expired ID simply starts a new, empty session under that ID.
+    """
+
+    def __init__(self, max_entries: int = SESSION_MAX, ttl_seconds: float = SESSION_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict() # session id -> (last used, Session)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Session:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                entry = None
+                self.expired += 1
+            if entry is None:
+                session = Session()
+                self.created += 1
+            else:
+                session = entry[1]
+                self.resumed += 1
+            # Every turn restarts the clock, only idle conversations expire
+            self._sessions[session_id] = (now, session)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            return session
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,116 @@
+# Several vaults (e.g. one per team) served by one deployment, each in its own index ("shard")
+# Configured with 'VAULTS=team-a=/vaults/a,team-b=/vaults/b', without it there's one shard for 'VAULT_PATH'.
+
+import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING: # The server validates shard names at import time, without loading LangChain for it
+    from langchain_core.documents import Document
+
+load_dotenv()
+
+# The single-vault setup, it keeps the exact folders & Pinecone namespace it always had
+DEFAULT_SHARD = "default"
+SHARD_NAME_REGEX = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def configured_vaults() -> dict[str, str]:
+    """Shard name -> vault folder, from 'VAULTS' or else the one 'VAULT_PATH'."""
+    spec = os.getenv("VAULTS", "").strip()
+    if not spec:
+        vault_path = os.getenv("VAULT_PATH")
+        return {DEFAULT_SHARD: vault_path} if vault_path else {}
+    vaults = {}
+    for entry in spec.split(","):
+        name, separator, path = entry.strip().partition("=")
+        if not separator or not SHARD_NAME_REGEX.match(name) or not path:
+            raise ValueError(f"Invalid 'VAULTS' entry '{entry}', expected 'name=/path/to/vault' (name: letters, digits, '-' & '_')")
+        vaults[name] = path
+    return vaults
+
+
+def shard_names() -> list[str]:
+    return list(configured_vaults()) or [DEFAULT_SHARD]
+
+
+def select_shards(requested: list[str] | None) -> list[str]:
+    # The shards one request searches, all of them unless it asks for specific ones
+    available = shard_names()
+    if not requested:
+        return available
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise ValueError(f"Unknown shard(s) {unknown}, available: {available}")
+    return list(dict.fromkeys(requested))
+
+
+def shard_dir(base: str, shard: str) -> str:
+    # Every other shard gets its own sub-folder, so the shards never share a file (or a lock)
+    return base if shard == DEFAULT_SHARD else os.path.join(base, "shards", shard)
+
+
+def shard_file(path: str, shard: str) -> str:
+    # Same idea for single-file indexes, e.g. the Pinecone keyword index
+    return os.path.join(shard_dir(os.path.dirname(path) or ".", shard), os.path.basename(path))
+
+
+def shard_namespace(shard: str) -> str | None:
+    # On Pinecone a shard is a namespace of the one index, the default shard is Pinecone's default namespace
+    return None if shard == DEFAULT_SHARD else shard
+
+
+def merge_by_score(results: "list[list[Document]]", top_k: int) -> "list[Document]":
+    """
+    Best 'top_k' chunks of several shards, by the 'score' each searcher put in the metadata (higher is better).
+    A shard is only scored against the same question with the same model, so the scores are comparable.
+    """
+    docs = [doc for shard_docs in results for doc in shard_docs]
+    docs.sort(key=lambda doc: doc.metadata.get("score", 0.0), reverse=True)
+    return docs[:top_k]
+
+
+async def afan_out(search, shards: list[str], top_k: int) -> "list[Document]":
+    """
+    Runs 'await search(shard)' on every shard at once & merges the results. A single shard is awaited
+    directly, so a one-vault deployment pays nothing for sharding. A failing shard doesn't fail the others.
+    """
+    if len(shards) == 1:
+        return await search(shards[0])
+    results = await asyncio.gather(*(search(shard) for shard in shards), return_exceptions=True)
+    found = []
+    for shard, result in zip(shards, results):
+        if isinstance(result, BaseException):
+            print(f"⚠️ Shard '{shard}' failed: {result}")
+            continue
+        found.append(result)
+    if not found:
+        raise results[0]
+    return merge_by_score(found, top_k)
+
+
+_pool = None
+
+def fan_out(search, shards: list[str], top_k: int) -> "list[Document]":
+    # Blocking twin of 'afan_out' for the CLI, the shards are searched on a small thread pool
+    global _pool
+    if len(shards) == 1:
+        return search(shards[0])
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard")
+    futures = [_pool.submit(search, shard) for shard in shards]
+    found, errors = [], []
+    for shard, future in zip(shards, futures):
+        try:
+            found.append(future.result())
+        except Exception as e:
+            print(f"⚠️ Shard '{shard}' failed: {e}")
+            errors.append(e)
+    if not found:
+        raise errors[0]
+    return merge_by_score(found, top_k)
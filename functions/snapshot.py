@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+from pathlib import Path
+
+# A snapshot is a read-only copy of the indexes, made to be baked into a Docker image: the server maps it at boot
+# instead of opening (& WAL-recovering) the live SQLite files. Same layout as the folders it was made from,
+# so pointing 'LOCAL_INDEX_PATH' / 'PINECONE_LEXICAL_PATH' at it is all the server needs.
+SNAPSHOT_MARKER = "snapshot.json"
+
+
+def is_snapshot(folder: str) -> bool:
+    return os.path.exists(os.path.join(folder, SNAPSHOT_MARKER))
+
+
+def connect_sqlite(path: str, read_only: bool = False) -> sqlite3.Connection:
+    """
+    Opens a SQLite file, read-only ones as 'immutable': no locks, no journal & no writes, which also
+    works from a read-only image layer. Only safe because nothing ever writes a snapshot after it's made.
+    """
+    if not read_only:
+        return sqlite3.connect(path, check_same_thread=False)
+    return sqlite3.connect(Path(path).absolute().as_uri() + "?immutable=1", uri=True, check_same_thread=False)
+
+
+def copy_sqlite(source: str, target: str, drop: str | None = None):
+    """
+    Consistent copy of a live SQLite file (the backup API, safe while ingest writes), compacted into a single
+    file without a '-wal'. 'drop' is an optional statement run on the copy first, e.g. to strip unused columns.
+    """
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        if drop:
+            dst.execute(drop)
+            dst.commit()
+        dst.execute("PRAGMA journal_mode=DELETE")
+        dst.execute("VACUUM")
+    finally:
+        src.close()
+        dst.close()
+
+
+def write_marker(folder: str, info: dict):
+    with open(os.path.join(folder, SNAPSHOT_MARKER), "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), **info}, f)
+
+
+def snapshot_local_index(index, target: str) -> dict:
+    """
+    Copies the current generation of a LocalIndex into 'target': the memory-mapped files as they are,
+    & the chunk texts without their raw vectors (those are only needed to rebuild the matrix, the snapshot never is).
+    """
+    index.flush()
+    header = index._read_header() or {"count": 0}
+    os.makedirs(target, exist_ok=True)
+    for key in ("vectors", "rows", "ivf", "codes", "scales"):
+        if header.get(key):
+            shutil.copy2(os.path.join(index.path, header[key]), os.path.join(target, header[key]))
+    copy_sqlite(os.path.join(index.path, "chunks.sqlite"), os.path.join(target, "chunks.sqlite"), drop="UPDATE chunks SET vector = NULL")
+    with open(os.path.join(target, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    return header
+
+
+def replace_folder(staging: str, output: str):
+    # Swapping the finished snapshot in, a crash halfway never leaves a half-written one at 'output'
+    previous = output + ".old"
+    if os.path.exists(output):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(output, previous)
+    os.replace(staging, output)
+    shutil.rmtree(previous, ignore_errors=True)
@@ -0,0 +1,217 @@
+import os
+import re
+from pathlib import Path
+
+import yaml
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+def discover_notes(vault_path: str):
+    """
+    Lazily walks the vault in a stable (sorted) order, yielding every file path.
+    Nothing is read here, so filtering out attachments & skipped files costs only a 'stat'.
+    """
+    for root, dirs, files in os.walk(vault_path):
+        dirs.sort()
+        for filename in sorted(files):
+            yield os.path.join(root, filename)
+
+
+# Obsidian's note syntax, parsed here rather than through 'ObsidianLoader's private helpers (they change between releases)
+FRONT_MATTER_REGEX = re.compile(r"^---\n(.*?)---\n", re.DOTALL)
+TEMPLATE_VARIABLE_REGEX = re.compile(r"{{(.*?)}}", re.DOTALL)
+TAG_REGEX = re.compile(r"[^\S\/]#([a-zA-Z_]+[-_/\w]*)")
+DATAVIEW_REGEXES = (
+    re.compile(r"^\s*(\w+)::\s*(.*)$", re.MULTILINE), # 'key:: value' on its own line
+    re.compile(r"\[(\w+)::\s*(.*)\]", re.MULTILINE), # [key:: value]
+    re.compile(r"\((\w+)::\s*(.*)\)", re.MULTILINE), # (key:: value)
+)
+
+
+def parse_front_matter(text: str) -> dict:
+    """
+    The YAML front matter of a note as a dict, {} if there's none or it isn't valid YAML.
+    Template placeholders ('{{date}}') are kept as plain text, 'tags: a, b' becomes a list.
+    """
+    match = FRONT_MATTER_REGEX.search(text)
+    if not match:
+        return {}
+    placeholders = {}
+
+    def hide(template):
+        placeholders[f"__template_{len(placeholders)}__"] = template.group(0)
+        return f"__template_{len(placeholders) - 1}__"
+
+    try:
+        front_matter = yaml.safe_load(TEMPLATE_VARIABLE_REGEX.sub(hide, match.group(1)))
+    except yaml.YAMLError:
+        return {}
+    if not isinstance(front_matter, dict):
+        return {}
+
+    def restore(value):
+        if isinstance(value, str):
+            for placeholder, template in placeholders.items():
+                value = value.replace(placeholder, template)
+            return value
+        if isinstance(value, list):
+            return [restore(item) for item in value]
+        if isinstance(value, dict):
+            return {key: restore(item) for key, item in value.items()}
+        return value
+
+    front_matter = restore(front_matter)
+    if isinstance(front_matter.get("tags"), str):
+        front_matter["tags"] = front_matter["tags"].split(", ")
+    return front_matter
+
+
+def load_note(path: str, encoding: str = "utf-8") -> Document:
+    """
+    Loads a single note with the same text & metadata as 'ObsidianLoader.lazy_load()',
+    so that we can re-read only the notes that changed instead of the whole vault.
+    """
+    path = Path(path)
+    with open(path, encoding=encoding) as f:
+        text = f.read()
+
+    front_matter = parse_front_matter(text)
+    tags = set(TAG_REGEX.findall(text))
+    dataview_fields = {key: value for regex in DATAVIEW_REGEXES for key, value in regex.findall(text)}
+    text = FRONT_MATTER_REGEX.sub("", text)
+
+    stat = path.stat()
+    metadata = {
+        "source": str(path.name),
+        "path": str(path),
+        "created": stat.st_ctime,
+        "last_modified": stat.st_mtime,
+        "last_accessed": stat.st_atime,
+        # Vector stores only take plain values, anything else (dates, lists...) is stored as its text
+        **{key: value if type(value) in (str, int, float) else str(value) for key, value in front_matter.items()},
+        **dataview_fields,
+    }
+
+    if tags or front_matter.get("tags"):
+        metadata["tags"] = ",".join(tags | set(front_matter.get("tags", []) or []))
+
+    return Document(page_content=text, metadata=metadata)
+
+
+# Recorded in the manifest next to every note, changing the chunking re-splits (& re-embeds) each note once
+CHUNKING = "markdown-sections-v3"
+# Sections shorter than this are packed together with the one before, instead of becoming tiny chunks
+MIN_SECTION_CHARS = 200
+
+HEADING_REGEX = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+FENCE_REGEX = re.compile(r"^\s*(```|~~~)")
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """
+    Cuts a Markdown note at its headings (not the '#' lines inside code blocks), returns (heading path, text)
+    per section, e.g. ("Setup > Docker", "## Docker\n..."). The text before the first heading has an empty path.
+    """
+    sections, lines, path = [], [], []
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        if FENCE_REGEX.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_REGEX.match(line.rstrip("\r\n"))
+        if match:
+            if "".join(lines).strip():
+                sections.append((" > ".join(title for _, title in path), "".join(lines)))
+            lines = []
+            level = len(match.group(1))
+            path = [(depth, title) for depth, title in path if depth < level] + [(level, match.group(2).strip())]
+        lines.append(line)
+    if "".join(lines).strip():
+        sections.append((" > ".join(title for _, title in path), "".join(lines)))
+    return sections
+
+
+class MarkdownSectionSplitter:
+    """
+    Chunks notes by heading section instead of blindly every 'chunk_size' characters:
+    a section is one chunk, only sections longer than 'chunk_size' are split further by size.
+    An edit therefore only changes the chunks of its own section, every other chunk keeps its exact text
+    (& so its ID & its cached embedding), where a blind split shifted every boundary after the edit.
+    Small sections are packed into the previous chunk while it stays under 'chunk_size'.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, min_section_chars: int = MIN_SECTION_CHARS):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_section_chars = min_section_chars
+        # The size fallback, for sections that don't fit in one chunk
+        self.size_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", " ", ""]
+        )
+
+    def split_text(self, text: str) -> list[tuple[str, int, str]]:
+        # (heading path, index of the chunk within its section, chunk text) in note order
+        groups = []
+        for heading, section in split_sections(text):
+            if groups and len(section) < self.min_section_chars and len(groups[-1][1]) + len(section) <= self.chunk_size:
+                groups[-1] = (groups[-1][0], groups[-1][1] + section)
+            else:
+                groups.append((heading, section))
+
+        chunks = []
+        for heading, section in groups:
+            pieces = [section.strip()] if len(section) <= self.chunk_size else self.split_long_section(heading, section)
+            chunks.extend((heading, index, piece) for index, piece in enumerate(piece for piece in pieces if piece.strip()))
+        return chunks
+
+    def split_long_section(self, heading: str, section: str) -> list[str]:
+        """
+        Splits a section longer than 'chunk_size' by size. Only its body is split & every piece starts with
+        the heading path (e.g. '## Setup > Docker'), so the heading never ends up as a chunk of its own
+        & each piece still says what it is about.
+        """
+        first_line, _, body = section.partition("\n")
+        match = HEADING_REGEX.match(first_line.rstrip("\r")) if heading else None
+        if not match:
+            return self.size_splitter.split_text(section)
+        prefix = f"{match.group(1)} {heading}\n\n"
+        size_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=max(self.chunk_size - len(prefix), self.chunk_size // 2),
+            chunk_overlap=self.chunk_overlap,
+            separators=["\n\n", "\n", " ", ""]
+        )
+        return [prefix + piece.strip() for piece in size_splitter.split_text(body) if piece.strip()]
+
+    def split_documents(self, documents: list[Document]) -> list[Document]:
+        # 'section' & 'section_chunk' are what the chunk IDs are built from (see 'make_chunk_ids')
+        chunks = []
+        for doc in documents:
+            for heading, index, text in self.split_text(doc.page_content):
+                metadata = {**doc.metadata, "section_chunk": index}
+                if heading:
+                    metadata["section"] = heading
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+
+def make_text_splitter() -> MarkdownSectionSplitter:
+    # One place for the chunking settings, so ingest & the Pinecone seeder always agree
+    return MarkdownSectionSplitter(chunk_size=1000, chunk_overlap=200)
+
+
+# Built once per worker process & then reused for every note it parses
+_text_splitter = None
+
+
+def _worker_splitter() -> MarkdownSectionSplitter:
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = make_text_splitter()
+    return _text_splitter
+
+
+def split_note(path: str) -> list[Document]:
+    # Parses the front matter of one Obsidian note & splits it, runs inside the worker processes
+    return _worker_splitter().split_documents([load_note(path)])
@@ -0,0 +1,196 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Obsidian saves every couple of seconds while typing, a burst of saves becomes one re-index after this much quiet
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "2.0"))
+# ...but a note that is edited non-stop still gets re-indexed at least this often
+WATCH_MAX_DELAY = float(os.getenv("WATCH_MAX_DELAY", "30.0"))
+# How often the polling fallback re-scans the vault (it costs one 'stat' per note)
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2.0"))
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len (then 'len' bytes of name)
+
+
+def _is_note(path: str) -> bool:
+    return path.lower().endswith(".md")
+
+
+class InotifyWatcher:
+    """
+    Watches every folder of the vault with Linux inotify (through libc, no extra dependency).
+    The kernel wakes us up only when something changes, so an idle vault costs no CPU at all.
+    'poll()' returns the changed note paths & the folders that appeared or disappeared;
+    the vault root itself means "rescan everything" (the kernel's event queue overflowed).
+    """
+
+    kind = "inotify"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.folders = {} # watch descriptor -> folder
+        try:
+            self._watch_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, top: str):
+        for folder, dirs, _ in os.walk(top):
+            wd = self._add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    continue # Deleted while we were walking
+                # ENOSPC: out of 'fs.inotify.max_user_watches', the caller falls back to polling
+                raise OSError(error, f"inotify_add_watch failed for '{folder}': {os.strerror(error)}")
+            self.folders[wd] = folder
+
+    def poll(self, timeout: float | None = None) -> set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed.add(self.root) # Events were lost, only a full rescan is safe
+                    continue
+                folder = self.folders.get(wd)
+                if folder is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self.folders[wd] # The folder is gone, the kernel dropped its watch
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    changed.add(folder)
+                    continue
+
+                path = os.path.join(folder, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(path):
+                        # A new (or moved in) folder: watching it & re-scanning it, notes may already be inside
+                        self._watch_tree(path)
+                    changed.add(path)
+                elif _is_note(name) and not mask & IN_CREATE:
+                    # Creating a file is always followed by a CLOSE_WRITE, reacting to that one is enough
+                    changed.add(path)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """
+    Fallback for macOS / Windows / network drives: re-scans the vault every 'interval' seconds
+    & compares the (mtime, size) of every note with the previous scan. Nothing is read, only stat'ed.
+    """
+
+    kind = "polling"
+
+    def __init__(self, root: str, interval: float = WATCH_POLL_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for folder, _, files in os.walk(self.root):
+            for filename in files:
+                if _is_note(filename):
+                    path = os.path.join(folder, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self, timeout: float | None = None) -> set[str]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {path for path, signature in snapshot.items() if self.snapshot.get(path) != signature}
+        changed.update(path for path in self.snapshot if path not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(root: str, polling: bool = False):
+    # inotify where the kernel has it, polling everywhere else (or when we ran out of inotify watches)
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"    ⚠️ inotify unavailable ({e}), falling back to polling every {WATCH_POLL_INTERVAL}s")
+    return PollingWatcher(root)
+
+
+def debounced_changes(watcher, debounce: float = WATCH_DEBOUNCE, max_delay: float = WATCH_MAX_DELAY):
+    """
+    Yields sets of changed paths, once the vault has been quiet for 'debounce' seconds
+    (or changes have been piling up for 'max_delay'), so a burst of saves triggers a single re-index.
+    Blocks in the watcher between changes, nothing runs while the vault is idle.
+    """
+    pending, first_at, last_at = set(), 0.0, 0.0
+    while True:
+        timeout = None
+        if pending:
+            now = time.monotonic()
+            deadline = min(last_at + debounce, first_at + max_delay)
+            if now >= deadline:
+                yield pending
+                pending = set()
+                continue
+            timeout = deadline - now
+
+        changes = watcher.poll(timeout)
+        if changes:
+            now = time.monotonic()
+            if not pending:
+                first_at = now
+            pending |= changes
+            last_at = now
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from .rate_limiter import is_rate_limit_error, retry_delay_from_error
+from .metrics import RATE_LIMITED, RETRIES
+
+load_dotenv()
+
+# Pinecone rejects upsert requests over 2MB or 1000 vectors, requests are packed to just under both
+PINECONE_MAX_REQUEST_BYTES = int(os.getenv("PINECONE_MAX_REQUEST_BYTES", str(2 * 1024 * 1024)))
+PINECONE_MAX_REQUEST_VECTORS = 1000
+
+
+class ChromaSink:
+    """
+    Writes chunks whose embeddings were already computed into a LangChain 'Chroma' store.
+    Going straight to the collection avoids Chroma embedding the chunks a second time.
+    """
+
+    def __init__(self, vector_db):
+        self.vector_db = vector_db
+
+    def upsert(self, ids: list[str], docs: list[Document], vectors: list[list[float]]):
+        self.vector_db._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            metadatas=[doc.metadata or None for doc in docs],
+            documents=[doc.page_content for doc in docs],
+        )
+
+    def delete(self, ids: list[str]):
+        if ids:
+            self.vector_db.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.vector_db._collection.count()
+
+    def iter_chunks(self, batch_size: int = 1000):
+        # Every stored chunk as (ids, texts, metadatas) batches, e.g. to backfill the keyword index
+        offset = 0
+        while True:
+            page = self.vector_db.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["documents"], [metadata or {} for metadata in page["metadatas"]]
+            offset += len(page["ids"])
+
+
+def record_size(record) -> int:
+    # Rough size of one record in the JSON request body, a float takes ~20 characters
+    chunk_id, vector, metadata = record
+    return len(chunk_id) + 20 * len(vector) + len(json.dumps(metadata)) + 64
+
+
+def pack_requests(records, max_bytes: int = PINECONE_MAX_REQUEST_BYTES, max_vectors: int = PINECONE_MAX_REQUEST_VECTORS):
+    # Groups records into as few upsert requests as the payload limits allow (10% headroom for the envelope)
+    request, size = [], 0
+    for record in records:
+        record_bytes = record_size(record)
+        if request and (size + record_bytes > max_bytes * 0.9 or len(request) >= max_vectors):
+            yield request
+            request, size = [], 0
+        request.append(record)
+        size += record_bytes
+    if request:
+        yield request
+
+
+class PineconeSink:
+    """
+    Same idea for a 'PineconeVectorStore', the chunk text is stored under the store's text key
+    so that the retriever can rebuild the Documents later.
+    Writes go out as few, payload-sized requests & are retried on 429s / network errors.
+    """
+
+    def __init__(self, vector_store, namespace: str | None = None, max_attempts: int = 5):
+        self.vector_store = vector_store
+        self.namespace = namespace
+        self.max_attempts = max_attempts
+        self.requests = 0
+
+    def records(self, ids: list[str], docs: list[Document], vectors: list[list[float]]) -> list[tuple]:
+        return [
+            (chunk_id, vector, {**doc.metadata, self.vector_store._text_key: doc.page_content})
+            for chunk_id, doc, vector in zip(ids, docs, vectors)
+        ]
+
+    def _call(self, fn, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return fn(**kwargs)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                RETRIES.labels("upsert").inc()
+                delay = min(30, 2 ** attempt)
+                if is_rate_limit_error(e):
+                    RATE_LIMITED.labels("upsert").inc()
+                    delay = retry_delay_from_error(e) or delay
+                print(f"    ⚠️ Pinecone write failed (attempt {attempt}/{self.max_attempts}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def send(self, records: list[tuple]):
+        # One upsert request, safe to call from several threads at once
+        self._call(self.vector_store.index.upsert, vectors=records, namespace=self.namespace)
+        self.requests += 1
+
+    def upsert(self, ids: list[str], docs: list[Document], vectors: list[list[float]]):
+        for request in pack_requests(self.records(ids, docs, vectors)):
+            self.send(request)
+
+    def delete(self, ids: list[str]):
+        # Deletes are capped at 1000 IDs per request too
+        for i in range(0, len(ids), PINECONE_MAX_REQUEST_VECTORS):
+            self._call(self.vector_store.delete, ids=ids[i : i + PINECONE_MAX_REQUEST_VECTORS], namespace=self.namespace)
+
+
+class LocalSink:
+    """
+    Writes into the embedded 'LocalIndex', call 'flush()' at the end so searchers see the new chunks.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, ids: list[str], docs: list[Document], vectors: list[list[float]]):
+        self.index.upsert(ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs], vectors)
+
+    def delete(self, ids: list[str]):
+        self.index.delete(ids)
+
+    def flush(self):
+        self.index.flush()
+
+    def count(self) -> int:
+        return self.index.count()
+
+    def iter_chunks(self, batch_size: int = 1000):
+        return self.index.iter_chunks(batch_size)
+
+
+class LexicalSink:
+    """
+    Keeps the keyword (BM25) index in step with a vector store, it needs no vectors at all.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, ids: list[str], docs: list[Document], vectors: list[list[float]]):
+        self.index.upsert(ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+
+    def delete(self, ids: list[str]):
+        self.index.delete(ids)
+
+    def flush(self):
+        self.index.flush()
+
+
+class FanOutSink:
+    """
+    Sends every write to several sinks, e.g. the vector store & its keyword index.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def upsert(self, ids: list[str], docs: list[Document], vectors: list[list[float]]):
+        for sink in self.sinks:
+            sink.upsert(ids, docs, vectors)
+
+    def delete(self, ids: list[str]):
+        for sink in self.sinks:
+            sink.delete(ids)
+
+    def flush(self):
+        for sink in self.sinks:
+            if hasattr(sink, "flush"):
+                sink.flush()
@@ -1,114 +1,488 @@
 import os
 import sys
+import shutil
+import argparse
 
 import time
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import ObsidianLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from functions.embedding_cache import get_embeddings
+from functions.embedder import embed_concurrently
+from functions.rate_limiter import AdaptiveRateLimiter
+from functions.vector_sinks import ChromaSink, LocalSink, PineconeSink, LexicalSink, FanOutSink
+from functions.lexical_index import LexicalIndex, PINECONE_LEXICAL_PATH
+from functions.link_graph import LinkGraph, LINK_GRAPH_NAME, extract_links
+from functions.shards import DEFAULT_SHARD, configured_vaults, select_shards, shard_dir, shard_file, shard_namespace
+from functions.snapshot import snapshot_local_index, copy_sqlite, write_marker, replace_folder
+from functions.local_index import LocalIndex, LOCAL_INDEX_PATH
+from functions.manifest import Manifest, make_chunk_ids
+from functions.journal import IngestJournal, write_dead_letters, retry_delay, INGEST_RETRY_ROUNDS
+from functions.metrics import span, stage_summary
+from functions.pipeline import bounded, ordered_map
+from functions.vault import discover_notes, split_note, CHUNKING
+from functions.vault_watcher import open_watcher, debounced_changes, WATCH_DEBOUNCE
 
 # Beginning by Loading the .env variables
 load_dotenv()
 
 # Hardcoded Database Path
 DB_PATH = "./chroma_db"
+MANIFEST_PATH = os.path.join(DB_PATH, "ingest_manifest.json")
+# Next to the manifest of each store: the checkpoint of an unfinished run & the chunks that failed every retry
+JOURNAL_NAME = "ingest_journal.jsonl"
+DEAD_LETTER_NAME = "ingest_dead_letters.jsonl"
 SKIP_FILES = None
-BATCH_SIZE = 8
+
+# The same 'VECTOR_BACKEND' the server & CLI read, anything but 'local' keeps writing to Chroma
+# (Pinecone is usually filled by 'seed_pinecone.py', '--backend pinecone' keeps it in step incrementally)
+DEFAULT_BACKEND = "local" if os.getenv("VECTOR_BACKEND") == "local" else "chroma"
 
 
 """
 Creating a Gatekeeper Function, that will essentially not let any non-markdown documents 
 be converted to embeddings. As the embeddings mdel we are using is only for text embeddings
 & the data fed into the AI Studio will be quite a lot & may go over the free-tier limits. 
+It now works on file paths, so attachments & skipped files are dropped before anything is read.
 """
-def gatekeeper(raw_docs, skip_list):
-    valid_docs = []
-    print(f"    Filtering {len(raw_docs)} files... ")
-    
+def gatekeeper(paths, skip_list):
     if skip_list == None:
         skip_list = []
     
-    for doc in raw_docs:
-        source_path = doc.metadata.get("source", "")
-        filename = os.path.basename(source_path)
+    for path in paths:
+        filename = os.path.basename(path)
         
-        if not source_path.lower().endswith(".md"):
+        if not path.lower().endswith(".md"):
             continue
         
         if filename in skip_list:
             print(f"    🚫 Skipping ignored files: {filename}")
             continue
         
-        valid_docs.append(doc)
-    return valid_docs
+        yield path
+
+# Pipeline Stage-1: Comparing each note against the manifest, only letting new/edited ones through
+def check_notes(paths, vault_path, manifest, seen):
+    for abs_path in paths:
+        rel_path = os.path.relpath(abs_path, vault_path)
+        seen.add(rel_path)
+        status, mtime, size, content_hash = manifest.check(rel_path, abs_path)
+        if status != "unchanged":
+            yield status, rel_path, abs_path, mtime, size, content_hash
+
+# Pipeline Stage-2: Parsing & Splitting the changed notes, sharded across 'workers' processes
+# Results come back in the same order the notes went in, whatever the no. of workers
+def parse_notes(notes, workers):
+    only_changed = lambda note: note[2] if note[0] == "changed" else None
+    for note, chunks in ordered_map(split_note, notes, workers, arg=only_changed):
+        status, rel_path, _, mtime, size, content_hash = note
+        yield status, rel_path, mtime, size, content_hash, chunks
+
+# Pipeline Stage-3: Working out which chunks are new, runs on the main thread as the embedder asks for more
+# Chunks an interrupted run already wrote ('done', from the journal) are skipped too
+# The note's wikilinks go into the 'graph' on the way, it's the only stage that sees every chunk of a changed note
+def fresh_chunks(parsed_notes, manifest, sink, pending, stats, done=frozenset(), graph=None):
+    for status, rel_path, mtime, size, content_hash, chunks in parsed_notes:
+        if status == "touched":
+            manifest.touch(rel_path, mtime, size)
+            continue
+        
+        stats["changed"] += 1
+        chunk_ids = make_chunk_ids(rel_path, chunks)
+        if graph is not None:
+            graph.set_note(rel_path, chunk_ids[0] if chunk_ids else None, extract_links([chunk.page_content for chunk in chunks]))
+        
+        # Chunks whose ID didn't change are already in the DB, the rest of the old ones are stale
+        old_ids = set(manifest.chunk_ids(rel_path))
+        new_ids = set(chunk_ids)
+        sink.delete([chunk_id for chunk_id in old_ids if chunk_id not in new_ids])
+        
+        fresh = [(rel_path, chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in old_ids]
+        # Sections the edit didn't touch keep their chunks as they are, nothing to embed for them
+        stats["kept"] += len(chunk_ids) - len(fresh)
+        resumed = sum(1 for _, chunk_id, _ in fresh if chunk_id in done)
+        if resumed:
+            stats["resumed"] += resumed
+            fresh = [item for item in fresh if item[1] not in done]
+        pending[rel_path] = (mtime, size, content_hash, chunk_ids, len(fresh))
+        if not fresh:
+            manifest.record(rel_path, mtime, size, content_hash, chunk_ids)
+        yield from fresh
+
+# Must match the model each searcher embeds questions with
+EMBEDDING_MODELS = {
+    "chroma": "models/gemini-embedding-001",
+    "local": "models/gemini-embedding-001",
+    "pinecone": "models/text-embedding-004",
+}
+
+def open_store(backend: str, embeddings, shard: str = DEFAULT_SHARD):
+    """
+    Opens the vector store 'backend' writes into for one shard (vault),
+    returns (folder for the manifest & keyword index, store, sink).
+    """
+    if backend == "local":
+        db_path = shard_dir(LOCAL_INDEX_PATH, shard)
+        vector_db = LocalIndex(db_path)
+        return db_path, vector_db, LocalSink(vector_db)
+    if backend == "pinecone":
+        # Imported here, Pinecone is only needed when it's actually the target
+        from langchain_pinecone import PineconeVectorStore
+        if not os.getenv("PINECONE_INDEX_NAME"):
+            print("Error: 'PINECONE_INDEX_NAME' is missing from the '.env' file!")
+            sys.exit(1)
+        vector_store = PineconeVectorStore(index_name=os.getenv("PINECONE_INDEX_NAME"), embedding=embeddings)
+        # One index for every vault, each in its own namespace
+        # The manifest sits next to the keyword index the Pinecone searcher reads
+        db_path = os.path.dirname(shard_file(PINECONE_LEXICAL_PATH, shard))
+        return db_path, vector_store, PineconeSink(vector_store, namespace=shard_namespace(shard))
+    # Same for Chroma, it takes ~0.6s to import & the other backends never need it
+    from langchain_chroma import Chroma
+    db_path = shard_dir(DB_PATH, shard)
+    vector_db = Chroma(
+        embedding_function=embeddings,
+        persist_directory=db_path
+    )
+    return db_path, vector_db, ChromaSink(vector_db)
+
+def clear_store(backend: str, vector_db, shard: str = DEFAULT_SHARD):
+    if backend == "local":
+        vector_db.reset()
+    elif backend == "pinecone":
+        # Only this vault's namespace, the other vaults in the index are left alone
+        vector_db.delete(delete_all=True, namespace=shard_namespace(shard))
+    else:
+        vector_db.reset_collection()
+
+def sync_notes(paths, vault_path, manifest, sink, embeddings, workers, journal, removed=None, graph=None) -> dict:
+    """
+    One incremental pass: embeds the new/edited notes among 'paths' & drops the chunks of the 'removed' ones.
+    'removed=None' means 'paths' is the whole vault, so every manifest entry not seen in it was deleted.
+    Every written batch goes into the 'journal' first, so an interrupted pass can be resumed.
+    The wikilink 'graph' (if any) is updated for the same notes & recompiled at the end.
+    Batches that keep failing are retried with backoff at the end & finally dead-lettered.
+    """
+    # Streaming Pipeline: discover -> filter -> check -> parse & split -> embed -> write
+    # Every stage runs at the same time, connected by small bounded queues, so embedding starts
+    # with the very first changed note & memory doesn't grow with the size of the vault.
+    seen = set()
+    pending = {} # rel_path -> (mtime, size, hash, all chunk ids, no. of chunks still to be written)
+    stats = {"changed": 0, "resumed": 0, "kept": 0}
+    paths = bounded(gatekeeper(paths, SKIP_FILES), maxsize=256)
+    changed_notes = bounded(check_notes(paths, vault_path, manifest, seen), maxsize=64)
+    parsed_notes = bounded(parse_notes(changed_notes, workers), maxsize=16)
+    to_embed = fresh_chunks(parsed_notes, manifest, sink, pending, stats, journal.done, graph)
+    
+    # Embedding several batches at once, paced by the adaptive limiter instead of fixed sleeps
+    limiter = AdaptiveRateLimiter()
+    retry_queue = [] # (chunk, error) of the batches that failed, retried once everything else is in
+    written = 0
+    started = time.perf_counter()
+    
+    def write_batches(items):
+        nonlocal written
+        for batch, vectors, error, timings in embed_concurrently(embeddings, items, limiter, text_of=lambda item: item[2].page_content):
+            if error is None:
+                try:
+                    # Chroma upserts by ID, so re-writing a half finished batch is harmless
+                    with span("write") as write:
+                        sink.upsert([chunk_id for _, chunk_id, _ in batch], [chunk for _, _, chunk in batch], vectors)
+                    timings["write"] = write.elapsed
+                except Exception as e:
+                    error = e
+            
+            if error is not None:
+                retry_queue.extend((item, error) for item in batch)
+                print(f"    Error writing a batch of {len(batch)} chunks, queued for a retry: {error}")
+                continue
+            
+            written += len(batch)
+            
+            # Checkpointing the batch, then a note is only recorded in the manifest once every one of its chunks made it in
+            with span("manifest") as saved:
+                journal.record([chunk_id for _, chunk_id, _ in batch])
+                for rel_path, _, _ in batch:
+                    mtime, size, content_hash, chunk_ids, remaining = pending[rel_path]
+                    pending[rel_path] = (mtime, size, content_hash, chunk_ids, remaining - 1)
+                    if remaining - 1 == 0:
+                        manifest.record(rel_path, mtime, size, content_hash, chunk_ids)
+                        del pending[rel_path]
+                manifest.save()
+            timings["manifest"] = saved.elapsed
+            stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+            print(f"    {written} chunks done (batch size {limiter.batch_size}, parallelism {limiter.concurrency}) ⏱️ {stages}.")
+    
+    write_batches(to_embed)
+    
+    # The retry queue: failed chunks get a few more rounds with exponential backoff, a flaky quota usually recovers
+    for attempt in range(1, INGEST_RETRY_ROUNDS + 1):
+        if not retry_queue:
+            break
+        delay = retry_delay(attempt)
+        print(f"    🔁 Retrying {len(retry_queue)} failed chunks in {delay:.0f}s (round {attempt}/{INGEST_RETRY_ROUNDS})...")
+        time.sleep(delay)
+        items = [item for item, _ in retry_queue]
+        retry_queue.clear()
+        write_batches(items)
+    
+    # Whatever is still failing goes into the dead-letter file, its notes stay out of the manifest & are retried next run
+    dead_letters = [
+        {"path": rel_path, "chunk_id": chunk_id, "error": str(error)}
+        for (rel_path, chunk_id, _), error in retry_queue
+    ]
+    failed_notes = {entry["path"] for entry in dead_letters}
+    
+    # After a full scan every note has been seen, so whatever the manifest has left over was deleted from the vault
+    full_scan = removed is None
+    removed = manifest.removed(seen) if full_scan else [rel_path for rel_path in removed if rel_path not in seen]
+    for rel_path in removed:
+        sink.delete(manifest.chunk_ids(rel_path))
+        manifest.forget(rel_path)
+        if graph is not None:
+            graph.remove_note(rel_path)
+        print(f"    🗑️ Removed: {rel_path}")
+    manifest.save()
+    
+    # A '--watch' pass only sees a few notes, the failures of the other ones stay listed until they go through
+    write_dead_letters(
+        os.path.join(os.path.dirname(manifest.path) or ".", DEAD_LETTER_NAME),
+        dead_letters,
+        settled=None if full_scan else seen | set(removed),
+    )
+    
+    # The local index only rebuilds its memory-mapped matrix once, after all the writes
+    with span("flush"):
+        sink.flush()
+        if graph is not None:
+            graph.flush()
+    # Everything written is now in the manifest (or dead-lettered), the checkpoint isn't needed anymore
+    journal.clear()
+    
+    return {
+        "seen": len(seen),
+        "changed": stats["changed"],
+        "resumed": stats["resumed"],
+        "kept": stats["kept"],
+        "removed": len(removed),
+        "written": written,
+        "failed": len(failed_notes),
+        "dead_letters": len(dead_letters),
+        "rate_limited": limiter.rate_limited,
+        "elapsed": time.perf_counter() - started,
+    }
+
+def affected_notes(changed: set[str], vault_path: str, manifest):
+    """
+    Turns the paths a watcher reported into (note paths to check, manifest entries to drop).
+    Returns (None, None) when the whole vault has to be rescanned.
+    """
+    vault_path = os.path.abspath(vault_path)
+    if vault_path in changed:
+        return None, None
+    paths, removed = set(), set()
+    for path in changed:
+        if os.path.isdir(path):
+            paths.update(discover_notes(path))
+        elif os.path.exists(path):
+            paths.add(path)
+        # A deleted note, or every note of a deleted / moved away folder
+        rel_path = os.path.relpath(path, vault_path)
+        for known in manifest.files:
+            if (known == rel_path or known.startswith(rel_path + os.sep)) and not os.path.exists(os.path.join(vault_path, known)):
+                removed.add(known)
+    return sorted(paths), sorted(removed)
+
+def watch(vault_path, manifest, sink, embeddings, journal, polling: bool, graph=None):
+    # Long-running mode: re-embeds only the notes that changed, a few seconds after they were saved
+    watcher = open_watcher(vault_path, polling=polling)
+    print(f"👀 Watching {vault_path} for changes ({watcher.kind}, {WATCH_DEBOUNCE}s debounce), Ctrl+C to stop...")
+    try:
+        for changed in debounced_changes(watcher):
+            paths, removed = affected_notes(changed, vault_path, manifest)
+            if paths is None:
+                print("    🔁 Too many changes at once, rescanning the whole vault...")
+                paths = discover_notes(vault_path)
+            if not paths and not removed:
+                continue
+            # Only a handful of notes per pass, starting worker processes would take longer than parsing them
+            result = sync_notes(paths, vault_path, manifest, sink, embeddings, workers=1, journal=journal, removed=removed, graph=graph)
+            print(
+                f"🔄 {time.strftime('%H:%M:%S')} {result['changed']} notes re-embedded, {result['removed']} removed "
+                f"({result['written']} chunks in {result['elapsed']:.1f}s)"
+            )
+            if result["dead_letters"]:
+                print(f"    ⚠️ {result['dead_letters']} chunks failed every retry, see '{DEAD_LETTER_NAME}'")
+    except KeyboardInterrupt:
+        print("👋 Stopped watching.")
+    finally:
+        watcher.close()
+
+def export_snapshot(backend: str, output: str, shards: list[str]):
+    """
+    Writes a read-only copy of every shard's indexes to 'output', laid out like the folders they came from,
+    for the server to map at boot (e.g. baked into the Docker image) instead of opening the live files:
+    point 'LOCAL_INDEX_PATH' at it, or 'PINECONE_LEXICAL_PATH' at '<output>/lexical.sqlite' for Pinecone.
+    """
+    staging = output.rstrip("/\\") + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    for shard in shards:
+        target = shard_dir(staging, shard)
+        info = {"backend": backend, "shard": shard}
+        if backend == "local":
+            source = shard_dir(LOCAL_INDEX_PATH, shard)
+            index = LocalIndex(source)
+            info["chunks"] = snapshot_local_index(index, target)["count"]
+            index.close()
+            lexical_path = os.path.join(source, "lexical.sqlite")
+        else:
+            # The vectors stay in Pinecone, only the keyword index is local
+            os.makedirs(target, exist_ok=True)
+            lexical_path = shard_file(PINECONE_LEXICAL_PATH, shard)
+        if os.path.exists(lexical_path):
+            copy_sqlite(lexical_path, os.path.join(target, "lexical.sqlite"))
+        # Only the compiled link arrays, the per-note JSON is for ingest
+        links_path = os.path.join(os.path.dirname(lexical_path), LINK_GRAPH_NAME + ".npz")
+        if os.path.exists(links_path):
+            shutil.copy2(links_path, os.path.join(target, LINK_GRAPH_NAME + ".npz"))
+        write_marker(target, info)
+    replace_folder(staging, output)
+
+def ingest_vault(args, shard: str, vault_path: str, embeddings):
+    """
+    Brings one shard's store up to date with its vault, returns what '--watch' needs to keep it that way.
+    """
+    print(f"Loading the Obsidian Notes from: {vault_path}" + (f" (shard '{shard}')" if shard != DEFAULT_SHARD else ""))
+    db_path, vector_db, sink = open_store(args.backend, embeddings, shard)
+    # Each store keeps its own manifest, they can be filled independently
+    manifest_path = os.path.join(db_path, os.path.basename(MANIFEST_PATH))
+    journal = IngestJournal(os.path.join(db_path, JOURNAL_NAME))
+    
+    # The keyword (BM25) index for hybrid search lives next to the vectors & gets the exact same writes
+    lexical = LexicalIndex(shard_file(PINECONE_LEXICAL_PATH, shard) if args.backend == "pinecone" else os.path.join(db_path, "lexical.sqlite"))
+    # & so does the wikilink graph, the searchers expand their hits with it ('LINK_EXPANSION')
+    graph = LinkGraph(os.path.join(os.path.dirname(lexical.path) or ".", LINK_GRAPH_NAME))
+    
+    # The manifest remembers what we embedded last time, so we only pay for what changed
+    if args.rebuild:
+        print("♻️ Rebuilding from scratch, clearing the existing collection...")
+        clear_store(args.backend, vector_db, shard)
+        lexical.reset()
+        graph.reset()
+        journal.clear()
+        manifest = Manifest(manifest_path, chunking=CHUNKING)
+    else:
+        manifest = Manifest.load(manifest_path, chunking=CHUNKING)
+        if journal.resuming:
+            print(f"⏯️ Resuming an interrupted run, {len(journal.done)} chunks were already written...")
+        # Pinecone can't hand the chunk texts back, its keyword index is only ever built alongside the uploads
+        if (manifest.files or journal.resuming) and hasattr(sink, "iter_chunks") and len(lexical) != sink.count():
+            # Stores embedded before the keyword index existed (or a run that crashed between two of its flushes),
+            # re-indexing what the vector store already holds, no API calls needed
+            print("    🔤 Building the keyword index from the existing chunks...")
+            lexical.reset()
+            for ids, texts, metadatas in sink.iter_chunks():
+                lexical.upsert(ids, texts, metadatas)
+            lexical.flush()
+        if manifest.files and not len(graph):
+            # Stores from before the link graph existed, reading the links of the notes already indexed (no API calls)
+            print("    🔗 Building the link graph from the indexed notes...")
+            for rel_path in manifest.files:
+                try:
+                    with open(os.path.join(vault_path, rel_path), encoding="utf-8", errors="ignore") as f:
+                        links = extract_links([f.read()])
+                except OSError:
+                    continue # Deleted meanwhile, this run drops it anyway
+                chunk_ids = manifest.chunk_ids(rel_path)
+                graph.set_note(rel_path, chunk_ids[0] if chunk_ids else None, links)
+            graph.flush()
+    store_sink = sink
+    sink = FanOutSink(sink, LexicalSink(lexical))
+    
+    try:
+        result = sync_notes(discover_notes(vault_path), vault_path, manifest, sink, embeddings, args.workers, journal, graph=graph)
+    except KeyboardInterrupt:
+        # Everything written so far is in the journal & the manifest, the next run carries on from there
+        print("⏸️ Interrupted, run it again to resume where it stopped.")
+        sys.exit(130)
+    
+    if not result["seen"]:
+        print("WARNING!! No .md files found in the given Vault Path")
+    print(f"    Found {result['seen']} notes: {result['changed']} new/changed, {result['removed']} removed")
+    if result["kept"]:
+        print(f"    ✂️ {result['kept']} chunks of unchanged sections kept, only the edited sections are re-embedded")
+    
+    if result["written"]:
+        elapsed = result["elapsed"]
+        print(f"⚡ Throughput: {result['written'] / elapsed if elapsed else 0:.1f} chunks/sec ({result['written']} chunks in {elapsed:.1f}s, {result['rate_limited']} rate limits hit)")
+    
+    if result["resumed"]:
+        print(f"⏯️ {result['resumed']} chunks were written by the interrupted run & skipped.")
+    if result["failed"]:
+        print(f"⚠️ {result['failed']} notes failed ({result['dead_letters']} chunks, listed in '{os.path.join(db_path, DEAD_LETTER_NAME)}') & will be retried on the next run.")
+    
+    # What is actually searchable now, straight from the manifest (& the store itself where it can count)
+    indexed_chunks = sum(len(entry["chunk_ids"]) for entry in manifest.files.values())
+    in_store = f", {store_sink.count()} in the vector store" if hasattr(store_sink, "count") else ""
+    print(f"📚 Indexed: {len(manifest.files)}/{result['seen']} notes, {indexed_chunks} chunks{in_store}")
+    print(f"Successfully Knowledge Base Build at path: {db_path}")
+    return manifest, sink, journal, graph
 
 def main():
+    parser = argparse.ArgumentParser(description="Embeds the Obsidian Vault into a vector store, only re-embedding what changed.")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest & re-embed the entire vault")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes used for parsing & splitting notes")
+    parser.add_argument("--backend", choices=["chroma", "local", "pinecone"], default=DEFAULT_BACKEND, help="Vector store to write into")
+    parser.add_argument("--shard", help="Only this vault of 'VAULTS' (all of them by default)")
+    parser.add_argument("--watch", action="store_true", help="Keep running & re-embed notes as soon as they are saved")
+    parser.add_argument("--poll", action="store_true", help="With --watch: poll the vault instead of using inotify")
+    parser.add_argument("--snapshot", metavar="DIR", help="Afterwards, write a read-only snapshot of the indexes to DIR for the server to map at boot")
+    args = parser.parse_args()
+    if args.snapshot and args.backend == "chroma":
+        print("Error: --snapshot works with --backend local or pinecone")
+        sys.exit(1)
+    
     # Safety Checking the API Key
     if not os.getenv("GOOGLE_API_KEY"):
         print("Error: GOOGLE_API_KEY not found in .env file")
         sys.exit(1)
     
-    # Getting Obsidian Vault Path
-    VAULT_PATH = os.getenv("VAULT_PATH")
-    if not VAULT_PATH:
+    # Getting the Obsidian Vault Path(s), 'VAULTS' for several vaults or the one 'VAULT_PATH'
+    try:
+        vaults = configured_vaults()
+        shards = select_shards([args.shard] if args.shard else None)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not vaults:
         print("Error: Obsidian Vault Location is not given!")
         sys.exit(1)
-    
-    # Safety Checking the Vault Path
-    if not os.path.exists(VAULT_PATH):
-        print(f"Error: Vault Path Not Found: {VAULT_PATH}")
+    if args.watch and len(shards) > 1:
+        print("Error: --watch follows one vault, pick it with --shard")
         sys.exit(1)
-        
-    print(f"Loading the Obsidian Notes from: {VAULT_PATH}")
-    
-    # Loading the Notes! Also the 'ObsidianLoader' Automatically handles the metadata
-    loader = ObsidianLoader(VAULT_PATH)
-    raw_docs = loader.load()
-    # Safety Stopping the Program 
-    if not raw_docs:
-        print("WARNING!! No .md files found in the given Vault Path")
-        return
     
-    documents = gatekeeper(raw_docs, SKIP_FILES)
+    # Safety Checking the Vault Path(s) before embedding anything
+    for shard in shards:
+        if not os.path.exists(vaults[shard]):
+            print(f"Error: Vault Path Not Found: {vaults[shard]}")
+            sys.exit(1)
     
-    # Splitting the Notes!(f"    Splitting ({len()})")
-    print(f"    Found {len(documents)} notes")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    chunks = text_splitter.split_documents(documents)
-    
-    # Creating Embeddings & Saving them as Vectors to ChromaDB
-    print("🧠 Building the Vector Database... ")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
-    # Now Embeddings are Created!
+    # Creating Embeddings, shared by every vault
+    # Wrapped with the on-disk cache, so chunks embedded before (by any script) are free
+    embeddings = get_embeddings(EMBEDDING_MODELS[args.backend])
+    for shard in shards:
+        manifest, sink, journal, graph = ingest_vault(args, shard, vaults[shard], embeddings)
     
-    # Changed to serve the embeddings at a consistent rate & avoid crossing over rate-limits
-    vector_db = Chroma(
-        embedding_function=embeddings,
-        persist_directory=DB_PATH
-    )
-    # Now VectorDB is Created!
+    # The embedding threads overlap, so the stage totals can add up to more than the wall-clock time
+    totals = ", ".join(f"{stage} {seconds:.1f}s" for stage, (_, seconds) in stage_summary().items())
+    if totals:
+        print(f"⏱️ Time per stage: {totals}")
+    embeddings.print_stats()
     
-    print(f"Successfully Saved {len(chunks)} chunks to '{DB_PATH}'.")
+    if args.snapshot:
+        export_snapshot(args.backend, args.snapshot, shards)
+        print(f"📸 Snapshot written to: {args.snapshot}")
     
-    total = len(chunks)
-    for i in range(0, total, BATCH_SIZE):
-        batch = chunks[i : i + BATCH_SIZE]
-        try:
-            vector_db.add_documents(batch)
-            print(f"    Batch{i / (BATCH_SIZE + 1)} ({len(batch)} chunks) done.")
-            time.sleep(1.5) # To prevent Rate Limit Errors line Error-429
-        except Exception as e:
-            print(f"    Error on batch size starting at index: {i}: {e}")
-            print(f"    Waiting 20 seconds to cooldown...")
-            time.sleep(20)
-
-    print(f"Successfully Knowledge Base Build at path: {DB_PATH}")
+    if args.watch:
+        watch(vaults[shards[0]], manifest, sink, embeddings, journal, args.poll, graph)
     
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,20 +1,22 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-# New Imports
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
-#Importing a specific exception from Google
-from google.api_core.exceptions import ResourceExhausted
-
-# New function addition
-from functions import search_notes
+load_dotenv()
 
+# New function addition, the vector store is picked by 'VECTOR_BACKEND' (chroma / local / pinecone)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 
-load_dotenv()
+def load_search_notes():
+    # Only the selected backend is imported, the others' libraries (Chroma alone ~0.6s) never load
+    if VECTOR_BACKEND == "local":
+        from functions.local_searcher import search_notes
+    elif VECTOR_BACKEND == "pinecone":
+        from functions.pinecone_searcher import search_notes
+    else:
+        from functions import search_notes
+    return search_notes
 
 def main():
     # Checking the API Key
@@ -22,6 +24,17 @@ def main():
         print("Error: GOOGLE_API_KEY not found in .env")
         return
     
+    # The searcher loads in the background while the model is set up & the first question is typed
+    loading = ThreadPoolExecutor(max_workers=1).submit(load_search_notes)
+    
+    # New Imports, here instead of the top so the searcher's imports overlap with them
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    
+    #Importing a specific exception from Google
+    from google.api_core.exceptions import ResourceExhausted
+    
     # Setting up the model, best suitable for speed!
     llm = ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
@@ -63,7 +76,8 @@ Instructions:
             
             print("🔍 Searching in yout notes...")
 
-            # Step-1: Gather the relevant notes from the Vault
+            # Step-1: Gather the relevant notes from the Vault (only waits if the searcher is still loading)
+            search_notes = loading.result()
             retrieved_context = search_notes(user_query)
 
             # Step-2: Generating the Answer
@@ -1,82 +1,244 @@
 import os
 import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Importing the Environment Variables
 from dotenv import load_dotenv
 
 # Importing the Langchain Modules
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-# Importing the Pinecone Module
-from pinecone import Pinecone
+# Importing the shared Embedding Cache & Rate Limiting helpers
+from functions.embedding_cache import get_embeddings
+from functions.embedder import embed_concurrently
+from functions.rate_limiter import AdaptiveRateLimiter
+from functions.vector_sinks import PineconeSink, pack_requests
+from functions.lexical_index import LexicalIndex, PINECONE_LEXICAL_PATH
+from functions.link_graph import LinkGraph, LINK_GRAPH_NAME, extract_links
+from functions.manifest import Manifest, make_chunk_ids
+from functions.pipeline import bounded, ordered_map
+from functions.shards import configured_vaults, select_shards, shard_file, shard_namespace
+from functions.vault import discover_notes, split_note, CHUNKING
 
 # Loading the Environment Variables
 load_dotenv()
 
-GOOGLE_API_KEY= os.getenv("GOOGLE_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
-VAULT_PATH = os.getenv("VAULT_PATH")
-
-
-# Quickly check for all the possible Environment Variables errors
-if not PINECONE_API_KEY:
-    raise ValueError("Error: 'PINECONE_API_KEY' is missing from the '.env' file!")
-elif not GOOGLE_API_KEY:
-    raise ValueError("Error: 'GOOGLE_API_KEY' is missing from the '.env' file!")
-elif not PINECONE_INDEX_NAME:
-    raise ValueError("Error: 'PINECONE_INDEX_NAME' is missing from the '.env' file!")
-elif not VAULT_PATH:
-    raise ValueError("Error: 'VAULT_PATH' is missing from the '.env' file!")
-
-print("💉 Beginning the Brain Transplant to Pinecone.")
-
-# Initializing the embeddings exactly to the dimensions value '768'
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-
-# Loading the notes from the disk
-print(f"📁 Loading notes from: {VAULT_PATH}")
-loader = DirectoryLoader(
-    VAULT_PATH,
-    glob="**/*.md",
-    loader_cls=TextLoader,
-    show_progress=True
-)
-docs = loader.load()
-print(f"Loaded {len(docs)} documents.")
-
-# Splitting the text into Chunks
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-)
-splits = text_splitter.split_documents(docs)
-print(f"Splitting text into {len(splits)} chunks.")
-
-# Connecting to Pinecone
-print("Connecting to Pinecone...")
-vector_store = PineconeVectorStore(
-    index_name=PINECONE_INDEX_NAME,
-    embedding=embeddings,
-)
-
-# Defining the Upload Batch Sizes
-batch_size = 10
-total_batches = len(splits) // batch_size + 1
-
-print(f"Uploading in batches of {batch_size} to avoid rate limits...")
-
-# Uploading in slow batches
-for i in range(0, len(splits), batch_size):
-    # Getting each batch according to the 'batch_size'
-    batch = splits[i: i + batch_size]
-    if batch:
-        print(f"Uploading batch {i} to {i + len(batch)}...")
-        vector_store.add_documents(batch)
-        time.sleep(5) # Sleep for 5 seconds to let the Google API Cooldown
-
-
-print("🎉 Successfully uploaded Brain to Cloud.")
\ No newline at end of file
+# Upsert requests sent to Pinecone at the same time, while the next batches are being embedded
+PINECONE_UPLOAD_CONCURRENCY = int(os.getenv("PINECONE_UPLOAD_CONCURRENCY", "4"))
+# Shared with 'ingest.py --backend pinecone', both know which chunk IDs are in the index (one per vault)
+MANIFEST_PATH = os.path.join(os.path.dirname(PINECONE_LEXICAL_PATH) or ".", "ingest_manifest.json")
+
+
+def changed_notes(vault_path: str, manifest: Manifest, notes: dict, seen: set, everything: bool = False):
+    # Only the new/edited notes go on to be split, like 'ingest.check_notes' (or all of them with 'everything')
+    for path in discover_notes(vault_path):
+        if not path.lower().endswith(".md"):
+            continue
+        rel_path = os.path.relpath(path, vault_path)
+        seen.add(rel_path)
+        status, mtime, size, content_hash = manifest.check(rel_path, path)
+        if status == "changed" or everything:
+            yield path, (rel_path, mtime, size, content_hash)
+        elif status == "touched":
+            # Same content, only its stat info is recorded again, nothing to upload
+            notes[rel_path] = (mtime, size, content_hash, manifest.chunk_ids(rel_path), 0)
+
+
+def split_vault(vault_path: str, manifest: Manifest, notes: dict, workers: int, graph: LinkGraph | None = None, seen: set | None = None, everything: bool = False):
+    """
+    Yields (rel_path, chunk_id, chunk) for every chunk that isn't in Pinecone yet, with IDs that only depend on
+    the note, the chunk's section, its position in it & its text. Re-seeding the same vault overwrites instead of duplicating.
+    Notes are parsed exactly like 'ingest.py' does (front matter & all), the two share the index & the manifest.
+    Unchanged notes (per the manifest) are skipped, so are the unchanged sections of edited ones, unless 'everything'.
+    'notes' collects (mtime, size, hash, chunk ids, no. of chunks still to be uploaded) per changed note,
+    'seen' every note of the vault, & the wikilinks of the changed notes go into 'graph'.
+    """
+    seen = set() if seen is None else seen
+    items = changed_notes(vault_path, manifest, notes, seen, everything)
+    for (path, (rel_path, mtime, size, content_hash)), chunks in ordered_map(split_note, items, workers, arg=lambda item: item[0]):
+        chunk_ids = make_chunk_ids(rel_path, chunks)
+        old_ids = set() if everything else set(manifest.chunk_ids(rel_path))
+        fresh = [(chunk_id, chunk) for chunk_id, chunk in zip(chunk_ids, chunks) if chunk_id not in old_ids]
+        notes[rel_path] = (mtime, size, content_hash, chunk_ids, len(fresh))
+        if graph is not None:
+            graph.set_note(rel_path, chunk_ids[0] if chunk_ids else None, extract_links([chunk.page_content for chunk in chunks]))
+        for chunk_id, chunk in fresh:
+            yield rel_path, chunk_id, chunk
+
+
+def seed(vault_path: str, vector_store, embeddings, lexical: LexicalIndex, manifest: Manifest, workers: int = 1, concurrency: int = PINECONE_UPLOAD_CONCURRENCY, namespace: str | None = None, graph: LinkGraph | None = None, everything: bool = False) -> dict:
+    """
+    Embeds the new/edited notes of the vault (all of them with 'everything') & uploads them to 'vector_store',
+    then deletes the chunks that are no longer in the vault, from Pinecone & the keyword index alike.
+    The keyword index is never emptied: searches keep the previous version of a note until its new one is uploaded,
+    & a note that failed keeps its old chunks in both (it isn't recorded, so the next run retries it).
+    Three stages overlap: notes are split in worker processes, embedded several batches at a time,
+    & the vectors go out as payload-sized upsert requests on 'concurrency' threads, so neither the
+    embedding API nor the network sits idle waiting for the other. Each vault goes into its own 'namespace'.
+    """
+    sink = PineconeSink(vector_store, namespace=namespace)
+    limiter = AdaptiveRateLimiter()
+    notes = {}
+    seen = set()
+    failed_notes = set()
+    buffered, buffered_notes = [], [] # Records waiting for a full request & the note of each
+    uploads = {} # future -> (records, notes)
+    stats = {"chunks": 0, "uploaded": 0, "failed": 0, "stale_deleted": 0}
+
+    def finish(done):
+        for future in done:
+            records, record_notes = uploads.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                failed_notes.update(record_notes)
+                stats["failed"] += len(records)
+                print(f"Error uploading {len(records)} chunks: {e}")
+                continue
+            # The keyword index only gets chunks that really made it into Pinecone
+            lexical.upsert(
+                [chunk_id for chunk_id, _, _ in records],
+                [metadata[vector_store._text_key] for _, _, metadata in records],
+                [{key: value for key, value in metadata.items() if key != vector_store._text_key} for _, _, metadata in records],
+            )
+            for rel_path in record_notes:
+                mtime, size, content_hash, chunk_ids, remaining = notes[rel_path]
+                notes[rel_path] = (mtime, size, content_hash, chunk_ids, remaining - 1)
+            stats["uploaded"] += len(records)
+            print(f"Uploaded {stats['uploaded']} chunks ({sink.requests} requests)...")
+
+    def submit(pool, records, record_notes):
+        # Back-pressure: at most two requests queued per upload thread, the embedder waits otherwise
+        while len(uploads) >= concurrency * 2:
+            done, _ = wait(uploads, return_when=FIRST_COMPLETED)
+            finish(done)
+        uploads[pool.submit(sink.send, records)] = (records, record_notes)
+
+    items = bounded(split_vault(vault_path, manifest, notes, workers, graph, seen, everything), maxsize=1024)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch, vectors, error, _ in embed_concurrently(embeddings, items, limiter, text_of=lambda item: item[2].page_content):
+            stats["chunks"] += len(batch)
+            if error is not None:
+                failed_notes.update(rel_path for rel_path, _, _ in batch)
+                stats["failed"] += len(batch)
+                print(f"Error embedding a batch of {len(batch)} chunks: {error}")
+                continue
+            buffered.extend(sink.records([chunk_id for _, chunk_id, _ in batch], [chunk for _, _, chunk in batch], vectors))
+            buffered_notes.extend(rel_path for rel_path, _, _ in batch)
+            # Sending only full requests while embedding is still going, the rest waits for more vectors
+            requests = list(pack_requests(buffered))
+            for request in requests[:-1]:
+                submit(pool, request, buffered_notes[: len(request)])
+                del buffered_notes[: len(request)]
+            buffered = requests[-1] if requests else []
+        if buffered:
+            submit(pool, buffered, buffered_notes)
+        while uploads:
+            done, _ = wait(uploads, return_when=FIRST_COMPLETED)
+            finish(done)
+
+    # Notes that were fully uploaded replace their previous version, deleted notes go away entirely
+    stale = []
+    removed = manifest.removed(seen)
+    for rel_path in removed:
+        stale.extend(manifest.chunk_ids(rel_path))
+        manifest.forget(rel_path)
+        if graph is not None:
+            graph.remove_note(rel_path)
+    for rel_path, (mtime, size, content_hash, chunk_ids, remaining) in notes.items():
+        if remaining or rel_path in failed_notes:
+            continue
+        current = set(chunk_ids)
+        stale.extend(chunk_id for chunk_id in manifest.chunk_ids(rel_path) if chunk_id not in current)
+        manifest.record(rel_path, mtime, size, content_hash, chunk_ids)
+    sink.delete(stale)
+    lexical.delete(stale)
+    lexical.flush()
+    if graph is not None:
+        graph.flush()
+    manifest.save()
+
+    stats.update(seen=len(seen), notes=len(notes), removed=len(removed), stale_deleted=len(stale), requests=sink.requests, rate_limited=limiter.rate_limited)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embeds the Obsidian Vault & uploads it to Pinecone.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes used for parsing & splitting notes")
+    parser.add_argument("--concurrency", type=int, default=PINECONE_UPLOAD_CONCURRENCY, help="Upsert requests in flight at once")
+    parser.add_argument("--rebuild", action="store_true", help="Empty the index first (e.g. to drop vectors uploaded with random IDs by older versions)")
+    parser.add_argument("--shard", help="Only this vault of 'VAULTS' (all of them by default)")
+    args = parser.parse_args()
+
+    GOOGLE_API_KEY= os.getenv("GOOGLE_API_KEY")
+    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+    PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+    vaults = configured_vaults()
+
+    # Quickly check for all the possible Environment Variables errors
+    if not PINECONE_API_KEY:
+        raise ValueError("Error: 'PINECONE_API_KEY' is missing from the '.env' file!")
+    elif not GOOGLE_API_KEY:
+        raise ValueError("Error: 'GOOGLE_API_KEY' is missing from the '.env' file!")
+    elif not PINECONE_INDEX_NAME:
+        raise ValueError("Error: 'PINECONE_INDEX_NAME' is missing from the '.env' file!")
+    elif not vaults:
+        raise ValueError("Error: 'VAULT_PATH' is missing from the '.env' file!")
+    shards = select_shards([args.shard] if args.shard else None)
+
+    print("💉 Beginning the Brain Transplant to Pinecone.")
+
+    # Initializing the embeddings exactly to the dimensions value '768'
+    # Wrapped with the on-disk cache, so re-seeding doesn't pay for chunks embedded before
+    embeddings = get_embeddings("models/text-embedding-004")
+
+    # Connecting to Pinecone
+    print("Connecting to Pinecone...")
+    vector_store = PineconeVectorStore(
+        index_name=PINECONE_INDEX_NAME,
+        embedding=embeddings,
+    )
+
+    for shard in shards:
+        # Every vault has its own namespace, keyword index & manifest, re-seeding one leaves the others alone
+        namespace = shard_namespace(shard)
+        lexical_path = shard_file(PINECONE_LEXICAL_PATH, shard)
+        manifest_path = shard_file(MANIFEST_PATH, shard)
+
+        # The keyword index for hybrid search gets the same chunks & IDs, updated note by note like the vectors
+        lexical = LexicalIndex(lexical_path)
+        # Same for the wikilink graph next to it
+        graph = LinkGraph(os.path.join(os.path.dirname(lexical_path) or ".", LINK_GRAPH_NAME))
+        everything = False
+        if args.rebuild:
+            print("♻️ Emptying the Pinecone index first...")
+            vector_store.delete(delete_all=True, namespace=namespace)
+            lexical.reset()
+            graph.reset()
+            manifest = Manifest(manifest_path, chunking=CHUNKING)
+        else:
+            manifest = Manifest.load(manifest_path, chunking=CHUNKING)
+            indexed_chunks = sum(len(entry["chunk_ids"]) for entry in manifest.files.values())
+            # Pinecone can't hand the chunk texts back, a keyword index (or link graph) out of step with the manifest,
+            # e.g. from before either existed, is only filled again by uploading every note once more
+            if manifest.files and (len(lexical) != indexed_chunks or not len(graph)):
+                print("    🔤 The keyword index / link graph is out of step with Pinecone, re-uploading every note to fill it...")
+                everything = True
+
+        print(f"📁 Loading notes from: {vaults[shard]}" + (f" into namespace '{namespace}'" if namespace else "") + f" ({args.workers} workers, {args.concurrency} upload threads)")
+        started = time.perf_counter()
+        stats = seed(vaults[shard], vector_store, embeddings, lexical, manifest, args.workers, args.concurrency, namespace, graph, everything)
+        elapsed = time.perf_counter() - started
+
+        print(f"Found {stats['seen']} notes: {stats['notes']} to update ({stats['chunks']} chunks embedded), {stats['removed']} removed.")
+        print(f"⚡ Throughput: {stats['uploaded'] / elapsed if elapsed else 0:.1f} chunks/sec ({stats['requests']} upsert requests, {stats['rate_limited']} rate limits hit, {stats['failed']} chunks failed)")
+        if stats["stale_deleted"]:
+            print(f"🗑️ Deleted {stats['stale_deleted']} stale chunks.")
+
+    embeddings.print_stats()
+    print("🎉 Successfully uploaded Brain to Cloud.")
+
+
+if __name__=="__main__":
+    main()
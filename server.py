@@ -1,32 +1,112 @@
 import os
+import json
 import time
-import uvicorn
+import asyncio
+from contextlib import asynccontextmanager, aclosing
 from dotenv import load_dotenv
 
 # Importing the FastAPI & Google's  Modules
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Response
 from fastapi.security.api_key import APIKeyHeader
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from google.api_core.exceptions import ResourceExhausted
-
-# Importing the Langchain Modules
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
-# Importing Locally Written Search Functions
-# from functions.obsidian_searcher import search_notes # Offline-Chroma-db
-from functions.pinecone_searcher import search_notes # Online-Pinecode
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, Field, field_validator
 
 # Loading the Environment Variables
 load_dotenv()
 
+# The vector store is picked by 'VECTOR_BACKEND' (pinecone / local / chroma)
+# LangChain, the Google client & the backend's own library take seconds to import, they are loaded by
+# 'warm_up' after the server is already up, so a restarted container answers '/' right away
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+from functions.answer_cache import SemanticAnswerCache, fingerprint_chunks
+from functions.sessions import SessionStore
+from functions.rate_limiter import is_rate_limit_error
+from functions.shards import select_shards
+from functions.metrics import REGISTRY, STAGE_SECONDS, REQUEST_SECONDS, RETRIES, RATE_LIMITED, ERRORS, CACHE_LOOKUPS, span, flatten_stats
+
+# Max. no. of calls to Google / Pinecone in flight at once, the rest of the requests wait their turn
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+upstream_slots = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+# '/chat/batch': max. questions per call & how many of them generate at once (still within 'upstream_slots')
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(UPSTREAM_CONCURRENCY)))
+
+# '/chat/stream' buffers the answer between the model & the client, a slow client never holds an upstream slot:
+# up to this many pieces wait for the client, one that leaves a full buffer unread this long has its answer cancelled
+STREAM_BUFFER_PIECES = int(os.getenv("STREAM_BUFFER_PIECES", "1024"))
+STREAM_SEND_TIMEOUT = float(os.getenv("STREAM_SEND_TIMEOUT", "30"))
+
+# Set by 'load_models', everything slow to import lives behind it
+searcher = None # The searcher module of 'VECTOR_BACKEND'
+llm = None # Benchmarks may swap in a fake before the first request, it's only built if still empty
+prompt_template = None
+output_parser = None
+build_context = None
+_warm_up_task = None
+
+def load_models():
+    """Imports the selected searcher (& only that one) and builds the LLM chain."""
+    global searcher, llm, prompt_template, output_parser, build_context
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+    from functions.context_builder import build_context
+    if VECTOR_BACKEND == "local":
+        from functions import local_searcher as searcher # Embedded-Index
+    elif VECTOR_BACKEND == "chroma":
+        from functions import obsidian_searcher as searcher # Offline-Chroma-db
+    else:
+        from functions import pinecone_searcher as searcher # Online-Pinecode
+    if llm is None:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        # Setting the model up
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash", # Again 2.5-flash for speed
+            temperature=0.3,
+        )
+    prompt_template = ChatPromptTemplate.from_template(system_prompt)
+    output_parser = StrOutputParser()
+
+async def warm_up():
+    started = time.perf_counter()
+    # The imports run on a thread, the event loop keeps answering '/' & '/ready' meanwhile
+    await asyncio.to_thread(load_models)
+    try:
+        # Opens the vector store's async session & maps the local indexes
+        await searcher.aopen()
+    except Exception as e:
+        # Not fatal, the store is opened lazily on the first question instead
+        print(f"⚠️ Could not connect to the Vector Store at startup: {e}")
+    STAGE_SECONDS.labels("warm_up").observe(time.perf_counter() - started)
+    print(f"🔥 Warmed up in {time.perf_counter() - started:.2f}s")
+
+def start_warm_up() -> asyncio.Task:
+    global _warm_up_task
+    if _warm_up_task is None:
+        _warm_up_task = asyncio.create_task(warm_up())
+    return _warm_up_task
+
+async def ready():
+    # Every answer needs the searcher & the LLM, requests arriving during the warm-up wait for it
+    # (it's started here too, for when the app runs without its lifespan, e.g. in the benchmarks)
+    await asyncio.shield(start_warm_up())
+
+# Warming up in the background at startup & closing the vector store's async session on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warm_up()
+    yield
+    if searcher is not None:
+        await searcher.aclose()
+
 # Configuring the App
 app = FastAPI(
     title="Obsidian RAG API",
     description="A Second Brain API that answers your questions based on your Local Obsidian Notes.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Security Configuration
@@ -46,6 +126,19 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
             detail="Access Denied! You need a valid API Key to Access the Second Brain.\n"
         )
 
+# '/metrics' also takes the key as 'Authorization: Bearer <key>' (what Prometheus' 'authorization' setting sends),
+# or no key at all with 'METRICS_PUBLIC=true' (e.g. when only an internal network can reach the port)
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+metrics_bearer = HTTPBearer(auto_error=False)
+
+async def get_metrics_key(
+    api_key_header: str = Security(api_key_header),
+    bearer: HTTPAuthorizationCredentials | None = Security(metrics_bearer),
+):
+    if METRICS_PUBLIC:
+        return None
+    return await get_api_key(api_key_header if api_key_header is not None else (bearer.credentials if bearer else None))
+
 # Enabling CORS for future front-end to talk with AI
 app.add_middleware(
     CORSMiddleware,
@@ -59,22 +152,28 @@ app.add_middleware(
 # & what kind of output should be Returned
 class QueryRequest(BaseModel):
     question: str
-    top_k: int = 4 # No. of notes to refer for the answer, default is 4, can be increased
+    top_k: int = Field(default=4, ge=1, le=50) # No. of chunks to retrieve, default is 4, can be increased (packed into the token budget)
+    shards: list[str] | None = None # Vaults to search (names from 'VAULTS'), all of them by default
+    session_id: str | None = Field(default=None, min_length=1, max_length=128) # Follow-ups of one conversation share it
+
+    @field_validator("shards")
+    @classmethod
+    def known_shards(cls, shards):
+        # A typo'd vault name is a 422, instead of quietly answering from nothing
+        return select_shards(shards) if shards else None
 
 class AIResponse(BaseModel):
     answer: str
     context_used: str # For debugging purposes, will show sources
+    session_id: str | None = None
+
+class BatchRequest(BaseModel):
+    questions: list[QueryRequest] = Field(min_length=1, max_length=BATCH_MAX_QUESTIONS)
 
 # Step-2: Setting up the Brain of the Resources, only need to initialize once
 if not os.getenv("GOOGLE_API_KEY"):
     raise ValueError("GOOGLE_API_KEY Not Found! Please check your '.env' file!")
 
-# Setting the model up
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", # Again 2.5-flash for speed
-    temperature=0.3,
-)
-
 # Hypnotizing AI for best performance 👁️👄👁️ -> 😵‍💫 -> ⚡😎⚡
 system_prompt="""
 You are an intelligent "Second Brain" AI Assistant Agent.
@@ -82,7 +181,7 @@ You have access to the user's personal notes.
 
 Here is the context retrieved from the notes.
 {context}
-
+{history}
 Question: {question}
 
 Instructions:
@@ -91,67 +190,430 @@ Instructions:
 - Cite the source (filename) if available in the context.
 """
 
-prompt_template = ChatPromptTemplate.from_template(system_prompt)
+# Answers to recent questions, reused when a near-identical question retrieves the exact same chunks
+answer_cache = SemanticAnswerCache()
+# Changing the model or the prompt must not serve answers generated by the old ones
+ANSWER_NAMESPACE = f"gemini-2.5-flash\x00{system_prompt}"
+
+# Conversations by 'session_id': their last turns & the chunks already retrieved for them
+sessions = SessionStore()
+
+# The '/stats' counters are only read when '/metrics' is scraped, nothing is added to the requests
+REGISTRY.collectors.append(lambda: flatten_stats("obsrag", {**cache_stats(), "answers": answer_cache.stats(), "sessions": sessions.stats()}))
+
+def cache_stats() -> dict:
+    return searcher.cache_stats() if searcher is not None else {}
+
+async def aembed_query(question: str) -> list[float]:
+    return await searcher.aembed_query(question)
+
+async def aretrieve(question: str, **kwargs):
+    return await searcher.aretrieve(question, **kwargs)
 
 
 @app.get("/")
 async def health_check():
-    """A simple heartbeat endpoint to check if the server is running."""
-    return {"status": "online", "model": "gemini-2.5-flash"}
+    """A simple heartbeat endpoint to check if the server is running, answers even while warming up."""
+    warmed_up = _warm_up_task is not None and _warm_up_task.done() and _warm_up_task.exception() is None
+    return {"status": "online", "ready": warmed_up, "model": "gemini-2.5-flash", "vector_backend": VECTOR_BACKEND}
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Readiness probe for the load balancer: 503 until the warm-up is done, so no question waits on it."""
+    task = start_warm_up()
+    if not task.done():
+        response.status_code = 503
+        return {"status": "warming up"}
+    if task.exception() is not None:
+        response.status_code = 503
+        return {"status": "failed", "detail": str(task.exception())}
+    return {"status": "ready"}
+
+@app.get("/stats")
+async def stats_endpoint(api_key: str = Depends(get_api_key)):
+    """Hit/miss counters of the caches, to see how many embedding & LLM calls they save."""
+    return {**cache_stats(), "answers": answer_cache.stats(), "sessions": sessions.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(api_key: str = Depends(get_metrics_key)):
+    """
+    Prometheus metrics: per-stage latency histograms (embedding, search, time-to-first-token...),
+    retries, rate limits & cache hits. Scrapers send the key as a bearer token (or the 'X-API-Key' header).
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.delete("/chat/session/{session_id}")
+async def end_session(session_id: str, api_key: str = Depends(get_api_key)):
+    """Forgets a conversation (e.g. the UI's 'new chat'), its next question starts from scratch."""
+    return {"session_id": session_id, "dropped": sessions.drop(session_id)}
+
+async def gather_context(question: str, top_k: int = 4, shards: list[str] | None = None, query_vector: list[float] | None = None, session=None):
+    """
+    Embeds the question & retrieves the matching chunks, shared by '/chat', '/chat/stream' & '/chat/batch'.
+    Returns (query_vector, docs, context_text, fingerprint), a failed search gives an empty context.
+    A 'query_vector' that was already embedded (e.g. with the rest of a batch) skips the embedding.
+    In a 'session', a follow-up close to the previous question reuses its chunks without searching,
+    otherwise the new chunks come first & the conversation's earlier ones fill the rest of the budget.
+    """
+    await ready()
+    scope = (top_k, tuple(shards or ()))
+    # Every upstream call is awaited, so one slow / rate-limited request never blocks the others
+    try:
+        async with upstream_slots:
+            if query_vector is None:
+                with span("embed_query"):
+                    query_vector = await aembed_query(question)
+            if session is not None and session.can_reuse(query_vector, scope):
+                CACHE_LOOKUPS.labels("session_chunks", "hit").inc()
+                docs = session.recall()
+            else:
+                if session is not None:
+                    CACHE_LOOKUPS.labels("session_chunks", "miss").inc()
+                with span("vector_search"):
+                    docs = await aretrieve(question, top_k=top_k, query_vector=query_vector, shards=shards)
+                if session is not None:
+                    session.remember(docs, query_vector, scope)
+                    docs = session.recall()
+    except Exception as e:
+        # Same as before, a failed search still lets the AI answer (it will say it doesn't know)
+        ERRORS.labels("vector_search").inc()
+        if is_rate_limit_error(e):
+            RATE_LIMITED.labels("embed_query").inc()
+        print(f"Vector Store Error ({VECTOR_BACKEND}): {e}")
+        query_vector, docs = None, []
+    # Overlapping chunks of a note are merged & near-duplicates dropped, within the token budget
+    with span("format_context"):
+        passages = build_context(docs)
+        context_text = searcher.format_context(passages)
+    retrieved_chars = sum(len(doc.page_content) for doc in docs)
+    print(f"Retrieved Context Length: {len(context_text)} chars ({len(docs)} chunks -> {len(passages)} passages, {retrieved_chars} chars retrieved).")
+
+    # The fingerprint changes as soon as any of these chunks is re-ingested, invalidating old answers
+    fingerprint = fingerprint_chunks([doc.id or "" for doc in docs], ANSWER_NAMESPACE)
+    return query_vector, docs, context_text, fingerprint
+
+def lookup_answer(query_vector, fingerprint: str) -> str | None:
+    cached_answer = answer_cache.lookup(query_vector, fingerprint) if query_vector else None
+    CACHE_LOOKUPS.labels("answers", "miss" if cached_answer is None else "hit").inc()
+    return cached_answer
+
+def format_history(session) -> str:
+    # The conversation's last turns for the prompt, nothing outside a session (or on its first question)
+    history = session.history_text() if session is not None else ""
+    return f"\nConversation so far:\n{history}\n" if history else ""
+
+async def stream_answer(context_text: str, question: str, history: str = ""):
+    """
+    The answer piece by piece from the LLM, timing the time-to-first-token & the whole generation.
+    Used by both endpoints, so '/chat' reports its time-to-first-token too.
+    """
+    prompt_chain = prompt_template | llm | output_parser
+    started = time.perf_counter()
+    first_piece = True
+    with span("llm_generate"):
+        async for piece in prompt_chain.astream({
+            "context": context_text,
+            "question": question,
+            "history": history,
+        }):
+            if first_piece:
+                STAGE_SECONDS.labels("llm_first_token").observe(time.perf_counter() - started)
+                first_piece = False
+            yield piece
+
+_END_OF_ANSWER = object()
+
+async def buffered_answer(context_text: str, question: str, history: str = ""):
+    """
+    'stream_answer' holding an upstream slot only while the model generates: the pieces go through a bounded
+    queue, so the slot is released as soon as the model is done, however long the client takes to read the rest.
+    An error of the model is raised here, after the pieces that came before it.
+    """
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER_PIECES)
+
+    async def produce():
+        outcome = _END_OF_ANSWER
+        try:
+            async with upstream_slots, aclosing(stream_answer(context_text, question, history)) as pieces:
+                async for piece in pieces:
+                    try:
+                        async with asyncio.timeout(STREAM_SEND_TIMEOUT):
+                            await queue.put(piece)
+                    except TimeoutError:
+                        # The client stopped reading, closing the model's stream frees the slot for someone else
+                        ERRORS.labels("stream_send_timeout").inc()
+                        outcome = RuntimeError("The client stopped reading, the answer was cancelled.")
+                        break
+        except Exception as e:
+            outcome = e
+        # Outside the slot, waiting here for a slow client costs nothing upstream
+        await queue.put(outcome)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await queue.get()) is not _END_OF_ANSWER:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The client went away, the rest of the answer isn't generated
+        producer.cancel()
+
+async def generate_answer(context_text: str, question: str, history: str = "") -> str:
+    # The whole answer, with Auto-Retry for Rate Limits, a 429 HTTPException once the retries are used up
+    max_retries = 3
+    
+    for attempt in range(max_retries):
+        try:
+            # Collected from the stream, the client still gets one JSON but we get the time-to-first-token
+            # (nothing is sent while the slot is held, '/chat' & '/chat/batch' only write out the finished answer)
+            async with upstream_slots:
+                return "".join([piece async for piece in stream_answer(context_text, question, history)])
+        
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            if attempt == max_retries - 1:
+                RATE_LIMITED.labels("llm").inc()
+                raise HTTPException(status_code=429, detail="AI Overlaod! Please Try Again in a minute.")
+            await back_off(attempt)
+    return ""
+
+async def back_off(attempt: int):
+    # Counted & timed, so the time lost to the quota shows up next to the real work
+    RATE_LIMITED.labels("llm").inc()
+    RETRIES.labels("llm").inc()
+    wait_time = 2 * (attempt + 1) # Short Exponential Backoff
+    print(f"⚠️Quota Hit! Retrying in {wait_time}s...")
+    # 'asyncio.sleep' only pauses this request, 'time.sleep' used to freeze the whole server
+    with span("retry_backoff"):
+        await asyncio.sleep(wait_time)
 
 @app.post("/chat", response_model=AIResponse)
 async def chat_endpoint(
     request: QueryRequest,
+    response: Response,
     api_key: str= Depends(get_api_key)
 ):
     """
     MAIN RAG Endpoint.
     1. Receives the input question / prompt.
     2. Searches the embedded VectorDB.
-    3. Generates Answer with Auto-Retry for Rate Limits.
+    3. Serves a cached answer if a near-identical question saw the same chunks.
+    4. Otherwise Generates Answer with Auto-Retry for Rate Limits.
+    The 'X-Answer-Cache' response header says whether the answer came from the cache.
+    Questions sent with the same 'session_id' are one conversation: the last turns go into the prompt
+    & a follow-up builds on the chunks already retrieved for it instead of starting from scratch.
     """
+    with REQUEST_SECONDS.labels("/chat").time():
+        return await answer_question(request, response)
+
+async def answer_question(request: QueryRequest, response: Response) -> AIResponse:
     try:
         # A. Logging the request Serverside!
         print(f"Request Received: {request.question}")
         
         # B. Retrieving relevant information based on the Context provided
-        context_text = search_notes(request.question)
-        print(f"Retrieved Context Length: {len(context_text)} chars.")
+        session = sessions.get(request.session_id) if request.session_id else None
+        history = format_history(session)
+        query_vector, docs, context_text, fingerprint = await gather_context(request.question, request.top_k, request.shards, session=session)
         
-        # C. Generating the Answer
-        prompt_chain = prompt_template | llm | StrOutputParser()
-        
-        response_text = ""
-        max_retries = 3
+        # A follow-up's answer depends on the conversation, only questions without one share cached answers
+        cached_answer = lookup_answer(query_vector, fingerprint) if not history else None
+        if cached_answer is not None:
+            response.headers["X-Answer-Cache"] = "hit"
+            if session is not None:
+                session.add_turn(request.question, cached_answer)
+            return AIResponse(
+                answer=cached_answer,
+                context_used=context_text[:500] + "...",
+                session_id=request.session_id,
+            )
+        response.headers["X-Answer-Cache"] = "miss"
         
-        for attempt in range(max_retries):
-            try:
-                # '.invoke()' is used instead of '.stream()' for standard HTTP requests
-                response_text = prompt_chain.invoke({
-                    "context": context_text,
-                    "question": request.question
-                })
-                break # Breaking out of the retry loop upon Success!
-            
-            except ResourceExhausted:
-                wait_time = 2 * (attempt + 1) # Short Exponential Backoff
-                print(f"⚠️Quota Hit! Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-                if attempt == max_retries - 1:
-                    raise HTTPException(status_code=429, detail="AI Overlaod! Please Try Again in a minute.")
+        # C. Generating the Answer
+        response_text = await generate_answer(context_text, request.question, history)
             
+        # Only caching real answers, never an empty one from a failed generation
+        if response_text and query_vector and not history:
+            answer_cache.store(query_vector, fingerprint, request.question, response_text)
+        if response_text and session is not None:
+            session.add_turn(request.question, response_text)
+        
         # D. Returning a structured JSON
         return AIResponse(
             answer=response_text,
-            context_used=context_text[:500] + "..." # Sending back a limited snippet, for debugging
+            context_used=context_text[:500] + "...", # Sending back a limited snippet, for debugging
+            session_id=request.session_id,
         )
     
+    except HTTPException:
+        raise # Already a proper HTTP error (like the 429 above), passing it through untouched
     except Exception as e:
+        ERRORS.labels("chat").inc()
         print(f"❌Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(
+    request: BatchRequest,
+    api_key: str= Depends(get_api_key)
+):
+    """
+    Many questions in one call, for jobs that used to send them to '/chat' one at a time.
+    1. Identical questions (same text, 'top_k' & shards) are only answered once.
+    2. All the questions are embedded together, in as few embedding calls as the batcher allows.
+    3. The searches run concurrently, the answers are generated 'BATCH_CONCURRENCY' at a time.
+    Answers come back as NDJSON, one line per question as soon as it's done (not in order):
+    {"index", "question", "answer", "context_used", "cache"} or {"index", "question", "error", "status"}.
+    Every question is answered on its own, a 'session_id' is ignored here.
+    """
+    print(f"Batch Request Received: {len(request.questions)} questions")
+
+    async def lines():
+        with REQUEST_SECONDS.labels("/chat/batch").time():
+            async for line in answer_batch(request.questions):
+                yield line
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def embed_questions(questions: list[str]) -> list[list[float] | None]:
+    # Sent together, so the query batcher packs them into shared embedding calls, a failed one is None
+    # (that question is then embedded again on its own by 'gather_context')
+    async with upstream_slots:
+        with span("embed_query"):
+            vectors = await asyncio.gather(*(aembed_query(question) for question in questions), return_exceptions=True)
+    failed = [vector for vector in vectors if isinstance(vector, Exception)]
+    if failed:
+        ERRORS.labels("embed_query").inc(len(failed))
+        print(f"⚠️ {len(failed)} of {len(questions)} batch embeddings failed: {failed[0]}")
+    return [None if isinstance(vector, Exception) else vector for vector in vectors]
+
+async def answer_batch(questions: list[QueryRequest]):
+    # The NDJSON lines of '/chat/batch', in the order the answers finish
+    await ready()
+    unique = {}
+    for index, question in enumerate(questions):
+        key = (question.question, question.top_k, tuple(question.shards or ()))
+        unique.setdefault(key, []).append(index)
+    requests = [questions[indexes[0]] for indexes in unique.values()]
+    vectors = await embed_questions([request.question for request in requests])
+    generating = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer_one(request: QueryRequest, query_vector):
+        try:
+            query_vector, docs, context_text, fingerprint = await gather_context(request.question, request.top_k, request.shards, query_vector)
+            result = {"context_used": context_text[:500] + "...", "cache": "hit"}
+            answer = lookup_answer(query_vector, fingerprint)
+            if answer is None:
+                result["cache"] = "miss"
+                async with generating:
+                    answer = await generate_answer(context_text, request.question)
+                if answer and query_vector:
+                    answer_cache.store(query_vector, fingerprint, request.question, answer)
+            return {"answer": answer, **result}
+        except HTTPException as e:
+            return {"error": e.detail, "status": e.status_code}
+        except Exception as e:
+            # One failed question doesn't fail the rest of the batch
+            ERRORS.labels("chat").inc()
+            print(f"❌Error: {e}")
+            return {"error": str(e), "status": 500}
+
+    async def answer_indexed(indexes: list[int], request: QueryRequest, query_vector):
+        return indexes, request, await answer_one(request, query_vector)
+
+    tasks = [asyncio.ensure_future(answer_indexed(indexes, request, vector)) for indexes, request, vector in zip(unique.values(), requests, vectors)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            indexes, request, result = await finished
+            for index in indexes:
+                yield json.dumps({"index": index, "question": request.question, **result}) + "\n"
+    finally:
+        # The client went away, the answers nobody will read aren't generated
+        for task in tasks:
+            task.cancel()
+
+def sse_event(event: str, data: dict) -> str:
+    # One Server-Sent Event, the payload is JSON so newlines inside tokens can't break the framing
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: QueryRequest,
+    api_key: str= Depends(get_api_key)
+):
+    """
+    Streaming version of '/chat', answers as Server-Sent Events:
+    1. 'sources' -> the notes the answer is based on, sent as soon as retrieval is done.
+    2. 'token'   -> pieces of the answer, as the model generates them.
+    3. 'done'    -> end of the answer (or 'error' if generation failed).
+    The user sees the first words after the time-to-first-token instead of the whole answer.
+    """
+    print(f"Stream Request Received: {request.question}")
+
+    async def events():
+        with REQUEST_SECONDS.labels("/chat/stream").time():
+            async for event in answer_events(request):
+                yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stops proxies (like nginx) from buffering the stream into one big response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def answer_events(request: QueryRequest):
+    # The events of '/chat/stream', in the order its docstring lists them
+    session = sessions.get(request.session_id) if request.session_id else None
+    history = format_history(session)
+    query_vector, docs, context_text, fingerprint = await gather_context(request.question, request.top_k, request.shards, session=session)
+    sources = list(dict.fromkeys(doc.metadata.get("source", "Unknown") for doc in docs))
+    yield sse_event("sources", {"sources": sources, "context_used": context_text[:500] + "...", "session_id": request.session_id})
+
+    # A cached answer is sent in one go, there's nothing to wait for
+    cached_answer = lookup_answer(query_vector, fingerprint) if not history else None
+    if cached_answer is not None:
+        if session is not None:
+            session.add_turn(request.question, cached_answer)
+        yield sse_event("token", {"text": cached_answer})
+        yield sse_event("done", {"cache": "hit"})
+        return
+
+    pieces = []
+    max_retries = 3
+
+    for attempt in range(max_retries):
+        try:
+            # The upstream slot is only held while the model generates, not while the client reads
+            async for piece in buffered_answer(context_text, request.question, history):
+                pieces.append(piece)
+                yield sse_event("token", {"text": piece})
+            break
+
+        except Exception as e:
+            # Retrying is only safe while nothing was sent, otherwise the user would see the answer twice
+            if not is_rate_limit_error(e) or pieces or attempt == max_retries - 1:
+                print(f"❌Error: {e}")
+                if is_rate_limit_error(e):
+                    RATE_LIMITED.labels("llm").inc()
+                ERRORS.labels("llm_generate").inc()
+                detail = "AI Overlaod! Please Try Again in a minute." if is_rate_limit_error(e) else str(e)
+                yield sse_event("error", {"detail": detail})
+                return
+            await back_off(attempt)
+
+    response_text = "".join(pieces)
+    if response_text and query_vector and not history:
+        answer_cache.store(query_vector, fingerprint, request.question, response_text)
+    if response_text and session is not None:
+        session.add_turn(request.question, response_text)
+    yield sse_event("done", {"cache": "miss"})
     
 # Step-4: The Entry Point into the Program
 if __name__=="__main__":
     # With this we run the 'python server.py' directly
+    import uvicorn
     print("🚀Starting the Second Brain API...")
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
@@ -1,10 +1,16 @@
 import reflex as rx
 import httpx
 import os
+import json
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv("../.env")
 
+API_URL = "http://localhost:8080"
+# The server keeps the conversation (see 'session_id'), the browser only needs the messages on screen
+UI_HISTORY_WINDOW = int(os.getenv("UI_HISTORY_WINDOW", "50"))
+
 # The State: The Brain of the Fontend, runs on the server & stores data 
 class State(rx.State):
     chat_history: list[tuple[str, str]] = [
@@ -18,6 +24,26 @@ class State(rx.State):
     
     question: str = ""
     is_thinking: bool = False
+    session_id: str = "" # One per conversation, the server remembers its turns & retrieved notes
+    
+    def trim_history(self):
+        # Only the last messages stay in the State, older ones are dropped instead of piling up forever
+        if len(self.chat_history) > UI_HISTORY_WINDOW:
+            self.chat_history = self.chat_history[-UI_HISTORY_WINDOW:]
+    
+    async def new_chat(self):
+        # Forgetting the conversation on the server too, the next question starts from scratch
+        if self.session_id:
+            try:
+                async with httpx.AsyncClient() as client:
+                    await client.delete(
+                        f"{API_URL}/chat/session/{self.session_id}",
+                        headers={"X-API-Key": str(os.getenv("SERVER_PASSWORD")) or ""},
+                    )
+            except Exception:
+                pass # It expires on its own anyway
+        self.session_id = ""
+        self.chat_history = [("ai", "Hello user, let me assist you with your notes.")]
     
     def set_question(self, value: str):
         self.question = value
@@ -38,7 +64,10 @@ class State(rx.State):
         
         # Adding the user_query to the Chat History
         user_query = self.question
+        if not self.session_id:
+            self.session_id = uuid.uuid4().hex
         self.chat_history.append(("user", self.question))
+        self.trim_history()
         self.question = "" # For clearing the input box
         self.is_thinking = True # We turn on the spinner
         
@@ -47,24 +76,53 @@ class State(rx.State):
         # Its done so we see our message getting passed in the UI before the AI replies
         
         try:
+            # Streaming the answer, the bubble fills up token by token instead of after the whole answer
             async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "http://localhost:8080/chat",
-                    json={"question": user_query},
+                async with client.stream(
+                    "POST",
+                    f"{API_URL}/chat/stream",
+                    json={"question": user_query, "session_id": self.session_id},
                     headers={"X-API-Key": str(os.getenv("SERVER_PASSWORD")) or ""},
-                    timeout=30.0 # We give the AI time to think
-                )
-                
-                if response.status_code == 200:
-                    ai_text = response.json()["answer"]
-                    self.chat_history.append(("ai", ai_text))
-                else:
-                    self.chat_history.append(("ai", f"Error: {response.status_code}: {response.text}"))
+                    # No overall limit anymore, only the gap between two tokens is bounded
+                    timeout=httpx.Timeout(30.0, read=60.0)
+                ) as response:
+                    
+                    if response.status_code != 200:
+                        await response.aread()
+                        self.chat_history.append(("ai", f"Error: {response.status_code}: {response.text}"))
+                    else:
+                        answer, sources = "", []
+                        event = ""
+                        async for line in response.aiter_lines():
+                            # Server-Sent Events: an 'event:' line followed by its 'data:' line
+                            if line.startswith("event:"):
+                                event = line[len("event:"):].strip()
+                                continue
+                            if not line.startswith("data:"):
+                                continue
+                            data = json.loads(line[len("data:"):])
+                            
+                            if event == "sources":
+                                sources = data["sources"]
+                            elif event == "token":
+                                if not answer:
+                                    # First token, swapping the spinner for the (growing) answer bubble
+                                    self.is_thinking = False
+                                    self.chat_history.append(("ai", ""))
+                                answer += data["text"]
+                                self.chat_history[-1] = ("ai", answer)
+                                yield # Pushing the partial answer to the browser
+                            elif event == "error":
+                                self.chat_history.append(("ai", f"Error: {data['detail']}"))
+                        
+                        if answer and sources:
+                            self.chat_history[-1] = ("ai", answer + "\n\n*Sources: " + ", ".join(sources) + "*")
         
         except Exception as e:
             self.chat_history.append(("ai", f"Connection Failed: {str(e)}"))
         
         self.is_thinking = False
+        self.trim_history()
         # Scrolling down again after the Answer arrives
 
 
@@ -126,6 +184,8 @@ def index() -> rx.Component:
             rx.hstack(
                 rx.heading("Obsidian RAG", size="5", color="white"),
                 rx.badge("Online", color_scheme="green"),
+                rx.spacer(),
+                rx.button("New chat", on_click=State.new_chat, size="1", variant="soft", cursor="pointer"),
                 width="100%",
                 padding="1em",
                 border_bottom="1px solid #333",